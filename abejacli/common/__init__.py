@@ -1,10 +1,8 @@
 import json
 import os
 import sys
-import tarfile
 import tempfile
 import zipfile
-from pathlib import Path
 from typing import Optional
 
 import click
@@ -13,21 +11,85 @@ from click.exceptions import MissingParameter
 from pygments import formatters, highlight, lexers
 from pygments.styles import get_style_by_name
 
-from abejacli.config import ORGANIZATION_ENDPOINT
+from abejacli.common.archive import write_source_archive
+from abejacli.config import JSON_HIGHLIGHT_MAX_SIZE, ORGANIZATION_ENDPOINT
 from abejacli.exceptions import ConfigFileNotFoundError
 from abejacli.session import api_get
 from abejacli.training import TrainingConfig
 
+OUTPUT_FORMATS = ['json', 'jsonl', 'table', 'compact']
+# key of the output format selected by the global `--output` option in `ctx.obj`
+OUTPUT_FORMAT_KEY = 'output_format'
 
-def json_output_formatter(parsed_json):
+
+def get_output_format() -> Optional[str]:
+    """
+    return the output format selected by the global `--output` option of the current command.
+    `None` means to highlight json only when it is written to a terminal.
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or not isinstance(ctx.obj, dict):
+        return None
+    return ctx.obj.get(OUTPUT_FORMAT_KEY)
+
+
+def _dumps(obj, indent=False) -> str:
+    if indent:
+        return json.dumps(obj, sort_keys=True, ensure_ascii=False, indent=4)
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def _format_table(parsed_json) -> str:
+    def _cell(value):
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list)):
+            return _dumps(value)
+        return str(value)
+
+    if isinstance(parsed_json, dict):
+        rows = [['KEY', 'VALUE']]
+        rows += [[str(k), _cell(v)] for k, v in sorted(parsed_json.items())]
+    elif isinstance(parsed_json, list) and all(isinstance(x, dict) for x in parsed_json):
+        columns = []
+        for x in parsed_json:
+            columns += [k for k in x.keys() if k not in columns]
+        rows = [[c.upper() for c in columns]]
+        rows += [[_cell(x.get(c)) for c in columns] for x in parsed_json]
+    else:
+        return _dumps(parsed_json)
+
+    widths = [max(map(len, col)) for col in zip(*rows)]
+    return '\n'.join('  '.join(val.ljust(width) for val, width in zip(row, widths)).rstrip()
+                     for row in rows)
+
+
+def json_output_formatter(parsed_json, output_format: Optional[str] = None):
     """
     Applies syntax highlighting to output
+    Highlighting is applied only if stdout is a terminal and the output is not too large,
+    otherwise plain json is returned.
     :params parsed_json: (dict) JSON response requests response.json()
+    :params output_format: (str) one of ``OUTPUT_FORMATS``. defaults to global `--output` option.
     :returns: (str) syntax highlighted text
     """
+    output_format = output_format or get_output_format()
+    if output_format == 'compact':
+        return _dumps(parsed_json)
+    if output_format == 'jsonl':
+        if isinstance(parsed_json, list):
+            return '\n'.join(_dumps(x) for x in parsed_json)
+        return _dumps(parsed_json)
+    if output_format == 'table':
+        return _format_table(parsed_json)
+
+    if output_format == 'json' or not sys.stdout.isatty():
+        return _dumps(parsed_json, indent=True)
     formatted_json = json.dumps(
         parsed_json, sort_keys=True,
         ensure_ascii=False, indent=4)
+    if len(formatted_json) > JSON_HIGHLIGHT_MAX_SIZE:
+        return formatted_json
     output_style = get_style_by_name('emacs')
     colorful_json = highlight(
         formatted_json, lexers.JsonLexer(),
@@ -51,19 +113,6 @@ def progress_status(block_num, block_size, total_size):
                          ((block_num * block_size) * 1e2 / 1024,))
 
 
-def add_files_to_archive(tar_file, root_path, exclude_paths):
-    for path in root_path.iterdir():
-        add = True
-        for exclude_path in exclude_paths:
-            if path.samefile(exclude_path):
-                add = False
-                break
-        if add:
-            tar_file.add(str(path), arcname=str(path), recursive=False)
-            if path.is_dir():
-                add_files_to_archive(tar_file, path, exclude_paths)
-
-
 def training_model_archive(filepath):
     """
     Create zip archive file for training model.
@@ -84,18 +133,15 @@ def version_archive(name, exclude_filenames=None):
     Create .tar.gz archive file for current directory excluding .git
     Set model name as archive name prefix
     :param: name
+    :param: exclude_filenames: gitignore style patterns to exclude
     :return: temporary archive file
     """
-
-    root_dir = Path(os.curdir)
     if exclude_filenames is None:
         exclude_filenames = []
-    exclude_paths = [Path(x) for x in exclude_filenames]
-    exclude_paths = [x for x in exclude_paths if x.exists()]
     tmp_file = tempfile.NamedTemporaryFile(
         prefix=name, suffix='.tar.gz', delete=False)
-    with tarfile.open(fileobj=tmp_file, mode="w:gz") as tar:
-        add_files_to_archive(tar, root_dir, exclude_paths)
+    write_source_archive(tmp_file, exclude_filenames, os.curdir)
+    tmp_file.flush()
     tmp_file.seek(0)
     return tmp_file
 
@@ -0,0 +1,526 @@
+import concurrent.futures
+import gzip
+import io
+import os
+import queue
+import re
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from abejacli.config import (
+    ARCHIVE_BLOCK_SIZE,
+    ARCHIVE_COMPRESS_WORKER_NUM,
+    ARCHIVE_STREAM_QUEUE_SIZE
+)
+
+_WILDCARD_RE = re.compile(r'[*?\[]')
+
+
+def _translate_pattern(pattern: str) -> str:
+    """
+    translate a gitignore style glob into a regular expression
+    """
+    i, n = 0, len(pattern)
+    res = ''
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            res += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and i + 3 == n:
+            res += '/.*'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            res += '.*'
+            i += 2
+            continue
+        if c == '*':
+            res += '[^/]*'
+        elif c == '?':
+            res += '[^/]'
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                res += re.escape(c)
+            else:
+                stuff = pattern[i + 1:j]
+                if stuff.startswith('!'):
+                    stuff = '^' + stuff[1:]
+                res += '[{}]'.format(stuff.replace('\\', '\\\\'))
+                i = j
+        else:
+            res += re.escape(c)
+        i += 1
+    return res
+
+
+class ExcludeMatcher(object):
+    """
+    Match relative paths against exclude patterns with gitignore semantics.
+
+    - a plain name without wildcards is a path relative to the root directory,
+      as exclude files have always been
+    - a wildcard pattern without a slash matches a file or directory at any depth
+    - a pattern with a slash, including a leading ``./``, is relative to the root directory
+    - a pattern ending with a slash matches only directories
+    - ``*``, ``?``, ``[...]`` and ``**`` are supported
+    - a pattern starting with ``!`` re-includes paths excluded by previous patterns
+
+    Patterns are compiled once. Without negation patterns, all patterns are
+    combined into a single regular expression.
+    """
+
+    def __init__(self, patterns: Iterable[str], root_dir: str = os.curdir):
+        root_dir = os.path.abspath(root_dir)
+        self._rules = []  # type: List[Tuple[re.Pattern, bool, bool]]
+        for pattern in patterns:
+            rule = self._compile(str(pattern), root_dir)
+            if rule:
+                self._rules.append(rule)
+
+        self._has_negation = any(negate for _, negate, _ in self._rules)
+        if not self._has_negation:
+            self._file_regex = self._combine(
+                [r for r, _, dir_only in self._rules if not dir_only])
+            self._dir_regex = self._combine([r for r, _, _ in self._rules])
+
+    @staticmethod
+    def _compile(pattern: str, root_dir: str):
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith('#'):
+            return None
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+        # an absolute path inside the root directory is accepted for backward compatibility.
+        # other patterns starting with a slash are anchored to the root directory.
+        if os.path.isabs(pattern) and pattern.startswith(root_dir + os.sep):
+            pattern = '/' + os.path.relpath(pattern, root_dir).replace(os.sep, '/')
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern or not _WILDCARD_RE.search(pattern)
+        while pattern.startswith('./'):
+            pattern = pattern[2:]
+        if not pattern or pattern == '.':
+            return None
+        pattern = pattern.lstrip('/')
+        regex = _translate_pattern(pattern)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        return re.compile('^{}$'.format(regex)), negate, dir_only
+
+    @staticmethod
+    def _combine(regexes):
+        if not regexes:
+            return None
+        return re.compile('|'.join('(?:{})'.format(r.pattern) for r in regexes))
+
+    def match(self, rel_path: str, is_dir: bool = False) -> bool:
+        """
+        return True if the path should be excluded
+
+        :param rel_path: path relative to the root directory, separated with slashes
+        :param is_dir: whether the path is a directory
+        """
+        if not self._has_negation:
+            regex = self._dir_regex if is_dir else self._file_regex
+            return bool(regex and regex.match(rel_path))
+
+        excluded = False
+        for regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                excluded = not negate
+        return excluded
+
+
+def iter_archive_paths(root_dir: str, matcher: ExcludeMatcher) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    walk the directory and yield (relative path, dir entry) of paths to archive.
+    excluded directories are never traversed, and file types are taken from
+    ``os.scandir`` so that no extra ``stat`` is required.
+    """
+    def _walk(dir_path, prefix):
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            rel_path = prefix + entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if matcher.match(rel_path, is_dir):
+                continue
+            yield rel_path, entry
+            if is_dir:
+                yield from _walk(entry.path, rel_path + '/')
+
+    yield from _walk(root_dir, '')
+
+
+class ParallelGzipWriter(object):
+    """
+    Write-only file object to compress data into gzip format in parallel.
+
+    Data is split into blocks of ``block_size`` and each block is compressed into an
+    independent gzip member by a thread pool (zlib releases the GIL while compressing).
+    A concatenation of gzip members is a valid gzip file (RFC 1952).
+    """
+
+    def __init__(self, fileobj, block_size: int = ARCHIVE_BLOCK_SIZE,
+                 max_workers: Optional[int] = ARCHIVE_COMPRESS_WORKER_NUM, compresslevel: int = 6):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self.closed = False
+
+    def _compress(self, block):
+        # mtime is fixed to make the output reproducible
+        return gzip.compress(block, compresslevel=self.compresslevel, mtime=0)
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(self._compress, block))
+        # bound the number of blocks held in memory
+        while len(self._pending) > self._max_workers * 2:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# extensions of files which are already compressed, and stored without compression in zip
+STORED_EXTENSIONS = (
+    '.pt', '.pth', '.npz', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4'
+)
+
+_ZIP_FLAGS = 0x08 | 0x800  # sizes and crc in data descriptor, utf-8 file name
+_ZIP_DATA_DESCRIPTOR = b'PK\x07\x08'
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    dostime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dosdate = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dostime, dosdate
+
+
+class _ZipEntry(object):
+
+    def __init__(self, arcname: str, st: os.stat_result, compress_type: int):
+        self.name = arcname.encode('utf-8')
+        self.compress_type = compress_type
+        self.external_attr = (st.st_mode & 0xFFFF) << 16
+        self.dostime, self.dosdate = _dos_datetime(st.st_mtime)
+        # deflate can make data a bit larger, so leave a margin
+        self.zip64 = st.st_size + st.st_size // 1024 + 1024 * 1024 > zipfile.ZIP64_LIMIT
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = 0
+
+    def local_header(self) -> bytes:
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if self.zip64 else b''
+        size = 0xFFFFFFFF if self.zip64 else 0
+        header = struct.pack(
+            zipfile.structFileHeader, zipfile.stringFileHeader, 45 if self.zip64 else 20, 0,
+            _ZIP_FLAGS, self.compress_type, self.dostime, self.dosdate, 0, size, size,
+            len(self.name), len(extra))
+        return header + self.name + extra
+
+    def data_descriptor(self) -> bytes:
+        if self.zip64:
+            return struct.pack('<4sLQQ', _ZIP_DATA_DESCRIPTOR, self.crc, self.compress_size, self.file_size)
+        if max(self.compress_size, self.file_size) > 0xFFFFFFFF:
+            raise zipfile.LargeZipFile('{} grew while archiving'.format(self.name.decode('utf-8')))
+        return struct.pack('<4sLLL', _ZIP_DATA_DESCRIPTOR, self.crc, self.compress_size, self.file_size)
+
+    def central_directory(self) -> bytes:
+        extra = []
+        file_size, compress_size, header_offset = self.file_size, self.compress_size, self.header_offset
+        if file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT:
+            extra += [file_size, compress_size]
+            file_size = compress_size = 0xFFFFFFFF
+        if header_offset > zipfile.ZIP64_LIMIT:
+            extra.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        extra_data = struct.pack('<HH' + 'Q' * len(extra), 1, 8 * len(extra), *extra) if extra else b''
+        extract_version = 45 if extra or self.zip64 else 20
+        header = struct.pack(
+            zipfile.structCentralDir, zipfile.stringCentralDir, 45, 3, extract_version, 0,
+            _ZIP_FLAGS, self.compress_type, self.dostime, self.dosdate, self.crc,
+            compress_size, file_size, len(self.name), len(extra_data), 0, 0, 0,
+            self.external_attr, header_offset)
+        return header + self.name + extra_data
+
+
+class ParallelZipWriter(object):
+    """
+    Write a zip file into a stream, compressing files in parallel.
+
+    Each file is split into blocks of ``block_size``, and each block is compressed by
+    a thread pool into raw deflate data ending at a byte boundary (like pigz), so that
+    the concatenation is a single deflate stream. Sizes and crc are written in data
+    descriptors after the data, so the output is never seeked and can be any writable
+    file object. Files with ``STORED_EXTENSIONS`` are stored without compression.
+    Large files and archives are written in zip64 format.
+    """
+
+    def __init__(self, fileobj, block_size: int = ARCHIVE_BLOCK_SIZE,
+                 max_workers: Optional[int] = ARCHIVE_COMPRESS_WORKER_NUM, compresslevel: int = 6,
+                 stored_extensions: Iterable[str] = STORED_EXTENSIONS):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        self.stored_extensions = tuple(stored_extensions)
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_workers)
+        self._pending = deque()
+        self._entries = []  # type: List[_ZipEntry]
+        self._offset = 0
+        self.closed = False
+
+    def _compress(self, block: bytes, final: bool) -> bytes:
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    def _write(self, data: bytes):
+        self.fileobj.write(data)
+        self._offset += len(data)
+
+    def _write_pending(self, kind: str, entry: _ZipEntry, data=None):
+        if kind == 'header':
+            entry.header_offset = self._offset
+            self._write(entry.local_header())
+        elif kind == 'data':
+            if isinstance(data, concurrent.futures.Future):
+                data = data.result()
+            entry.compress_size += len(data)
+            self._write(data)
+        else:
+            self._write(entry.data_descriptor())
+
+    def _push(self, kind: str, entry: _ZipEntry, data=None):
+        self._pending.append((kind, entry, data))
+        # bound the number of blocks held in memory
+        while len(self._pending) > self._max_workers * 2:
+            self._write_pending(*self._pending.popleft())
+
+    def write(self, path: str, arcname: str):
+        """
+        add the file to the archive
+
+        :param path: path of the file
+        :param arcname: name in the archive, separated with slashes
+        """
+        st = os.stat(path)
+        stored = path.lower().endswith(self.stored_extensions)
+        entry = _ZipEntry(arcname, st, zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+        self._entries.append(entry)
+        self._push('header', entry)
+        with open(path, 'rb') as f:
+            block = f.read(self.block_size)
+            while True:
+                next_block = f.read(self.block_size) if block else b''
+                entry.crc = zlib.crc32(block, entry.crc)
+                entry.file_size += len(block)
+                if not stored:
+                    self._push('data', entry, self._executor.submit(self._compress, block, not next_block))
+                elif block:
+                    self._push('data', entry, block)
+                if not next_block:
+                    break
+                block = next_block
+        self._push('descriptor', entry)
+
+    def _write_end_record(self):
+        cd_offset = self._offset
+        for entry in self._entries:
+            self._write(entry.central_directory())
+        cd_size = self._offset - cd_offset
+        count = len(self._entries)
+        if count >= zipfile.ZIP_FILECOUNT_LIMIT or cd_offset > zipfile.ZIP64_LIMIT or cd_size > zipfile.ZIP64_LIMIT:
+            zip64_offset = self._offset
+            self._write(struct.pack(
+                zipfile.structEndArchive64, zipfile.stringEndArchive64,
+                44, 45, 45, 0, 0, count, count, cd_size, cd_offset))
+            self._write(struct.pack(
+                zipfile.structEndArchive64Locator, zipfile.stringEndArchive64Locator,
+                0, zip64_offset, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+        self._write(struct.pack(
+            zipfile.structEndArchive, zipfile.stringEndArchive,
+            0, 0, count, count, cd_size, cd_offset, 0))
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            while self._pending:
+                self._write_pending(*self._pending.popleft())
+            self._write_end_record()
+        finally:
+            self._executor.shutdown()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_source_archive(fileobj, exclude_patterns: Iterable[str], root_dir: str = os.curdir):
+    """
+    write .tar.gz archive of the directory into the file object.
+
+    :param fileobj: writable file object
+    :param exclude_patterns: gitignore style patterns to exclude
+    :param root_dir: directory to archive
+    """
+    matcher = ExcludeMatcher(exclude_patterns, root_dir)
+    with ParallelGzipWriter(fileobj) as gz:
+        with tarfile.open(fileobj=gz, mode='w|') as tar:
+            for rel_path, entry in iter_archive_paths(root_dir, matcher):
+                tar.add(entry.path, arcname=rel_path, recursive=False)
+
+
+def write_build_context(fileobj, dockerfile: str, dockerfile_name: str,
+                        exclude_patterns: Iterable[str], root_dir: str = os.curdir):
+    """
+    write .tar archive of the directory with the Dockerfile into the file object,
+    which is sent to docker daemon as a build context.
+
+    :param fileobj: writable file object
+    :param dockerfile: content of Dockerfile
+    :param dockerfile_name: path of Dockerfile in the archive
+    :param exclude_patterns: gitignore style patterns to exclude
+    :param root_dir: directory to archive
+    """
+    matcher = ExcludeMatcher(exclude_patterns, root_dir)
+    with tarfile.open(fileobj=fileobj, mode='w|') as tar:
+        for rel_path, entry in iter_archive_paths(root_dir, matcher):
+            if rel_path == dockerfile_name:
+                continue
+            tar.add(entry.path, arcname=rel_path, recursive=False)
+        data = dockerfile.encode('utf-8')
+        info = tarfile.TarInfo(dockerfile_name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+
+
+class _QueueWriter(object):
+
+    def __init__(self, chunks: queue.Queue, stopped: threading.Event):
+        self._chunks = chunks
+        self._stopped = stopped
+
+    def write(self, data) -> int:
+        if not data:
+            return 0
+        data = bytes(data)
+        # give up when the reader stopped iterating
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(data, timeout=0.1)
+                return len(data)
+            except queue.Full:
+                pass
+        raise IOError('archive stream was closed')
+
+    def flush(self):
+        pass
+
+
+class SourceArchiveStream(object):
+    """
+    Iterable of the chunks of .tar.gz archive of the directory, which is produced
+    by a background thread while it is iterated, so that compression overlaps with
+    upload and no temporary file is written.
+
+    The length is unknown until the archive is complete, so it's sent as a chunked
+    request body. Each iteration produces the archive again, so that requests can be
+    retried.
+    """
+
+    def __init__(self, exclude_patterns: Iterable[str], root_dir: str = os.curdir):
+        self.exclude_patterns = list(exclude_patterns)
+        self.root_dir = root_dir
+
+    def __iter__(self) -> Iterator[bytes]:
+        chunks = queue.Queue(maxsize=ARCHIVE_STREAM_QUEUE_SIZE)
+        stopped = threading.Event()
+        end = object()
+        errors = []
+
+        def _produce():
+            try:
+                write_source_archive(
+                    _QueueWriter(chunks, stopped), self.exclude_patterns, self.root_dir)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                while not stopped.is_set():
+                    try:
+                        chunks.put(end, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+        producer = threading.Thread(target=_produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is end:
+                    break
+                yield chunk
+        finally:
+            stopped.set()
+            producer.join()
+        if errors:
+            raise errors[0]
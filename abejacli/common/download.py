@@ -0,0 +1,428 @@
+import base64
+import binascii
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Callable, Optional, Set
+
+import requests
+import tqdm
+from retrying import retry
+
+from abejacli.config import (
+    DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+    DOWNLOAD_SEGMENT_SIZE,
+    DOWNLOAD_WORKER_NUM,
+    FILE_READ_CHUNK_SIZE,
+    PLATFORM_REQUEST_TIMEOUT_SECONDS
+)
+from abejacli.fs_utils import (
+    COMPRESSED_FILE_HEAD_SIZE,
+    TARFile,
+    TGZFile,
+    ZIPFile,
+    detect_compressed_file
+)
+from abejacli.logger import get_logger
+from abejacli.session import generate_session, is_retryable_error
+
+logger = get_logger()
+
+_READ_CHUNK_SIZE = 1024 * 1024
+_STATE_SAVE_INTERVAL = 1.0
+_CONTENT_RANGE = re.compile(r'^bytes \d+-\d+/(\d+)$')
+
+
+class DownloadVerificationError(Exception):
+    pass
+
+
+class _RetryableDownloadError(Exception):
+    pass
+
+
+def _is_retryable_download_error(exception):
+    return isinstance(exception, _RetryableDownloadError) or is_retryable_error(exception)
+
+
+def _decode_content_md5(value: Optional[str]) -> Optional[str]:
+    """
+    return the hex digest of Content-MD5 header, which is base64 encoded
+    """
+    if not value:
+        return None
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+def file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_READ_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Downloader(object):
+    """
+    Base of downloaders which keep a session for each thread, and renew
+    an expired pre-signed url by ``url_provider``. The sessions don't retry
+    by themselves, because requests are retried with the downloaders.
+    """
+
+    def __init__(self, url: str, url_provider: Optional[Callable[[], str]] = None):
+        self.url = url
+        self.url_provider = url_provider
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = []
+        self._url_generation = 0
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = generate_session()
+            with self._lock:
+                self._sessions.append(self._local.session)
+        return self._local.session
+
+    def _get(self, headers=None, allowed_statuses=()) -> requests.Response:
+        generation = self._url_generation
+        res = self._session().get(
+            self.url, headers=headers, stream=True, timeout=PLATFORM_REQUEST_TIMEOUT_SECONDS)
+        # update pre-signed url if expired
+        if res.status_code == 403 and self.url_provider:
+            res.close()
+            with self._lock:
+                if generation == self._url_generation:
+                    self.url = self.url_provider()
+                    self._url_generation += 1
+            raise _RetryableDownloadError('download url is expired')
+        if res.status_code not in allowed_statuses:
+            res.raise_for_status()
+        return res
+
+    def _close_sessions(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+
+class FileDownloader(_Downloader):
+    """
+    Download a file with parallel ranged requests.
+
+    The file is written to ``<path>.part``, and completed segments are recorded in
+    ``<path>.part.json``, so that an interrupted download is resumed if the remote
+    file is not changed. Each segment is retried on errors, and an expired pre-signed
+    url is renewed by ``url_provider``. The downloaded file is verified by its size, and
+    by its md5 if it is given or the Content-MD5 header of the whole file is returned.
+    ETag is not verified, because it is not md5 of the content for some objects, e.g.
+    encrypted ones.
+    If the server does not support ranged requests, the file is downloaded with a
+    single request.
+    """
+
+    def __init__(self, url: str, path: str, url_provider: Optional[Callable[[], str]] = None,
+                 expected_md5: Optional[str] = None, segment_size: int = DOWNLOAD_SEGMENT_SIZE,
+                 max_workers: int = DOWNLOAD_WORKER_NUM, progress: bool = True):
+        super().__init__(url, url_provider)
+        self.path = path
+        self.expected_md5 = expected_md5
+        self.segment_size = segment_size
+        self.max_workers = max_workers
+        self.progress = progress
+        self.part_path = '{}.part'.format(path)
+        self.state_path = '{}.part.json'.format(path)
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           wait_exponential_multiplier=1000, wait_exponential_max=30000,
+           retry_on_exception=_is_retryable_download_error)
+    def _probe(self):
+        # range of an empty file is not satisfiable
+        with self._get(headers={'Range': 'bytes=0-0'}, allowed_statuses=(416,)) as res:
+            etag = res.headers.get('ETag', '').strip('"')
+            match = _CONTENT_RANGE.match(res.headers.get('Content-Range', ''))
+            if res.status_code == 206 and match:
+                return int(match.group(1)), etag, True, None
+            content_length = res.headers.get('Content-Length')
+            return int(content_length) if content_length else None, etag, False, \
+                _decode_content_md5(res.headers.get('Content-MD5'))
+
+    def _load_state(self, size: int, etag: str) -> Set[int]:
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if state.get('size') != size or state.get('etag') != etag or \
+                state.get('segment_size') != self.segment_size or not os.path.exists(self.part_path):
+            return set()
+        return set(state.get('completed', []))
+
+    def _save_state(self, size: int, etag: str, completed: Set[int]):
+        tmp_path = '{}.tmp'.format(self.state_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'size': size,
+                'etag': etag,
+                'segment_size': self.segment_size,
+                'completed': sorted(completed)
+            }, f)
+        os.replace(tmp_path, self.state_path)
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           wait_exponential_multiplier=1000, wait_exponential_max=30000,
+           retry_on_exception=_is_retryable_download_error)
+    def _download_segment(self, start: int, end: int, pbar):
+        received = 0
+        try:
+            with self._get(headers={'Range': 'bytes={}-{}'.format(start, end)}) as res:
+                if res.status_code != 206:
+                    raise _RetryableDownloadError('ranged request is ignored')
+                with open(self.part_path, 'r+b') as f:
+                    f.seek(start)
+                    for chunk in res.iter_content(chunk_size=_READ_CHUNK_SIZE):
+                        f.write(chunk)
+                        received += len(chunk)
+                        pbar.update(len(chunk))
+        except Exception:
+            # the segment is downloaded again from the beginning
+            pbar.update(-received)
+            raise
+        if received != end - start + 1:
+            pbar.update(-received)
+            raise _RetryableDownloadError(
+                'incomplete segment: {} of {} bytes'.format(received, end - start + 1))
+
+    def _download_segments(self, size: int, etag: str, pbar):
+        completed = self._load_state(size, etag)
+        if not completed:
+            with open(self.part_path, 'wb') as f:
+                f.truncate(size)
+        segments = [
+            (index, start, min(start + self.segment_size, size) - 1)
+            for index, start in enumerate(range(0, size, self.segment_size))
+        ]
+        pbar.update(sum(end - start + 1 for index, start, end in segments if index in completed))
+
+        last_saved = time.monotonic()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._download_segment, start, end, pbar): index
+                    for index, start, end in segments if index not in completed
+                }
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        future.result()
+                        completed.add(futures[future])
+                        if time.monotonic() - last_saved >= _STATE_SAVE_INTERVAL:
+                            self._save_state(size, etag, completed)
+                            last_saved = time.monotonic()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            self._save_state(size, etag, completed)
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           wait_exponential_multiplier=1000, wait_exponential_max=30000,
+           retry_on_exception=_is_retryable_download_error)
+    def _download_whole(self, pbar):
+        received = 0
+        try:
+            with self._get() as res, open(self.part_path, 'wb') as f:
+                for chunk in res.iter_content(chunk_size=_READ_CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+                    pbar.update(len(chunk))
+        except Exception:
+            pbar.update(-received)
+            raise
+
+    def _verify(self, size: Optional[int], content_md5: Optional[str]):
+        actual_size = os.path.getsize(self.part_path)
+        if size is not None and actual_size != size:
+            raise DownloadVerificationError(
+                'size mismatch: expected {} bytes, but got {} bytes'.format(size, actual_size))
+        expected_md5 = self.expected_md5 or content_md5
+        if expected_md5:
+            actual_md5 = file_md5(self.part_path)
+            if actual_md5 != expected_md5:
+                raise DownloadVerificationError(
+                    'md5 mismatch: expected {}, but got {}'.format(expected_md5, actual_md5))
+
+    def _remove_partial_files(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download(self) -> str:
+        size, etag, ranged, content_md5 = self._probe()
+        try:
+            with tqdm.tqdm(total=size, unit='B', unit_scale=True, desc=os.path.basename(self.path),
+                           disable=not self.progress) as pbar:
+                if ranged and size:
+                    self._download_segments(size, etag, pbar)
+                else:
+                    self._download_whole(pbar)
+            try:
+                self._verify(size, content_md5)
+            except DownloadVerificationError:
+                self._remove_partial_files()
+                raise
+            os.replace(self.part_path, self.path)
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+        finally:
+            self._close_sessions()
+        return self.path
+
+
+class UnsupportedArchiveError(Exception):
+    pass
+
+
+class _ChunkReader(object):
+    """
+    Readable file object over chunks of a response, which holds at most one chunk.
+    """
+
+    def __init__(self, chunks, pbar):
+        self._chunks = iter(chunks)
+        self._pbar = pbar
+        self._buffer = b''
+
+    def _fill(self, size: int) -> bool:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._pbar.update(len(chunk))
+            self._buffer += chunk
+        return True
+
+    def peek(self, size: int) -> bytes:
+        self._fill(size)
+        return self._buffer[:size]
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _extract_tar_member(tar: tarfile.TarFile, member: tarfile.TarInfo, dest_dir: str):
+    if hasattr(tarfile, 'data_filter'):
+        tar.extract(member, dest_dir, filter='data')
+        return
+    # reject paths and links which point outside of the directory
+    root = os.path.realpath(dest_dir)
+    targets = [member.name]
+    if member.issym():
+        targets.append(os.path.join(os.path.dirname(member.name), member.linkname))
+    elif member.islnk():
+        targets.append(member.linkname)
+    for target in targets:
+        path = os.path.realpath(os.path.join(root, target))
+        if os.path.isabs(target) or os.path.commonpath([root, path]) != root:
+            raise tarfile.ExtractError('{} is outside of the destination'.format(member.name))
+    if member.isdev():
+        return
+    tar.extract(member, dest_dir)
+
+
+class ArchiveExtractor(_Downloader):
+    """
+    Extract an archive while it is downloaded.
+
+    The format is detected from the first bytes of the response. tar and tar.gz
+    archives are extracted from the stream, so that the archive is never written
+    to disk and at most one chunk of it is held in memory. A zip archive has its
+    index at the end, so it is spooled to a temporary file before extraction.
+    """
+
+    def __init__(self, url: str, dest_dir: str, url_provider: Optional[Callable[[], str]] = None,
+                 progress: bool = True):
+        super().__init__(url, url_provider)
+        self.dest_dir = dest_dir
+        self.progress = progress
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           wait_exponential_multiplier=1000, wait_exponential_max=30000,
+           retry_on_exception=_is_retryable_download_error)
+    def _extract(self):
+        with self._get() as res:
+            content_length = res.headers.get('Content-Length')
+            with tqdm.tqdm(total=int(content_length) if content_length else None, unit='B',
+                           unit_scale=True, desc=os.path.basename(self.dest_dir),
+                           disable=not self.progress) as pbar:
+                reader = _ChunkReader(res.iter_content(chunk_size=_READ_CHUNK_SIZE), pbar)
+                compressed_file = detect_compressed_file(reader.peek(COMPRESSED_FILE_HEAD_SIZE))
+                if compressed_file in (TARFile, TGZFile):
+                    with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                        for member in tar:
+                            _extract_tar_member(tar, member, self.dest_dir)
+                elif compressed_file is ZIPFile:
+                    with tempfile.TemporaryFile() as f:
+                        shutil.copyfileobj(reader, f, _READ_CHUNK_SIZE)
+                        with zipfile.ZipFile(f) as z:
+                            z.extractall(self.dest_dir)
+                else:
+                    raise UnsupportedArchiveError('only zip, tar and tar.gz archives can be extracted')
+
+    def extract(self) -> str:
+        os.makedirs(self.dest_dir, exist_ok=True)
+        try:
+            self._extract()
+        finally:
+            self._close_sessions()
+        return self.dest_dir
+
+
+def download_file(url: str, path: str, url_provider: Optional[Callable[[], str]] = None,
+                  expected_md5: Optional[str] = None, progress: bool = True) -> str:
+    """
+    download a file with parallel ranged requests, which is resumed when it is interrupted.
+
+    :param url: url to download
+    :param path: path to save the file
+    :param url_provider: function to get a new url when the pre-signed url is expired
+    :param expected_md5: md5 hex digest to verify the file
+    :param progress: show progress bar
+    :return: path of the downloaded file
+    """
+    return FileDownloader(url, path, url_provider=url_provider,
+                          expected_md5=expected_md5, progress=progress).download()
+
+
+def download_and_extract(url: str, dest_dir: str, url_provider: Optional[Callable[[], str]] = None,
+                         progress: bool = True) -> str:
+    """
+    extract a zip, tar or tar.gz archive into the directory while downloading it.
+
+    :param url: url to download
+    :param dest_dir: directory to extract files into
+    :param url_provider: function to get a new url when the pre-signed url is expired
+    :param progress: show progress bar
+    :return: path of the directory
+    """
+    return ArchiveExtractor(url, dest_dir, url_provider=url_provider, progress=progress).extract()
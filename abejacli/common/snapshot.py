@@ -0,0 +1,224 @@
+import hashlib
+import json
+import mmap
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+from abejacli.common.archive import ExcludeMatcher
+from abejacli.config import (
+    FILE_HASH_CACHE_PATH,
+    FILE_HASH_MMAP_THRESHOLD,
+    FILE_READ_CHUNK_SIZE,
+    SOURCE_SNAPSHOT_INDEX_PATH
+)
+from abejacli.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_HASH_ALGORITHM = 'sha256'
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning('ignore broken cache file: {}'.format(path))
+        return {}
+
+
+def save_json(path: str, content: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write and rename to avoid a broken file on interruption
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+
+class FileHashCache(object):
+    """
+    Persistent cache of file digests keyed by (path, size, mtime),
+    so that unchanged files are not read again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or FILE_HASH_CACHE_PATH
+        self._entries = load_json(self.path)
+        self._updated = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str, algorithm: str) -> str:
+        return '{}:{}'.format(algorithm, os.path.abspath(path))
+
+    def get(self, path: str, st: os.stat_result, algorithm: str = DEFAULT_HASH_ALGORITHM) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(self._key(path, algorithm))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, path: str, st: os.stat_result, digest: str, algorithm: str = DEFAULT_HASH_ALGORITHM):
+        with self._lock:
+            self._entries[self._key(path, algorithm)] = [st.st_size, st.st_mtime_ns, digest]
+            self._updated = True
+
+    def save(self):
+        with self._lock:
+            if self._updated:
+                save_json(self.path, self._entries)
+                self._updated = False
+
+
+def _hash_file(path: str, size: int, algorithm: str) -> str:
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        if size >= FILE_HASH_MMAP_THRESHOLD:
+            # hash a large file through the page cache without copying it into memory
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            for chunk in iter(lambda: f.read(FILE_READ_CHUNK_SIZE), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path: str, cache: Optional[FileHashCache] = None,
+                algorithm: str = DEFAULT_HASH_ALGORITHM) -> str:
+    """
+    return hex digest of the file content.
+
+    :param path: file path
+    :param cache: cache of file digests
+    :param algorithm: name of a hash algorithm in ``hashlib``, e.g. sha256, blake2b or md5
+    :return: hex digest
+    """
+    st = os.stat(path)
+    if cache:
+        digest = cache.get(path, st, algorithm)
+        if digest:
+            return digest
+    digest = _hash_file(path, st.st_size, algorithm)
+    if cache:
+        cache.put(path, st, digest, algorithm)
+    return digest
+
+
+def file_digests(paths: Iterable[str], cache: Optional[FileHashCache] = None,
+                 algorithm: str = DEFAULT_HASH_ALGORITHM,
+                 max_workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    return hex digests of the files computed in parallel.
+    hashlib releases GIL while hashing, so threads make use of multiple cores.
+
+    :param paths: file paths
+    :param cache: cache of file digests
+    :param algorithm: name of a hash algorithm in ``hashlib``
+    :param max_workers: number of threads
+    :return: dict of path to hex digest
+    """
+    paths = list(paths)
+    if len(paths) <= 1:
+        return {path: file_digest(path, cache, algorithm) for path in paths}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(lambda path: file_digest(path, cache, algorithm), paths)
+        return dict(zip(paths, digests))
+
+
+def tree_digest(root_dir: str, exclude_patterns: Iterable[str],
+                cache: Optional[FileHashCache] = None,
+                algorithm: str = DEFAULT_HASH_ALGORITHM) -> str:
+    """
+    return Merkle tree hash of the files which are archived by ``write_source_archive``.
+    The hash of a directory is computed from names, types and hashes of its children,
+    so any change of content, name, executable bit or symbolic link in the tree changes it.
+    Files are hashed in parallel after the tree is scanned.
+
+    :param root_dir: root directory
+    :param exclude_patterns: gitignore style patterns to exclude
+    :param cache: cache of file digests
+    :param algorithm: name of a hash algorithm in ``hashlib``
+    :return: hex digest
+    """
+    matcher = ExcludeMatcher(exclude_patterns, root_dir)
+    files = []
+
+    def _scan_dir(dir_path, prefix):
+        children = []
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            rel_path = prefix + entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if matcher.match(rel_path, is_dir):
+                continue
+            if entry.is_symlink():
+                digest = hashlib.new(algorithm, os.readlink(entry.path).encode('utf-8')).hexdigest()
+                children.append(('L', entry.name, digest))
+            elif is_dir:
+                children.append(('D', entry.name, _scan_dir(entry.path, rel_path + '/')))
+            elif entry.is_file(follow_symlinks=False):
+                executable = entry.stat(follow_symlinks=False).st_mode & stat.S_IXUSR
+                children.append(('X' if executable else 'F', entry.name, entry.path))
+                files.append(entry.path)
+        return children
+
+    def _digest_dir(children):
+        h = hashlib.new(algorithm)
+        for kind, name, value in children:
+            if kind == 'D':
+                digest = _digest_dir(value)
+            elif kind == 'L':
+                digest = value
+            else:
+                digest = digests[value]
+            h.update('{} {} {}\n'.format(kind, name, digest).encode('utf-8'))
+        return h.hexdigest()
+
+    tree = _scan_dir(root_dir, '')
+    digests = file_digests(files, cache, algorithm)
+    return _digest_dir(tree)
+
+
+class SourceSnapshot(object):
+    """
+    Snapshot of the source tree to find out the version which was created from
+    exactly the same source files and parameters.
+
+    The tree hash and the parameters of the last created version are recorded
+    for each key (e.g. a job definition).
+    """
+
+    def __init__(self, key: str, payload: Dict[str, Any], exclude_patterns: Iterable[str],
+                 root_dir: str = os.curdir, index_path: Optional[str] = None):
+        self.key = key
+        self.index_path = index_path or SOURCE_SNAPSHOT_INDEX_PATH
+        cache = FileHashCache()
+        self.tree_hash = tree_digest(root_dir, exclude_patterns, cache)
+        cache.save()
+        self.payload_hash = hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def find(self) -> Optional[Dict[str, Any]]:
+        """
+        return the recorded version if it was created from the same snapshot
+        """
+        entry = load_json(self.index_path).get(self.key)
+        if entry and entry.get('tree_hash') == self.tree_hash and entry.get('payload_hash') == self.payload_hash:
+            return entry.get('version')
+        return None
+
+    def record(self, version: Dict[str, Any]):
+        index = load_json(self.index_path)
+        index[self.key] = {
+            'tree_hash': self.tree_hash,
+            'payload_hash': self.payload_hash,
+            'version': version
+        }
+        save_json(self.index_path, index)
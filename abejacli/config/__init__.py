@@ -14,6 +14,10 @@ INVALID_PARAMETER_EXITCODE = 2
 
 LOG_DIRECTORY = os.path.join(os.path.expanduser('~'), '.abeja', 'log')
 LOG_FILE_PATH = os.path.join(LOG_DIRECTORY, 'abejacli.log')
+CACHE_DIRECTORY = os.path.join(ROOT_DIRECTORY, 'cache')
+FILE_HASH_CACHE_PATH = os.path.join(CACHE_DIRECTORY, 'file_hashes.json')
+SOURCE_SNAPSHOT_INDEX_PATH = os.path.join(CACHE_DIRECTORY, 'source_snapshots.json')
+BUILT_IMAGE_INDEX_PATH = os.path.join(CACHE_DIRECTORY, 'built_images.json')
 
 SAMPLE_MODEL_PATH = os.environ.get(
     'SAMPLE_MODEL_PATH',
@@ -23,13 +27,21 @@ STDERROR_LOG_LEVEL = os.environ.get('LOG_LEVEL', 'ERROR')
 DATALAKE_ITEMS_PER_PAGE = int(os.environ.get('DATALAKE_ITEMS_PER_PAGE', 100))
 HTTP_READ_CHUNK_SIZE = int(os.environ.get('HTTP_READ_CHUNK_SIZE', 1024))
 FILE_READ_CHUNK_SIZE = int(os.environ.get('FILE_READ_CHUNK_SIZE', 8192))
+FILE_HASH_MMAP_THRESHOLD = int(
+    os.environ.get('FILE_HASH_MMAP_THRESHOLD', 1024 * 1024))
 JOB_WORKER_THREAD_NUM = int(os.environ.get('JOB_WORKER_THREAD_NUM', 10))
 PLATFORM_REQUEST_TIMEOUT_SECONDS = int(
     os.environ.get('PLATFORM_REQUEST_TIMEOUT_SECONDS', 300))
+JSON_HIGHLIGHT_MAX_SIZE = int(
+    os.environ.get('JSON_HIGHLIGHT_MAX_SIZE', 64 * 1024))
 
 SERVICE_API_TIMEOUT = 90
 
 DATASET_CHUNK_SIZE = 500
+DATASET_REGISTER_WORKER_NUM = int(
+    os.environ.get('DATASET_REGISTER_WORKER_NUM', 4))
+DATASET_REGISTER_RETRY_ATTEMPT_NUMBER = int(
+    os.environ.get('DATASET_REGISTER_RETRY_ATTEMPT_NUMBER', 5))
 
 ENV_VAR_KEY_FORMAT = r'^[a-zA-Z_][a-zA-Z0-9_]*$'
 VOLUME_FORMAT = r'^(/)?([^/\0]+(/)?)+$'
@@ -39,6 +51,15 @@ TRIGGER_DEFAULT_RETRY_COUNT = 5
 RUN_DEFAULT_RETRY_COUNT = 5
 
 DEFAULT_EXCLUDE_FILES = ['.git']
+ARCHIVE_BLOCK_SIZE = int(os.environ.get('ARCHIVE_BLOCK_SIZE', 1024 * 1024))
+ARCHIVE_COMPRESS_WORKER_NUM = int(
+    os.environ.get('ARCHIVE_COMPRESS_WORKER_NUM', os.cpu_count() or 1))
+ARCHIVE_STREAM_QUEUE_SIZE = int(os.environ.get('ARCHIVE_STREAM_QUEUE_SIZE', 16))
+DOWNLOAD_SEGMENT_SIZE = int(
+    os.environ.get('DOWNLOAD_SEGMENT_SIZE', 16 * 1024 * 1024))
+DOWNLOAD_WORKER_NUM = int(os.environ.get('DOWNLOAD_WORKER_NUM', 8))
+DOWNLOAD_RETRY_ATTEMPT_NUMBER = int(
+    os.environ.get('DOWNLOAD_RETRY_ATTEMPT_NUMBER', 5))
 
 DOCKER_REPOSITORIES = ['abeja', 'abeja-inc']
 TAG_VERSION_SAMPV1 = ['18.10', '0.1.0', '0.1.0-arm64v8', '0.1.0-arm32v7']
@@ -122,3 +143,23 @@ assert LOG_MAX_SIZE > _BUFFER, 'LOG_MAX_SIZE should be greater than {}'.format(
 LOG_MAX_SIZE -= _BUFFER
 
 POLLING_INTERVAL = get_env_var('POLLING_INTERVAL', int, 10)
+# the polling interval grows from POLLING_MIN_INTERVAL to POLLING_INTERVAL while the status stays the same
+POLLING_MIN_INTERVAL = get_env_var('POLLING_MIN_INTERVAL', float, 1)
+ARTIFACT_UPLOAD_RETRY_ATTEMPT_NUMBER = get_env_var('ARTIFACT_UPLOAD_RETRY_ATTEMPT_NUMBER', int, 5)
+# seconds to wait before polling new logs in follow mode of describe-service-logs and describe-run-logs
+LOG_FOLLOW_INTERVAL = get_env_var('LOG_FOLLOW_INTERVAL', float, 5)
+# number of sub-ranges fetched at a time by --parallel of describe-service-logs and describe-run-logs
+LOG_FETCH_WORKER_NUM = get_env_var('LOG_FETCH_WORKER_NUM', int, 4)
+# number of log events prefetched for each sub-range by --parallel
+LOG_PREFETCH_EVENT_NUM = get_env_var('LOG_PREFETCH_EVENT_NUM', int, 10000)
+
+# number of log lines buffered for the background log sender
+LOG_QUEUE_SIZE = get_env_var('LOG_QUEUE_SIZE', int, 10000)
+# what to do with log lines when the buffer is full: spill (to disk), drop or block
+LOG_OVERFLOW_POLICY = get_env_var('LOG_OVERFLOW_POLICY', str, 'spill')
+assert LOG_OVERFLOW_POLICY in ('spill', 'drop', 'block'), \
+    'LOG_OVERFLOW_POLICY should be one of spill, drop or block'
+# seconds to wait for the background log sender to send log lines of a finished job
+LOG_FLUSH_TIMEOUT = get_env_var('LOG_FLUSH_TIMEOUT', float, 60)
+# gzip log payloads sent to the platform
+LOG_COMPRESS = get_env_var('LOG_COMPRESS', lambda v: v.lower() in ('1', 'true', 'yes'), False)
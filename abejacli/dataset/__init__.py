@@ -1,12 +1,26 @@
 # coding: utf-8
 
+import concurrent.futures
+import itertools
 import json
+import threading
 from collections import defaultdict
 
-from abejacli.config import DATASET_CHUNK_SIZE, ORGANIZATION_ENDPOINT
+from retrying import retry
+
+from abejacli.config import (
+    DATALAKE_ITEMS_PER_PAGE,
+    DATASET_CHUNK_SIZE,
+    DATASET_REGISTER_RETRY_ATTEMPT_NUMBER,
+    DATASET_REGISTER_WORKER_NUM,
+    ORGANIZATION_ENDPOINT,
+    PLATFORM_REQUEST_TIMEOUT_SECONDS
+)
 from abejacli.datalake import generate_channel_file_iter_by_period
+from abejacli.dataset.checkpoint import RegisterCheckpoint
+from abejacli.iter_utils import prefetch_iter
 from abejacli.logger import get_logger
-from abejacli.session import api_post
+from abejacli.session import generate_user_session, is_retryable_error
 
 logger = get_logger()
 
@@ -54,6 +68,29 @@ def create_request_element(channel_id, file_info, property_metadata_keys, catego
     return data
 
 
+def iter_items_by_max_size(dataset_items, max_size_for_label):
+    """
+    yield dataset items while the number of items for each label value is under max size.
+    only the counters for each label value are kept, so items are never accumulated.
+
+    :param dataset_items: iterable of dataset items
+    :param max_size_for_label: max size of dataset items for each label value
+    :return:
+    """
+    counts = defaultdict(int)
+    skipped = defaultdict(int)
+    for item in dataset_items:
+        label = item['attributes']['classification'][0]['label']
+        if max_size_for_label is not None and counts[label] >= max_size_for_label:
+            skipped[label] += 1
+            continue
+        counts[label] += 1
+        yield item
+    for k, v in skipped.items():
+        logger.info(
+            '[Warning] Skipping {} items for label:{} to register'.format(v, k))
+
+
 def filter_items_by_max_size(dataset_items, max_size_for_label):
     """
     trim dataset items by max size for each lable value
@@ -62,45 +99,106 @@ def filter_items_by_max_size(dataset_items, max_size_for_label):
     :param max_size:
     :return:
     """
-    items_by_labels = defaultdict(list)
-    # group by label value
-    for item in dataset_items:
-        label = item['attributes']['classification'][0]['label']
-        items_by_labels[label].append(item)
-    filtered_items = []
-    for k, v in items_by_labels.items():
-        items_size = len(v)
-        # trim by max_size
-        upload_size = items_size if max_size_for_label is None else min(
-            max_size_for_label, items_size)
-        if upload_size < items_size:
-            logger.info('[Warning] Skipping {} items for label:{} to register'.format(
-                items_size - upload_size, k))
-        filtered_items += v[:upload_size]
-    return filtered_items
-
-
-def register_dataset_items(dataset_id, items):
+    return list(iter_items_by_max_size(dataset_items, max_size_for_label))
+
+
+def _chunked(items, n):
     """
-    execute dataset api to registr dataset items
+    split any iterable of items into lists of at most n items
 
-    :param dataset_id:
     :param items:
+    :param n:
     :return:
     """
-    url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, dataset_id)
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+@retry(stop_max_attempt_number=DATASET_REGISTER_RETRY_ATTEMPT_NUMBER,
+       wait_exponential_multiplier=1000, wait_exponential_max=30000,
+       retry_on_exception=is_retryable_error)
+def _post_dataset_items(session, url, chunked_items):
+    r = session.post(url, data=json.dumps(chunked_items),
+                     timeout=PLATFORM_REQUEST_TIMEOUT_SECONDS)
+    r.raise_for_status()
+
+
+def register_dataset_items(dataset_id, items, checkpoint_path=None,
+                           max_workers=DATASET_REGISTER_WORKER_NUM, source=None):
+    """
+    execute dataset api to registr dataset items
 
-    def _chunked(items, n):
-        for i in range(0, len(items), n):
-            yield items[i:i + n]
+    chunks are posted concurrently by ``max_workers`` threads, and each thread keeps
+    its own session to reuse connections. If ``checkpoint_path`` is given, acknowledged
+    chunks are recorded there and skipped when the registration of the same ``source``
+    is executed again. Failed requests are retried here, not by the session.
 
-    # max number of items for add items should is 500 (by default)
-    for chunked_items in _chunked(items, DATASET_CHUNK_SIZE):
-        api_post(url, json.dumps(chunked_items))
+    :param dataset_id:
+    :param items: iterable of dataset items
+    :param checkpoint_path: path to the checkpoint file to resume registration
+    :param max_workers: number of concurrent requests
+    :param source: parameters which identify the items, e.g. the channel and the filter options
+    :return: number of dataset items
+    """
+    url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, dataset_id)
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = RegisterCheckpoint(
+            checkpoint_path, dataset_id, DATASET_CHUNK_SIZE, source)
+
+    local = threading.local()
+
+    def _register(index, chunked_items):
+        if not hasattr(local, 'session'):
+            local.session = generate_user_session(retry=False)
+        _post_dataset_items(local.session, url, chunked_items)
+        if checkpoint:
+            checkpoint.complete(index, chunked_items)
+
+    def _wait(futures, return_when):
+        done, not_done = concurrent.futures.wait(
+            futures, return_when=return_when)
+        for future in done:
+            # raise the first error to abort registration
+            future.result()
+        return not_done
+
+    item_count = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = set()
+            try:
+                # max number of items for add items should is 500 (by default)
+                for index, chunked_items in enumerate(_chunked(items, DATASET_CHUNK_SIZE)):
+                    item_count += len(chunked_items)
+                    if checkpoint and checkpoint.is_completed(index, chunked_items):
+                        continue
+                    # bound the number of chunks held in memory
+                    if len(futures) >= max_workers * 2:
+                        futures = _wait(
+                            futures, concurrent.futures.FIRST_COMPLETED)
+                    futures.add(executor.submit(_register, index, chunked_items))
+                _wait(futures, concurrent.futures.ALL_COMPLETED)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    if checkpoint:
+        checkpoint.remove()
+    return item_count
 
 
 def register_dataset_items_from_datalake(
-    dataset_id, channel_id, property_metadata_keys, category_id, _type, max_size_for_label
+    dataset_id, channel_id, property_metadata_keys, category_id, _type, max_size_for_label,
+    checkpoint_path=None
 ):
     """
     register datasets from datalake channel
@@ -111,28 +209,40 @@ def register_dataset_items_from_datalake(
     :param category_id: category_id of dataset item to register
     :param _type: type of dataset item like classification.
     :param max_size_for_label: max size of dataset items for each label value
+    :param checkpoint_path: path to the checkpoint file to resume registration
     :return:
     """
-    print('Getting data from datalake....')
-    file_iter = generate_channel_file_iter_by_period(channel_id)
-    dataset_items = [
+    # listing, transforming, filtering and registering are pipelined,
+    # so that items are never materialized all at once.
+    print('Registering dataset items from datalake....')
+    file_iter = prefetch_iter(
+        generate_channel_file_iter_by_period(channel_id), DATALAKE_ITEMS_PER_PAGE)
+    dataset_items = (
         create_request_element(channel_id, file_info, property_metadata_keys, category_id, _type)
         for file_info in file_iter
-    ]
-    print('Registering dataset items....')
+    )
     if max_size_for_label:
-        dataset_items = filter_items_by_max_size(
+        dataset_items = iter_items_by_max_size(
             dataset_items, max_size_for_label)
-    register_dataset_items(dataset_id, dataset_items)
+    source = {
+        'channel_id': channel_id,
+        'property_metadata_keys': list(property_metadata_keys or []),
+        'category_id': category_id,
+        'type': _type,
+        'max_size_for_label': max_size_for_label
+    }
+    item_count = register_dataset_items(
+        dataset_id, dataset_items, checkpoint_path, source=source)
     return {
         'result': 'success',
-        'dataset_items': len(dataset_items),
+        'dataset_items': item_count,
         'dataset_id': dataset_id,
         'channel_id': channel_id
     }
 
 
-def import_dataset_from_datalake(channel_id, dataset_id, property_metadata_keys, category_id, _type, _max):
+def import_dataset_from_datalake(channel_id, dataset_id, property_metadata_keys, category_id, _type, _max,
+                                 checkpoint_path=None):
     return register_dataset_items_from_datalake(
-        dataset_id, channel_id, property_metadata_keys, category_id, _type, _max
+        dataset_id, channel_id, property_metadata_keys, category_id, _type, _max, checkpoint_path
     )
@@ -0,0 +1,177 @@
+import concurrent.futures
+import json
+import os
+import threading
+
+import requests
+from retrying import retry
+from ruamel.yaml import YAML
+
+from abejacli.config import (
+    DATASET_REGISTER_RETRY_ATTEMPT_NUMBER,
+    DATASET_REGISTER_WORKER_NUM,
+    ORGANIZATION_ENDPOINT,
+    PLATFORM_REQUEST_TIMEOUT_SECONDS
+)
+from abejacli.logger import get_logger
+from abejacli.rate_limiter import RateLimiter
+from abejacli.session import generate_user_session, is_retryable_error
+
+logger = get_logger()
+yaml = YAML()
+
+BULK_CREATE = 'create'
+BULK_UPDATE = 'update'
+BULK_DELETE = 'delete'
+
+PAYLOAD_FILE_EXTENSIONS = ['.jsonl', '.json', '.yml', '.yaml']
+
+
+class InvalidBulkPayload(Exception):
+    pass
+
+
+def iter_bulk_payloads(payload_file):
+    """
+    iterate payloads from a json lines, json or yaml file.
+    json lines are read line by line, so the whole file is never loaded.
+    a json file or a yaml document must be a list of payloads, and a yaml file can
+    contain multiple documents.
+
+    :param payload_file: file object of payloads
+    :return:
+    """
+    ext = os.path.splitext(payload_file.name)[-1]
+    if ext == '.jsonl':
+        for line in payload_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    elif ext == '.json':
+        payloads = json.load(payload_file)
+        if isinstance(payloads, list):
+            yield from payloads
+        else:
+            yield payloads
+    elif ext in ['.yml', '.yaml']:
+        for payloads in yaml.load_all(payload_file):
+            if isinstance(payloads, list):
+                yield from payloads
+            elif payloads is not None:
+                yield payloads
+    else:
+        raise InvalidBulkPayload(
+            'Invalid payload file format. {} is acceptable'.format(' '.join(PAYLOAD_FILE_EXTENSIONS)))
+
+
+@retry(stop_max_attempt_number=DATASET_REGISTER_RETRY_ATTEMPT_NUMBER,
+       wait_exponential_multiplier=1000, wait_exponential_max=30000,
+       retry_on_exception=is_retryable_error)
+def _request_dataset_item(session, method, url, payload, limiter=None):
+    # every attempt including retries is rate limited
+    if limiter is not None:
+        limiter.acquire()
+    data = json.dumps(payload) if payload is not None else None
+    r = session.request(method, url, data=data,
+                        timeout=PLATFORM_REQUEST_TIMEOUT_SECONDS)
+    r.raise_for_status()
+    return r
+
+
+def _build_request(dataset_id, operation, payload):
+    base_url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, dataset_id)
+    if operation == BULK_CREATE:
+        return 'POST', base_url, None, payload
+
+    # update and delete require the target dataset item
+    if not isinstance(payload, dict) or payload.get('dataset_item_id') is None:
+        raise InvalidBulkPayload('dataset_item_id is required to {}'.format(operation))
+    payload = dict(payload)
+    dataset_item_id = str(payload.pop('dataset_item_id'))
+    url = '{}/{}'.format(base_url, dataset_item_id)
+    if operation == BULK_UPDATE:
+        return 'PUT', url, dataset_item_id, payload
+    return 'DELETE', url, dataset_item_id, None
+
+
+def bulk_process_dataset_items(dataset_id, operation, payloads, manifest_file=None,
+                               max_workers=DATASET_REGISTER_WORKER_NUM, rate_limit=None):
+    """
+    create, update or delete dataset items concurrently
+
+    :param dataset_id: target dataset id
+    :param operation: one of ``create``, ``update`` or ``delete``
+    :param payloads: iterable of payloads. payloads to update or delete must have ``dataset_item_id``.
+    :param manifest_file: file object to write the result of each payload as a json line
+    :param max_workers: number of concurrent requests
+    :param rate_limit: max number of requests per second
+    :return: summary of results
+    """
+    limiter = RateLimiter(rate_limit)
+    local = threading.local()
+    summary = {
+        'operation': operation,
+        'dataset_id': dataset_id,
+        'success': 0,
+        'error': 0
+    }
+
+    def _process(index, payload):
+        result = {'index': index, 'operation': operation}
+        try:
+            method, url, dataset_item_id, data = _build_request(
+                dataset_id, operation, payload)
+            if dataset_item_id:
+                result['dataset_item_id'] = dataset_item_id
+            if not hasattr(local, 'session'):
+                # requests are retried by _request_dataset_item, not by the session
+                local.session = generate_user_session(retry=False)
+            r = _request_dataset_item(local.session, method, url, data, limiter)
+            result['status'] = 'success'
+            result['status_code'] = r.status_code
+            if operation == BULK_CREATE:
+                try:
+                    result['dataset_item_id'] = r.json().get('dataset_item_id')
+                except ValueError:
+                    pass
+        except Exception as e:
+            result['status'] = 'error'
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                result['status_code'] = e.response.status_code
+            result['error'] = str(e)
+        return result
+
+    def _collect(futures, return_when):
+        done, not_done = concurrent.futures.wait(
+            futures, return_when=return_when)
+        for future in done:
+            result = future.result()
+            summary[result['status']] += 1
+            if result['status'] == 'error':
+                logger.error('failed to {} dataset item at index {}: {}'.format(
+                    operation, result['index'], result['error']))
+            if manifest_file:
+                manifest_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        return not_done
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = set()
+        submitted = 0
+        try:
+            for index, payload in enumerate(payloads):
+                # bound the number of payloads held in memory
+                if len(futures) >= max_workers * 2:
+                    futures = _collect(futures, concurrent.futures.FIRST_COMPLETED)
+                futures.add(executor.submit(_process, index, payload))
+                submitted += 1
+        except Exception as e:
+            # record the requests already sent and the payload which could not be read,
+            # so that a rerun can tell which payloads were applied
+            _collect(futures, concurrent.futures.ALL_COMPLETED)
+            if manifest_file:
+                result = {'index': submitted, 'operation': operation, 'status': 'error', 'error': str(e)}
+                manifest_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            raise
+        _collect(futures, concurrent.futures.ALL_COMPLETED)
+
+    return summary
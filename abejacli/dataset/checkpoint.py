@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+
+from abejacli.logger import get_logger
+
+logger = get_logger()
+
+
+def chunk_digest(chunked_items):
+    """
+    return the digest of data uris of dataset items in the chunk
+
+    :param chunked_items: list of dataset items
+    :return: hex digest
+    """
+    data_uris = [
+        [source_data.get('data_uri') for source_data in item.get('source_data', [])]
+        for item in chunked_items
+    ]
+    return hashlib.sha256(json.dumps(data_uris).encode('utf-8')).hexdigest()
+
+
+class RegisterCheckpoint(object):
+    """
+    Records which chunks of dataset items have been acknowledged by the API,
+    so that an interrupted registration can be resumed without posting the
+    same items twice.
+
+    The checkpoint is only resumed by the registration of the same source, e.g.
+    the channel and the filter options. Each chunk is recorded with the digest
+    of its data uris, so that a chunk whose items have changed since then is
+    registered again. The first line of the checkpoint file is a json header,
+    and a line of the index and the digest is appended for each chunk::
+
+        {"dataset_id": "1", "chunk_size": 500, "source": {"channel_id": "1230000000000"}}
+        0 <digest>
+        1 <digest>
+    """
+
+    def __init__(self, path, dataset_id, chunk_size, source=None):
+        self.path = path
+        self.dataset_id = str(dataset_id)
+        self.chunk_size = chunk_size
+        self.source = source or {}
+        self._completed = {}
+        self._resumed = False
+        self._broken_tail = False
+        self._file = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+            if not isinstance(header, dict):
+                header = {}
+            identity = (header.get('dataset_id'), header.get('chunk_size'), header.get('source', {}))
+            if identity != (self.dataset_id, self.chunk_size, self.source):
+                logger.warning(
+                    'checkpoint {} was recorded for another registration. ignore it'.format(self.path))
+                return
+            for line in f:
+                # the last line may be broken by an interruption
+                self._broken_tail = not line.endswith('\n')
+                fields = line.split()
+                if len(fields) != 2 or not fields[0].isdigit():
+                    continue
+                self._completed[int(fields[0])] = fields[1]
+        self._resumed = True
+        logger.info('resume registration: {} chunks are already registered'.format(
+            len(self._completed)))
+
+    def _open(self):
+        if self._resumed:
+            f = open(self.path, 'a')
+            if self._broken_tail:
+                f.write('\n')
+            return f
+        f = open(self.path, 'w')
+        f.write(json.dumps({
+            'dataset_id': self.dataset_id,
+            'chunk_size': self.chunk_size,
+            'source': self.source
+        }) + '\n')
+        return f
+
+    def is_completed(self, index, chunked_items):
+        """
+        return True if the same chunk has been acknowledged
+
+        :param index: index of the chunk
+        :param chunked_items: list of dataset items in the chunk
+        """
+        digest = self._completed.get(index)
+        return digest is not None and digest == chunk_digest(chunked_items)
+
+    def complete(self, index, chunked_items):
+        """
+        mark the chunk as acknowledged and append it to the checkpoint file
+
+        :param index: index of the chunk
+        :param chunked_items: list of dataset items in the chunk
+        """
+        digest = chunk_digest(chunked_items)
+        with self._lock:
+            self._completed[index] = digest
+            if self._file is None:
+                self._file = self._open()
+            self._file.write('{} {}\n'.format(index, digest))
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -5,10 +5,22 @@ import sys
 import click
 from ruamel.yaml import YAML
 
-from abejacli.common import json_output_formatter
-from abejacli.config import ERROR_EXITCODE, ORGANIZATION_ENDPOINT
+from abejacli.common import get_output_format, json_output_formatter
+from abejacli.config import (
+    DATASET_REGISTER_WORKER_NUM,
+    ERROR_EXITCODE,
+    ORGANIZATION_ENDPOINT
+)
 from abejacli.configuration import __ensure_configuration_exists
 from abejacli.dataset import import_dataset_from_datalake
+from abejacli.dataset.bulk import (
+    BULK_CREATE,
+    BULK_DELETE,
+    BULK_UPDATE,
+    bulk_process_dataset_items,
+    iter_bulk_payloads
+)
+from abejacli.iter_utils import prefetch_iter
 from abejacli.logger import get_logger
 from abejacli.session import api_delete, api_get, api_post, api_put
 
@@ -76,9 +88,8 @@ def describe_datasets(dataset_id):
     click.echo(json_output_formatter(r))
 
 
-def _get_all_dataset_items(base_url, q):
+def _iter_dataset_item_pages(base_url, q):
     next_page_token = None
-    items = []
     while True:
         if q is not None and next_page_token is None:
             url = "{}?q={}".format(base_url, q)
@@ -87,15 +98,29 @@ def _get_all_dataset_items(base_url, q):
         else:
             url = base_url
         r = api_get(url)
-        items += r['items']
+        yield r
         if r['next_page_token'] is None:
-            return {
-                "items": items,
-                "total_count": r['total_count']
-            }
+            return
         next_page_token = r['next_page_token']
 
 
+def _get_all_dataset_items(base_url, q):
+    items = []
+    for r in _iter_dataset_item_pages(base_url, q):
+        items += r['items']
+    return {
+        "items": items,
+        "total_count": r['total_count']
+    }
+
+
+def _echo_all_dataset_items_as_jsonl(base_url, q):
+    # fetch the next page while writing items of the current page
+    for r in prefetch_iter(_iter_dataset_item_pages(base_url, q)):
+        for item in r['items']:
+            click.echo(json.dumps(item, ensure_ascii=False))
+
+
 @dataset.command(name='describe-dataset-items', help='Describe dataset items')
 @click.option('-d', '--dataset_id', '--dataset-id', 'dataset_id', type=str,
               help='Dataset id', required=True)
@@ -103,17 +128,28 @@ def _get_all_dataset_items(base_url, q):
               help='Dataset item id', default=None, required=False)
 @click.option('-q', 'q', type=str,
               help='query to filter the result. i.e. q=label_id:1 AND tag:v1', default=None, required=False)
-def describe_dataset_items(dataset_id, dataset_item_id, q):
+@click.option('--format', 'output_format', type=click.Choice(['json', 'jsonl']),
+              help='Output format. `jsonl` writes each dataset item as a line as soon as its page is fetched, '
+                   'which is suitable for large datasets', default='json', required=False)
+def describe_dataset_items(dataset_id, dataset_item_id, q, output_format):
+    if get_output_format() == 'jsonl':
+        output_format = 'jsonl'
     if dataset_item_id and q:
         click.echo('describe-dataset-items failed: q cannot be specified when dataset-item-id is specified')
         sys.exit(ERROR_EXITCODE)
     try:
         if dataset_item_id is None:
             url = "{}/datasets/{}/items".format(ORGANIZATION_ENDPOINT, dataset_id)
+            if output_format == 'jsonl':
+                _echo_all_dataset_items_as_jsonl(url, q)
+                return
             res = _get_all_dataset_items(url, q)
         else:
             url = "{}/datasets/{}/items/{}".format(ORGANIZATION_ENDPOINT, dataset_id, dataset_item_id)
             res = api_get(url)
+            if output_format == 'jsonl':
+                click.echo(json.dumps(res, ensure_ascii=False))
+                return
     except Exception as e:
         logger.error('describe-dataset-items failed: {}'.format(e))
         click.echo('describe-dataset-items failed.')
@@ -185,6 +221,65 @@ def update_dataset_item(dataset_id, dataset_item_id, _payload):
     click.echo(json_output_formatter(r))
 
 
+def _bulk_dataset_items(command_name, dataset_id, operation, _payload, manifest, concurrency, rate_limit):
+    try:
+        r = bulk_process_dataset_items(
+            dataset_id, operation, iter_bulk_payloads(_payload),
+            manifest_file=manifest, max_workers=concurrency, rate_limit=rate_limit)
+    except Exception as e:
+        logger.error('{} failed: {}'.format(command_name, e))
+        click.echo('{} failed.'.format(command_name))
+        sys.exit(ERROR_EXITCODE)
+    click.echo(json_output_formatter(r))
+    if r['error']:
+        sys.exit(ERROR_EXITCODE)
+
+
+def _bulk_options(f):
+    f = click.option('--rate-limit', 'rate_limit', type=click.FloatRange(min=0), required=False, default=None,
+                     help='Max number of requests per second including retries. 0 means no limit')(f)
+    f = click.option('--concurrency', 'concurrency', type=click.IntRange(min=1), required=False,
+                     default=DATASET_REGISTER_WORKER_NUM, help='Number of concurrent requests')(f)
+    f = click.option('-m', '--manifest', 'manifest', type=click.File('w'), required=False, default=None,
+                     help='Path to the json lines file to write the result of each payload')(f)
+    f = click.option('-p', '--payload', '_payload', type=click.File('r'), required=True,
+                     help='Path to the jsonl, json or yaml file of payloads')(f)
+    f = click.option('-d', '--dataset_id', '--dataset-id', 'dataset_id', type=str,
+                     help='Dataset id', required=True)(f)
+    return f
+
+
+@dataset.command(name='bulk-create-dataset-items')
+@_bulk_options
+def bulk_create_dataset_items(dataset_id, _payload, manifest, concurrency, rate_limit):
+    """Create dataset items in bulk.
+    Each line of a .jsonl file (or each element of a list in .json/.yaml file)
+    is a payload of `create-dataset-item`.
+    """
+    _bulk_dataset_items('bulk-create-dataset-items', dataset_id, BULK_CREATE,
+                        _payload, manifest, concurrency, rate_limit)
+
+
+@dataset.command(name='bulk-update-dataset-items')
+@_bulk_options
+def bulk_update_dataset_items(dataset_id, _payload, manifest, concurrency, rate_limit):
+    """Update dataset items in bulk.
+    Each payload is a payload of `update-dataset-item` with `dataset_item_id` of the target item.
+    """
+    _bulk_dataset_items('bulk-update-dataset-items', dataset_id, BULK_UPDATE,
+                        _payload, manifest, concurrency, rate_limit)
+
+
+@dataset.command(name='bulk-delete-dataset-items')
+@_bulk_options
+def bulk_delete_dataset_items(dataset_id, _payload, manifest, concurrency, rate_limit):
+    """Delete dataset items in bulk.
+    Each payload is an object with `dataset_item_id` of the target item.
+    """
+    _bulk_dataset_items('bulk-delete-dataset-items', dataset_id, BULK_DELETE,
+                        _payload, manifest, concurrency, rate_limit)
+
+
 @dataset.command(name='import-from-datalake')
 @click.option('-c', '--channel_id', '--channel-id', 'channel_id', type=str, help='DataLake channel id', required=True)
 @click.option('-d', '--dataset_id', '--dataset-id', 'dataset_id', type=str, help='Dataset id', required=True)
@@ -196,7 +291,11 @@ def update_dataset_item(dataset_id, dataset_item_id, _payload):
 @click.option('--type', '_type', type=str, help='dataset type. default is classification', default="classification")
 @click.option('--max-size-for-label', '_max', type=int, required=False,
               help='Max number of items for each labels that is uploaded to dataset API', default=None)
-def dataset_import_from_datalake(channel_id, dataset_id, property_metadata_keys, category_id, _type, _max):
+@click.option('--checkpoint', 'checkpoint_path', type=click.Path(dir_okay=False), required=False,
+              help='Path to the checkpoint file. Registered chunks are recorded there, '
+                   'and skipped when the same import is executed again', default=None)
+def dataset_import_from_datalake(channel_id, dataset_id, property_metadata_keys, category_id, _type, _max,
+                                 checkpoint_path):
     """Imports dataset items from datalake.
     You can import dataset items from a datalake channel with properties.
     You have to prepare a datalake channel that has files you want to use as dataset.
@@ -204,11 +303,12 @@ def dataset_import_from_datalake(channel_id, dataset_id, property_metadata_keys,
     For example, `cat00001.jpg` with `x-abeja-meta-label:cat`
     and `x-abeja-meta-label_id:1` is registered to a dataset with label `cat` and label_id 1.
     You can specify the multiple metadata names for properties with `--property-metadata-key` option.
+    If `--checkpoint` is specified, a failed import can be resumed from the registered items.
     """
     try:
         r = import_dataset_from_datalake(
             channel_id, dataset_id, property_metadata_keys,
-            category_id, _type, _max
+            category_id, _type, _max, checkpoint_path
         )
     except Exception as e:
         logger.exception(e)
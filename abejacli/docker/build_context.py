@@ -0,0 +1,63 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterable, Iterator, List
+
+from abejacli.common.archive import write_build_context
+from abejacli.config import DEFAULT_EXCLUDE_FILES
+
+DOCKERIGNORE = '.dockerignore'
+# name of the generated Dockerfile in the build context not to conflict with user's one
+BUILD_DOCKERFILE_NAME = '.abeja.Dockerfile'
+# files copied before the source files to install dependencies in a cached layer
+DEPENDENCY_MANIFESTS = ('requirements.txt',)
+
+
+def read_dockerignore(root_dir: str = os.curdir) -> List[str]:
+    """
+    return patterns of `.dockerignore` in the directory, which are relative to the
+    directory as docker does, e.g. `*.csv` excludes csv files only at the top level.
+    blank lines and comments are skipped.
+    """
+    patterns = []
+    try:
+        with open(os.path.join(root_dir, DOCKERIGNORE), 'r') as f:
+            for line in f:
+                pattern = line.strip()
+                if not pattern or pattern.startswith('#'):
+                    continue
+                prefix = ''
+                if pattern.startswith('!'):
+                    prefix, pattern = '!', pattern[1:].strip()
+                while pattern.startswith('./'):
+                    pattern = pattern[2:]
+                pattern = pattern.lstrip('/')
+                if pattern:
+                    patterns.append('{}/{}'.format(prefix, pattern))
+    except FileNotFoundError:
+        pass
+    return patterns
+
+
+def build_context_exclude_patterns(patterns: Iterable[str] = (), root_dir: str = os.curdir) -> List[str]:
+    """
+    return patterns to exclude from the build context, which are the same as the
+    source archive of a training version (`DEFAULT_EXCLUDE_FILES` and `ignores`
+    in training.yaml given as ``patterns``) with `.dockerignore` if it exists.
+    dependency manifests are always included because Dockerfile copies them.
+    """
+    exclude_patterns = list(DEFAULT_EXCLUDE_FILES) + list(patterns) + read_dockerignore(root_dir)
+    exclude_patterns.extend('!/{}'.format(name) for name in DEPENDENCY_MANIFESTS)
+    return exclude_patterns
+
+
+@contextmanager
+def build_context(dockerfile: str, exclude_patterns: Iterable[str], root_dir: str = os.curdir) -> Iterator[IO]:
+    """
+    yield a temporary file of the build context which contains the filtered
+    source files and the Dockerfile named ``BUILD_DOCKERFILE_NAME``.
+    """
+    with tempfile.TemporaryFile() as f:
+        write_build_context(f, dockerfile, BUILD_DOCKERFILE_NAME, exclude_patterns, root_dir)
+        f.seek(0)
+        yield f
@@ -119,7 +119,8 @@ class RunCommand:
             environment: List[str] = None, volumes: dict = None, ports: dict = None,
             command: List[str] = None, remove: bool = True, detach: bool = True,
             privileged: bool = False,
-            stderr: bool = True, runtime: str = None) -> None:
+            stderr: bool = True, runtime: str = None, labels: dict = None,
+            cpus: float = None, memory: str = None) -> None:
         self.image = image
         self.working_dir = working_dir
         self.environment = environment
@@ -133,6 +134,9 @@ class RunCommand:
         self.stderr = stderr
         self.runtime = runtime
         self.privileged = privileged
+        self.labels = labels
+        self.cpus = cpus
+        self.memory = memory
 
     def get_port(self) -> Optional[dict]:
         ports = list(self.ports.values())
@@ -159,6 +163,12 @@ class RunCommand:
             d['runtime'] = self.runtime
         if self.privileged:
             d['privileged'] = self.privileged
+        if self.labels:
+            d['labels'] = self.labels
+        if self.cpus:
+            d['nano_cpus'] = int(self.cpus * 1e9)
+        if self.memory:
+            d['mem_limit'] = self.memory
         return d
 
 
@@ -169,7 +179,7 @@ class TrainRunCommand(RunCommand):
             runtime: str = None, env_vars: dict = None, volume: dict = None,
             platform_user_id: str = None, platform_personal_access_token: str = None,
             platform_organization_id: str = None, command: list = None,
-            remove=True) -> 'TrainRunCommand':
+            remove=True, cpus: float = None, memory: str = None) -> 'TrainRunCommand':
         if volume is None:
             volume = {}
 
@@ -199,7 +209,8 @@ class TrainRunCommand(RunCommand):
 
         return TrainRunCommand(
             image=image, working_dir=DEFAULT_WORKING_DIR, environment=environment,
-            command=command, volumes=volume, runtime=runtime, remove=remove)
+            command=command, volumes=volume, runtime=runtime, remove=remove,
+            cpus=cpus, memory=memory)
 
 
 class ModelRunCommand(RunCommand):
@@ -1,31 +1,40 @@
 import json
 import os
-import tempfile
 from abc import abstractmethod
-from typing import Generator, Optional
+from typing import Generator, Iterable, Optional
 
 import docker
 from docker.models.images import Image
 
+from abejacli.docker.build_context import (
+    BUILD_DOCKERFILE_NAME,
+    build_context,
+    build_context_exclude_patterns
+)
+from abejacli.docker.image_cache import LOCAL_IMAGE_KEY, ImageCache
 from abejacli.docker.utils import check_docker_installation, parse_image
-from abejacli.model import md5digest, md5file
 from abejacli.model.docker_handler import (
     BUILT_IMAGE_SUFFIX,
-    DOCKERFILE_RUN_LOCAL_TEMPLATE
+    generate_run_dockerfile
 )
-from abejacli.task import Run
+from abejacli.task import ClickLogger, Run
 
-REQUIREMENTS_TXT = 'requirements.txt'
-PIPFILE = 'Pipfile'
 LOCAL_MODEL_TYPE_KEY = 'abeja-platform-model-type'
-LOCAL_MODEL_IMAGE_MD5_KEY = 'abeja-platform-image-md5'
+
+PULL_POLICY_ALWAYS = 'always'
+PULL_POLICY_IF_NOT_PRESENT = 'if-not-present'
+PULL_POLICY_NEVER = 'never'
+PULL_POLICIES = (PULL_POLICY_ALWAYS, PULL_POLICY_IF_NOT_PRESENT, PULL_POLICY_NEVER)
+# statuses of a layer which needs no more download
+PULL_LAYER_DONE_STATUSES = ('Pull complete', 'Already exists')
 
 
 class ContainerRun(Run):
     def __init__(
             self, handler, image, organization_id, datasets, environment, volume, no_cache,
             runtime=None, stdout=None, build_only=False, quiet=False,
-            remove=True, platform_user_id=None, platform_personal_access_token=None):
+            remove=True, platform_user_id=None, platform_personal_access_token=None,
+            pull_policy=PULL_POLICY_ALWAYS):
         self.handler = handler
         self.image_name = image
         self.organization_id = organization_id
@@ -37,6 +46,7 @@ class ContainerRun(Run):
         self.stdout = stdout    # click.echo
         self.build_only = build_only
         self.remove = remove
+        self.pull_policy = pull_policy
 
         self.platform_user_id = platform_user_id
         self.platform_personal_access_token = platform_personal_access_token
@@ -56,14 +66,9 @@ class ContainerRun(Run):
         self._prepare_command()
 
     def _prepare_image(self):
-        """prepare docker image"""
-        for line in self._docker_cli.pull(self.image_name, stream=True, decode=True):
-            out = line.get('status', '')
-            if line.get('progress'):
-                out += ' ' + line['progress']
-            if out:
-                self.logger.raw(out)
-        self.image = self._client.images.pull(self.image_name)
+        """prepare docker image according to the pull policy"""
+        self.image = prepare_image(
+            self._client, self._docker_cli, self.image_name, self.pull_policy, self.logger)
 
     @abstractmethod
     def _prepare_command(self):
@@ -144,9 +149,60 @@ class ContainerRun(Run):
             raise RuntimeError('failed to create local runtime')
 
 
+def _find_local_image(client: docker.DockerClient, image_name: str) -> Optional[Image]:
+    try:
+        return client.images.get(image_name)
+    except docker.errors.ImageNotFound:
+        return None
+
+
+def prepare_image(client: docker.DockerClient, docker_cli: docker.APIClient, image_name: str,
+                  pull_policy: str, logger: ClickLogger) -> Image:
+    """
+    return the image, pulling it according to ``pull_policy``
+    """
+    local_image = _find_local_image(client, image_name)
+    if pull_policy == PULL_POLICY_NEVER:
+        if local_image is None:
+            raise RuntimeError('image {} does not exist locally'.format(image_name))
+        return local_image
+    if pull_policy == PULL_POLICY_IF_NOT_PRESENT and local_image is not None:
+        return local_image
+
+    # the registry is asked only for the manifest if the local image is current
+    for out in _pull_progress(docker_cli.pull(image_name, stream=True, decode=True)):
+        logger.raw(out)
+    image = client.images.get(image_name)
+    if local_image is not None and local_image.id == image.id:
+        logger.info('image is up to date: {}'.format(image_name))
+    return image
+
+
 def _generate_run_dockerfile(image: str, tag: str) -> str:
-    from_image = '{}:{}'.format(image, tag)
-    return DOCKERFILE_RUN_LOCAL_TEMPLATE.format(IMAGE=from_image)
+    return generate_run_dockerfile('{}:{}'.format(image, tag))
+
+
+def _pull_progress(lines: Iterable[dict]) -> Generator[str, None, None]:
+    """
+    render the output of `docker pull` compactly: messages of the image as they are,
+    and the number of ready layers each time a layer is done instead of progress bars.
+    """
+    layers = {}
+    for line in lines:
+        if 'error' in line:
+            raise RuntimeError('failed to pull image: {}'.format(line['error']))
+        status = line.get('status', '')
+        if 'progressDetail' not in line:
+            # not a layer, e.g. "Pulling from ...", "Digest: ..." and "Status: ..."
+            if status:
+                yield status
+            continue
+        layer_id = line.get('id')
+        done = status in PULL_LAYER_DONE_STATUSES
+        if layers.get(layer_id) != done:
+            layers[layer_id] = done
+            if done:
+                yield '{}/{} layers ready'.format(sum(layers.values()), len(layers))
 
 
 def _parse_stream(output) -> Generator[dict, None, None]:
@@ -156,8 +212,10 @@ def _parse_stream(output) -> Generator[dict, None, None]:
 
 
 class ContainerBuildAndRun(ContainerRun):
-    def __init__(self, image_type, *args, **kwargs):
+    def __init__(self, image_type, *args, exclude_patterns=None, **kwargs):
         self.image_type = image_type
+        # patterns of files not to send to docker daemon, e.g. `ignores` in training.yaml
+        self.exclude_patterns = exclude_patterns or []
         super().__init__(*args, **kwargs)
 
     def _prepare_image(self):
@@ -170,52 +228,36 @@ class ContainerBuildAndRun(ContainerRun):
 
     def _find_or_build_image(self) -> Image:
         """build docker image adding label to be able to find it"""
-        no_cache = self.no_cache
-        if not no_cache:
-            # when rebuild is required, don't use cache
-            no_cache = self._check_rebuild_required()
+        image_cache = ImageCache(self._client)
+        key = self._image_key(image_cache)
 
         # skip build if use cache is enabled and built image exists.
-        built_image = self._find_built_image()
-        if built_image and not no_cache:
-            return built_image
+        if not self.no_cache:
+            built_image = image_cache.find(key)
+            if built_image:
+                return built_image
 
         self.logger.info("building image")
         try:
-            self._build_image()
+            self._build_image(key)
         except Exception:
             self.logger.error("failed to build image")
             raise RuntimeError("failed to build image")
-        built_image = self._find_built_image()
+        built_image = image_cache.find(key)
         if built_image is None:
             raise RuntimeError("failed to find built image")
         return built_image
 
-    def _check_rebuild_required(self) -> bool:
+    def _image_key(self, image_cache: ImageCache) -> str:
         """
-        return true if requirements.txt exists and
-        the last update is later than that of the specified image.
-        target_last_modified and image_last_modified are time in utc.
+        return the key of the image built from the base image,
+        the Dockerfile and the dependency files.
         """
-        image = self._find_built_image()
-        if image is None:
-            return True
-
-        # check md5 of requirements.txt using label
-        prev_md5 = image.labels.get(LOCAL_MODEL_IMAGE_MD5_KEY)
-        if not prev_md5 or prev_md5 != self._calc_md5():
-            return True
-        return False
-
-    def _find_built_image(self) -> Optional[Image]:
-        images = self._client.images.list(
-            filters={'label': LOCAL_MODEL_TYPE_KEY})
-        if not images:
-            return None
-        # pick the first because images is descending order list
-        return images[0]
+        image_name, image_tag = parse_image(self.image_name)
+        dockerfile = _generate_run_dockerfile(image_name, image_tag)
+        return image_cache.key(self.image_name, dockerfile, self.image_type)
 
-    def _build_image(self) -> None:
+    def _build_image(self, key: str) -> None:
         # ex. abeja/platform-minimal/0.1.0/local-inference-model
         try:
             image_name, image_tag = parse_image(self.image_name)
@@ -228,23 +270,15 @@ class ContainerBuildAndRun(ContainerRun):
 
         dockerfile = _generate_run_dockerfile(image_name, image_tag)
 
-        with tempfile.NamedTemporaryFile(mode='w+t') as f:
-            f.write(dockerfile)
-            f.seek(0)  # put file pointer back the initial position for being read
-            image_md5 = self._calc_md5()
-            labels = {
-                LOCAL_MODEL_TYPE_KEY: self.image_type,
-                LOCAL_MODEL_IMAGE_MD5_KEY: image_md5
-            }
-            for output in self._docker_cli.build(tag=name, dockerfile=f.name, path=os.getcwd(), labels=labels):
+        labels = {
+            LOCAL_MODEL_TYPE_KEY: self.image_type,
+            LOCAL_IMAGE_KEY: key
+        }
+        with build_context(dockerfile, build_context_exclude_patterns(self.exclude_patterns)) as context:
+            for output in self._docker_cli.build(tag=name, fileobj=context, custom_context=True,
+                                                 dockerfile=BUILD_DOCKERFILE_NAME, labels=labels):
                 self._stdout_build_output(output)
 
-    def _calc_md5(self):
-        requirements_md5 = md5file(REQUIREMENTS_TXT) if os.path.exists(REQUIREMENTS_TXT) else ''
-        pipfile_md5 = md5file(PIPFILE) if os.path.exists(PIPFILE) else ''
-        image_name_md5 = md5digest(self.image_name.encode('utf-8'))
-        return md5digest((requirements_md5 + pipfile_md5 + image_name_md5).encode('utf-8'))
-
     def _stdout_build_output(self, output):
         if not self.stdout:
             return
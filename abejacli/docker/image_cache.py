@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+from typing import Iterable, Optional
+
+import docker
+from docker.models.images import Image
+
+from abejacli.common.snapshot import (
+    FileHashCache,
+    file_digest,
+    load_json,
+    save_json
+)
+from abejacli.config import BUILT_IMAGE_INDEX_PATH
+from abejacli.docker.utils import parse_image
+
+LOCAL_IMAGE_KEY = 'abeja-platform-image-key'
+# files which change the installed packages of a built image
+DEPENDENCY_FILES = ('requirements.txt', 'Pipfile', 'Pipfile.lock')
+
+
+class ImageCache(object):
+    """
+    Cache of locally built images keyed by what an image is built from:
+    the base image, the Dockerfile and the dependency files.
+
+    A built image has the key as a label, so that only the image built from
+    exactly the same inputs is found. The image id for each key is also recorded
+    in an index file not to search all images.
+    """
+
+    def __init__(self, client: docker.DockerClient, index_path: Optional[str] = None):
+        self._client = client
+        self.index_path = index_path or BUILT_IMAGE_INDEX_PATH
+
+    def key(self, base_image: str, dockerfile: str, image_type: str,
+            files: Iterable[str] = DEPENDENCY_FILES) -> str:
+        """
+        :param base_image: base image name with tag
+        :param dockerfile: content of Dockerfile
+        :param image_type: type of the built image, e.g. inference or train
+        :param files: dependency files in the current directory
+        :return: hex digest
+        """
+        cache = FileHashCache()
+        content = {
+            'base_image': self.base_image_id(base_image),
+            'dockerfile': dockerfile,
+            'image_type': image_type,
+            'files': {name: file_digest(name, cache) if os.path.isfile(name) else None for name in files}
+        }
+        cache.save()
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def base_image_id(self, base_image: str) -> str:
+        """
+        return the id of the base image, which is the digest of its content.
+        the image is pulled if it does not exist yet as `docker build` does.
+        """
+        try:
+            return self._client.images.get(base_image).id
+        except docker.errors.ImageNotFound:
+            name, tag = parse_image(base_image)
+            return self._client.images.pull(name, tag=tag).id
+
+    def find(self, key: str) -> Optional[Image]:
+        image_id = load_json(self.index_path).get(key)
+        if image_id:
+            try:
+                image = self._client.images.get(image_id)
+                if image.labels.get(LOCAL_IMAGE_KEY) == key:
+                    return image
+            except docker.errors.ImageNotFound:
+                pass
+
+        images = self._client.images.list(
+            filters={'label': '{}={}'.format(LOCAL_IMAGE_KEY, key)})
+        if not images:
+            return None
+        # pick the first because images is descending order list
+        self.record(key, images[0])
+        return images[0]
+
+    def record(self, key: str, image: Image):
+        index = load_json(self.index_path)
+        index[key] = image.id
+        save_json(self.index_path, index)
@@ -17,3 +17,7 @@ class ConfigFileNotFoundError(BaseTrainingException):
 
 class ResourceNotFound(Exception):
     pass
+
+
+class InvalidSweepException(BaseTrainingException):
+    pass
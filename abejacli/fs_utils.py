@@ -4,6 +4,7 @@ import os
 import os.path
 import tarfile
 import zipfile
+import zlib
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional
@@ -231,9 +232,45 @@ class TGZFile(CompressedFile):
         return True
 
 
-def get_compressed_file(file_path):
-    for cls in (ZIPFile, TGZFile, TARFile):
-        if cls.is_matched_type(cls, file_path):
-            return cls
+# number of the first bytes to detect the type of compressed file
+COMPRESSED_FILE_HEAD_SIZE = 64 * 1024
+
+
+def _is_tar_header(block: bytes) -> bool:
+    if len(block) < tarfile.BLOCKSIZE:
+        return False
+    try:
+        tarfile.TarInfo.frombuf(block[:tarfile.BLOCKSIZE], 'utf-8', 'surrogateescape')
+    except (tarfile.EmptyHeaderError, tarfile.EOFHeaderError):
+        # an empty archive starts with the end of archive marker
+        return True
+    except tarfile.HeaderError:
+        return False
+    return True
+
 
+def detect_compressed_file(head: bytes):
+    """
+    detect the type of compressed file from the first bytes of it,
+    so that the type of a stream can be detected before it is read to the end.
+
+    :param head: the first ``COMPRESSED_FILE_HEAD_SIZE`` bytes of the file
+    :return: one of ``ZIPFile``, ``TGZFile`` or ``TARFile``, or None if it is unknown
+    """
+    if head.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return ZIPFile
+    if head.startswith(b'\x1f\x8b'):
+        try:
+            block = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head, tarfile.BLOCKSIZE)
+        except zlib.error:
+            return None
+        return TGZFile if _is_tar_header(block) else None
+    if _is_tar_header(head):
+        return TARFile
     return None
+
+
+def get_compressed_file(file_path):
+    with open(file_path, 'rb') as f:
+        head = f.read(COMPRESSED_FILE_HEAD_SIZE)
+    return detect_compressed_file(head)
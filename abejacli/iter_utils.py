@@ -0,0 +1,62 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+_END = object()
+
+
+class _Raised(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch_iter(iterable: Iterable[T], maxsize: int = 1) -> Iterator[T]:
+    """
+    Iterate ``iterable`` in a background thread, so that producing the next
+    items (e.g. fetching the next page from API) overlaps with consuming
+    the current ones. At most ``maxsize`` items are buffered.
+
+    An exception raised by the producer is re-raised to the consumer.
+
+    :param iterable: iterable to prefetch
+    :param maxsize: max number of items to buffer
+    :return: iterator yielding the same items as ``iterable``
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def _put(item):
+        # give up when the consumer stopped iterating
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put(item):
+                    return
+        except Exception as e:
+            _put(_Raised(e))
+            return
+        _put(_END)
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
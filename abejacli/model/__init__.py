@@ -1,10 +1,24 @@
 import hashlib
+from typing import Optional
 
+from abejacli.common.snapshot import FileHashCache, file_digest
 
-def md5file(filename):
-    with open(filename, "rb") as f:
-        content = f.read()
-    return md5digest(content)
+
+def md5file(filename, cache: Optional[FileHashCache] = None) -> str:
+    """
+    return md5 hex digest of the file, which is kept in the persistent file hash cache
+    so that an unchanged file is not read again.
+
+    :param filename: file path
+    :param cache: cache of file digests. the default cache is loaded and saved if not given
+    :return: hex digest
+    """
+    if cache is not None:
+        return file_digest(filename, cache, algorithm='md5')
+    cache = FileHashCache()
+    digest = file_digest(filename, cache, algorithm='md5')
+    cache.save()
+    return digest
 
 
 def md5digest(content: bytes) -> str:
@@ -0,0 +1,186 @@
+import concurrent.futures
+import json
+import math
+import mimetypes
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import requests
+
+from abejacli.logger import get_logger
+
+logger = get_logger()
+
+SUPPORTED_MIMETYPES = ('application/json', 'image/jpeg', 'image/png', 'image/gif')
+JSONL_EXTENSION = '.jsonl'
+
+
+class UnsupportedInputError(Exception):
+    pass
+
+
+def read_input_file(path: str) -> Tuple[Dict[str, str], Any]:
+    """
+    return headers and data to send the file to a model
+
+    :param path: json or image file
+    :raises UnsupportedInputError: if the file format is not supported
+    """
+    mimetype, _ = mimetypes.guess_type(path)
+    if mimetype not in SUPPORTED_MIMETYPES:
+        raise UnsupportedInputError('not supported file format: {}'.format(path))
+
+    if mimetype == 'application/json':
+        with open(path, 'r') as f:
+            data = json.dumps(json.load(f))
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+    return {'Content-Type': mimetype}, data
+
+
+def is_batch_input(path: str) -> bool:
+    return os.path.isdir(path) or path.endswith(JSONL_EXTENSION)
+
+
+def iter_batch_inputs(path: str) -> Iterator[Tuple[str, Dict[str, str], Any]]:
+    """
+    iterate name, headers and data of each request in the batch input.
+
+    A directory yields each supported file in it (recursively, in sorted order),
+    and a JSONL manifest yields each non-empty line as a JSON body.
+    """
+    if os.path.isdir(path):
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                file_path = os.path.join(dir_path, file_name)
+                try:
+                    headers, data = read_input_file(file_path)
+                except UnsupportedInputError:
+                    logger.debug('skip unsupported file: {}'.format(file_path))
+                    continue
+                yield os.path.relpath(file_path, path), headers, data
+        return
+
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                body = json.loads(line)
+            except ValueError:
+                raise UnsupportedInputError('invalid json at line {} of {}'.format(line_no, path))
+            yield '{}:{}'.format(path, line_no), {'Content-Type': 'application/json'}, json.dumps(body)
+
+
+class BatchInputs(object):
+    """
+    Re-iterable inputs of a batch, which are read lazily by ``iter_batch_inputs``
+    every time they are iterated, e.g. to send them in turn repeatedly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, str], Any]]:
+        return iter_batch_inputs(self.path)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    # nearest-rank method
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """
+    return statistics of latencies in milliseconds
+    """
+    if not latencies:
+        return {}
+    values = sorted(latencies)
+    return {
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(_percentile(values, 50), 3),
+        'p90': round(_percentile(values, 90), 3),
+        'p95': round(_percentile(values, 95), 3),
+        'p99': round(_percentile(values, 99), 3),
+        'max': round(values[-1], 3)
+    }
+
+
+def _response_output(res: requests.Response) -> Any:
+    try:
+        return res.json()
+    except ValueError:
+        return res.content.decode('utf-8', errors='replace')
+
+
+def run_batch(send: Callable[[Dict[str, str], Any], requests.Response],
+              inputs: Iterator[Tuple[str, Dict[str, str], Any]],
+              results_file: str, concurrency: int = 1) -> Dict[str, Any]:
+    """
+    send requests concurrently and write the result of each request into
+    ``results_file`` as a JSON line in the order of completion.
+
+    :param send: function to send headers and data, which raises for an error response
+    :param inputs: name, headers and data of each request
+    :param results_file: path of the JSONL file to write results
+    :param concurrency: number of requests in flight
+    :return: summary of the batch
+    """
+    latencies = []
+    succeeded = failed = 0
+
+    def _process(index, name, headers, data):
+        result = {'index': index, 'input': name}
+        started = time.perf_counter()
+        try:
+            res = send(headers, data)
+            result.update(status='succeeded', status_code=res.status_code, output=_response_output(res))
+        except requests.HTTPError as e:
+            result.update(status='failed', status_code=e.response.status_code,
+                          output=_response_output(e.response))
+        except Exception as e:
+            result.update(status='failed', status_code=None, output=str(e))
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    started = time.perf_counter()
+    with open(results_file, 'w') as f, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def _collect(futures, return_when):
+            nonlocal succeeded, failed
+            done, not_done = concurrent.futures.wait(futures, return_when=return_when)
+            for future in done:
+                result = future.result()
+                latencies.append(result['latency_ms'])
+                if result['status'] == 'succeeded':
+                    succeeded += 1
+                else:
+                    failed += 1
+                f.write(json.dumps(result) + '\n')
+            return not_done
+
+        # bound the number of pending requests not to read all inputs into memory
+        futures = set()
+        for index, (name, headers, data) in enumerate(inputs):
+            if len(futures) >= concurrency * 2:
+                futures = _collect(futures, concurrent.futures.FIRST_COMPLETED)
+            futures.add(executor.submit(_process, index, name, headers, data))
+        _collect(futures, concurrent.futures.ALL_COMPLETED)
+    elapsed = time.perf_counter() - started
+
+    total = succeeded + failed
+    return {
+        'total': total,
+        'succeeded': succeeded,
+        'failed': failed,
+        'elapsed_sec': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 3) if elapsed > 0 else None,
+        'latency_ms': latency_summary(latencies),
+        'results_file': results_file
+    }
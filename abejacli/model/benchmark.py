@@ -0,0 +1,172 @@
+import bisect
+import itertools
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+import requests
+
+from abejacli.model.batch_request import latency_summary
+
+# upper bounds of histogram buckets in milliseconds
+LATENCY_HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+def latency_histogram(latencies: Iterable[float],
+                      buckets: Sequence[float] = LATENCY_HISTOGRAM_BUCKETS) -> Dict[str, int]:
+    """
+    return the number of latencies in each bucket, e.g. ``{'<=1': 3, '<=2': 5, ..., '>30000': 0}``
+    """
+    counts = [0] * (len(buckets) + 1)
+    for latency in latencies:
+        counts[bisect.bisect_left(buckets, latency)] += 1
+    histogram = {'<={}'.format(bound): count for bound, count in zip(buckets, counts)}
+    histogram['>{}'.format(buckets[-1])] = counts[-1]
+    return histogram
+
+
+def _error_kind(e: Exception) -> str:
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return str(e.response.status_code)
+    return type(e).__name__
+
+
+class LoadResult(object):
+    """
+    Thread safe collector of the latency and the error of each request.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, error: Optional[Exception] = None):
+        with self._lock:
+            self.latencies.append(latency_ms)
+            if error is not None:
+                self.errors[_error_kind(error)] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        total = len(self.latencies)
+        failed = sum(self.errors.values())
+        return {
+            'requests': total,
+            'succeeded': total - failed,
+            'failed': failed,
+            'error_rate': round(failed / total, 4) if total else 0.0,
+            'errors': dict(self.errors),
+            'elapsed_sec': round(elapsed, 3),
+            'throughput_rps': round(total / elapsed, 3) if elapsed > 0 else None,
+            'latency_ms': latency_summary(self.latencies),
+            'latency_histogram_ms': latency_histogram(self.latencies)
+        }
+
+
+def _cycle(items: Iterable[Any]) -> Iterator[Any]:
+    """
+    yield items in turn repeatedly, iterating ``items`` again for each round
+    """
+    while True:
+        empty = True
+        for item in items:
+            empty = False
+            yield item
+        if empty:
+            return
+
+
+def run_load(send: Callable[[Any], Any], items: Iterable[Any], concurrency: int = 1,
+             requests_num: Optional[int] = None, duration: Optional[float] = None,
+             rate: Optional[float] = None) -> Dict[str, Any]:
+    """
+    send requests with ``items`` in turn until ``requests_num`` requests are sent
+    or ``duration`` seconds have passed, and return the summary of the load.
+    ``items`` are iterated lazily, and again for each round, so a re-iterable which
+    reads inputs on demand doesn't hold all of them in memory.
+
+    Without ``rate``, the load is closed-loop: each of ``concurrency`` workers sends
+    the next request as soon as the previous one finishes. With ``rate``, the load is
+    open-loop: requests are issued at ``rate`` per second regardless of responses.
+    At most ``concurrency`` requests wait for a worker, and issuing is delayed beyond
+    that, but the latency is measured from the scheduled time so that queueing delay
+    caused by a slow server is included.
+
+    :param send: function to send an item, which raises for an error response
+    :param items: re-iterable items to send
+    :param concurrency: number of requests in flight
+    :param requests_num: number of requests to send
+    :param duration: seconds to keep sending requests
+    :param rate: target requests per second
+    :return: summary of the load
+    """
+    for _ in items:
+        break
+    else:
+        raise ValueError('no items to send')
+    if requests_num is None and duration is None:
+        raise ValueError('either requests_num or duration is required')
+
+    result = LoadResult()
+
+    def _send(item, started):
+        try:
+            send(item)
+        except Exception as e:
+            result.record((time.perf_counter() - started) * 1000, e)
+        else:
+            result.record((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    deadline = started + duration if duration is not None else None
+    indexes = range(requests_num) if requests_num is not None else itertools.count()
+    requests_iter = zip(indexes, _cycle(items))
+
+    if rate is None:
+        lock = threading.Lock()
+
+        def _worker():
+            while True:
+                with lock:
+                    request = next(requests_iter, None)
+                now = time.perf_counter()
+                if request is None or (deadline is not None and now >= deadline):
+                    return
+                _send(request[1], now)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(_worker) for _ in range(concurrency)]
+        # raise an error of reading items
+        for future in futures:
+            future.result()
+    else:
+        # bound requests waiting for a worker not to queue them without limit
+        pending = threading.BoundedSemaphore(concurrency * 2)
+
+        def _send_scheduled(item, scheduled):
+            try:
+                _send(item, scheduled)
+            finally:
+                pending.release()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for index, item in requests_iter:
+                scheduled = started + index / rate
+                if deadline is not None and scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pending.acquire()
+                executor.submit(_send_scheduled, item, scheduled)
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        'mode': 'closed' if rate is None else 'open',
+        'concurrency': concurrency,
+        'target_rps': rate
+    }
+    summary.update(result.summary(elapsed))
+    return summary
@@ -1,38 +1,67 @@
+import hashlib
 import json
 import os
-import tempfile
-from typing import Callable, Generator, Optional
+import time
+from typing import Callable, Generator, Iterable, Optional, Tuple
 
 import docker
 from docker.models.containers import Container
 from docker.models.images import Image
 
+from abejacli.common.snapshot import FileHashCache, tree_digest
+from abejacli.config import DEFAULT_EXCLUDE_FILES
+from abejacli.docker.build_context import (
+    BUILD_DOCKERFILE_NAME,
+    build_context,
+    build_context_exclude_patterns
+)
 from abejacli.docker.commands.run import RunCommand
-from abejacli.model import md5file
+from abejacli.docker.image_cache import LOCAL_IMAGE_KEY, ImageCache
 
+# dependencies are installed before adding source files,
+# so that the cached layer is reused while the dependencies are the same.
 DOCKERFILE_RUN_LOCAL_TEMPLATE = '''
 FROM {IMAGE}
 
-ADD . /srv/app
 WORKDIR /srv/app
-RUN if test -r requirements.txt; then pip install --no-cache-dir -r requirements.txt; fi
+{INSTALL_REQUIREMENTS}
+ADD . /srv/app
+'''
+DOCKERFILE_INSTALL_REQUIREMENTS = '''COPY requirements.txt /srv/app/requirements.txt
+RUN pip install --no-cache-dir -r requirements.txt
 '''
 
 REQUIREMENTS_TXT = 'requirements.txt'
+
 BUILT_IMAGE_SUFFIX = 'local-model'
 LOCAL_MODEL_TYPE_KEY = 'abeja-platform-model-type'
-LOCAL_MODEL_REQUIREMENTS_MD5_KEY = 'abeja-platform-requirement-md5'
+# labels of a container kept running for later invocations
+WARM_SERVER_PROJECT_KEY = 'abeja-platform-warm-project'
+WARM_SERVER_KEY = 'abeja-platform-warm-key'
+WARM_SERVER_PORT_KEY = 'abeja-platform-warm-port'
 
 LOCAL_MODEL_TYPE_VALUE = 'inference'
 LOCAL_TRAIN_TYPE_VALUE = 'train'
 
 
+def generate_run_dockerfile(from_image: str) -> str:
+    install_requirements = DOCKERFILE_INSTALL_REQUIREMENTS if os.path.isfile(REQUIREMENTS_TXT) else ''
+    return DOCKERFILE_RUN_LOCAL_TEMPLATE.format(IMAGE=from_image, INSTALL_REQUIREMENTS=install_requirements)
+
+
 class LocalServer:
-    def __init__(self, container: Container, port: Optional[int] = None) -> None:
+    def __init__(self, container: Container, port: Optional[int] = None,
+                 keep_warm: bool = False, since: Optional[int] = None) -> None:
         self._container = container
         self.endpoint = 'http://localhost:{}'.format(port)
+        # a warm server keeps running after stop() to be reused by the next invocation
+        self.keep_warm = keep_warm
+        # not to show logs of the previous invocations of a warm server
+        self._since = since
 
     def stop(self) -> None:
+        if self.keep_warm:
+            return
         # much faster to use kill, because stop container takes about 10 sec.
         # self._container.stop()
         try:
@@ -41,9 +70,18 @@ class LocalServer:
             # ignore because the container does not exist anymore.
             return
 
+    def status(self) -> str:
+        try:
+            self._container.reload()
+        except docker.errors.NotFound:
+            return 'removed'
+        return self._container.status
+
     def logs(
             self, follow: bool = True, stream: bool = True,
             since: str = None) -> Generator[bytes, None, None]:
+        if since is None:
+            since = self._since
         return self._container.logs(follow=follow, stream=stream, since=since)
 
 
@@ -51,7 +89,6 @@ class LocalModelHandler:
     def __init__(self) -> None:
         self._client = docker.from_env()
         self._setup_docker_cli()
-        self.requirements_file = REQUIREMENTS_TXT
 
     def _setup_docker_cli(self) -> None:
         """
@@ -71,75 +108,48 @@ class LocalModelHandler:
             base_url = 'unix://var/run/docker.sock'
         self._docker_cli = docker.APIClient(base_url=base_url)
 
-    def check_rebuild_required(self) -> bool:
-        """
-        return true if requirements.txt exists and
-        the last update is later than that of the specified image.
-        target_last_modified and image_last_modified are time in utc.
-
-        :param image:
-        :param tag:
-        :return:
-        """
-        # no need to rebuild if requirements.txt does not exist
-        if not os.path.exists(self.requirements_file):
-            return False
-
-        image = self._find_built_image()
-        if image is None:
-            return True
-
-        # check md5 of requirements.txt using label
-        prev_md5 = image.labels.get(LOCAL_MODEL_REQUIREMENTS_MD5_KEY)
-        if not prev_md5:
-            return True
-
-        if prev_md5 != md5file(self.requirements_file):
-            return True
-
-        return False
-
     def build_run_image(
             self, image: str, tag: str, model_type: str = None,
-            no_cache: bool = False, stdout=None) -> Image:
+            no_cache: bool = False, stdout=None, exclude_patterns: Iterable[str] = ()) -> Image:
         """
         build docker image adding label to be able to find it
 
+        the built image is reused while the base image, the Dockerfile
+        and the dependency files are the same.
+
         :param image:
         :param tag:
         :param no_cache:
         :param stdout:
+        :param exclude_patterns: patterns of files not to send to docker daemon
         :return: built docker image
         """
-        if not no_cache:
-            # when rebuild is required, don't use cache
-            no_cache = self.check_rebuild_required()
+        dockerfile = self._generate_run_dockerfile(image, tag)
+        image_cache = ImageCache(self._client)
+        key = image_cache.key('{}:{}'.format(image, tag), dockerfile, model_type)
 
         # skip build if use cache is enabled and built image exists.
-        built_image = self._find_built_image()
-        if built_image and not no_cache:
-            return built_image
-
-        dockerfile = self._generate_run_dockerfile(image, tag)
+        if not no_cache:
+            built_image = image_cache.find(key)
+            if built_image:
+                return built_image
 
         # ex. abeja/platform-minimal/0.1.0/local-inference-model
         image_name = '{}/{}/{}-{}'.format(image,
                                           tag, model_type, BUILT_IMAGE_SUFFIX)
 
-        self._build_image(image_name, dockerfile, model_type, stdout)
-        return self._find_built_image()
-
-    def _build_image(self, name: str, dockerfile: str, type_value: str, stdout: Callable = None) -> None:
-        with tempfile.NamedTemporaryFile(mode='w+t') as f:
-            f.write(dockerfile)
-            f.seek(0)  # put file pointer back the initial position for being read
-            requirements_md5 = md5file(self.requirements_file) if os.path.exists(
-                self.requirements_file) else None
-            labels = {
-                LOCAL_MODEL_TYPE_KEY: type_value,
-                LOCAL_MODEL_REQUIREMENTS_MD5_KEY: requirements_md5
-            }
-            for output in self._docker_cli.build(tag=name, dockerfile=f.name, path=os.getcwd(), labels=labels):
+        self._build_image(image_name, dockerfile, model_type, key, stdout, exclude_patterns)
+        return image_cache.find(key)
+
+    def _build_image(self, name: str, dockerfile: str, type_value: str, key: str, stdout: Callable = None,
+                     exclude_patterns: Iterable[str] = ()) -> None:
+        labels = {
+            LOCAL_MODEL_TYPE_KEY: type_value,
+            LOCAL_IMAGE_KEY: key
+        }
+        with build_context(dockerfile, build_context_exclude_patterns(exclude_patterns)) as context:
+            for output in self._docker_cli.build(tag=name, fileobj=context, custom_context=True,
+                                                 dockerfile=BUILD_DOCKERFILE_NAME, labels=labels):
                 if not stdout:
                     continue
                 try:
@@ -155,28 +165,87 @@ class LocalModelHandler:
     def stop_container(self, container) -> None:
         container.stop()
 
-    def create_local_server(self, run_command: RunCommand) -> LocalServer:
+    def create_local_server(self, run_command: RunCommand, keep_warm: bool = False) -> LocalServer:
         """
         run container in background as local api server
         assign dynamic port number for host port.
 
+        With keep_warm, the container keeps running after the server stops,
+        and it is reused while the run command and the source files are the same.
+        Otherwise, the warm container of the current directory is replaced.
+
         :return:
         """
-        container = self.run_container(run_command=run_command)
+        if not keep_warm:
+            container = self.run_container(run_command=run_command)
+            port = run_command.get_port()
+            return LocalServer(container, port=port)
+
+        project, key = self._warm_server_keys(run_command)
+        warm_server = self._find_warm_server(project, key)
+        if warm_server:
+            return warm_server
+
         port = run_command.get_port()
-        return LocalServer(container, port=port)
+        run_command.labels = {
+            **(run_command.labels or {}),
+            WARM_SERVER_PROJECT_KEY: project,
+            WARM_SERVER_KEY: key,
+            WARM_SERVER_PORT_KEY: str(port)
+        }
+        container = self.run_container(run_command=run_command)
+        return LocalServer(container, port=port, keep_warm=True)
+
+    def stop_warm_servers(self) -> int:
+        """
+        kill all warm containers
+
+        :return: number of killed containers
+        """
+        containers = self._client.containers.list(filters={'label': WARM_SERVER_PROJECT_KEY})
+        for container in containers:
+            LocalServer(container).stop()
+        return len(containers)
+
+    def _warm_server_keys(self, run_command: RunCommand) -> Tuple[str, str]:
+        """
+        return the key of the project, which is the mounted current directory,
+        and the key of the run command and the source files.
+        """
+        params = run_command.to_dict()
+        # the port is chosen at random for each run
+        params.pop('ports', None)
+        params.pop('labels', None)
+        params['environment'] = sorted(params.get('environment', []))
+
+        # the source files are mounted into the container, not built into the image,
+        # and the server process keeps the code loaded when it started
+        cache = FileHashCache()
+        params['source'] = tree_digest(os.getcwd(), DEFAULT_EXCLUDE_FILES, cache)
+        cache.save()
+
+        project = hashlib.sha256(os.getcwd().encode('utf-8')).hexdigest()
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        return project, key
+
+    def _find_warm_server(self, project: str, key: str) -> Optional[LocalServer]:
+        """
+        return the running warm server for the key,
+        and kill the other warm servers of the project which are out of date.
+        """
+        containers = self._client.containers.list(
+            filters={'label': '{}={}'.format(WARM_SERVER_PROJECT_KEY, project)})
+        found = None
+        for container in containers:
+            if found is None and container.labels.get(WARM_SERVER_KEY) == key:
+                port = int(container.labels[WARM_SERVER_PORT_KEY])
+                found = LocalServer(container, port=port, keep_warm=True, since=int(time.time()))
+            else:
+                LocalServer(container).stop()
+        return found
 
     def _generate_run_dockerfile(self, image: str, tag: str) -> str:
-        from_image = '{}:{}'.format(image, tag)
-        return DOCKERFILE_RUN_LOCAL_TEMPLATE.format(IMAGE=from_image)
-
-    def _find_built_image(self) -> Optional[Image]:
-        images = self._client.images.list(
-            filters={'label': LOCAL_MODEL_TYPE_KEY})
-        if not images:
-            return None
-        # pick the first because images is descending order list
-        return images[0]
+        return generate_run_dockerfile('{}:{}'.format(image, tag))
 
     def _parse_stream(self, output) -> Generator[dict, None, None]:
         if type(output) == bytes:
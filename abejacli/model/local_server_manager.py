@@ -1,39 +1,131 @@
+import threading
+import time
+
 import requests
-from retrying import retry
+from requests.adapters import HTTPAdapter
+
+from abejacli.logger import get_logger
 
-HEALTH_CHECK_RETRY_INTERVAL = 1 * 1000  # one second
-HEALTH_CHECK_RETRY_MAX_ATTEMPT = 60
+logger = get_logger()
+
+HEALTH_CHECK_MIN_INTERVAL = 0.01
+HEALTH_CHECK_MAX_INTERVAL = 1
 HEALTH_CHECK_TIMEOUT = 1
+HEALTH_CHECK_WAIT_TIMEOUT = 60
 SPOT_INSTANCE_INITIAL_HEALTH_CHECK = 60 * 2     # two minutes
 
+# container statuses in which the server may still get ready
+CONTAINER_STARTING_STATUSES = ('created', 'running', 'restarting')
+
 
-# assert ((HEALTH_CHECK_RETRY_INTERVAL + HEALTH_CHECK_TIMEOUT)
-#         * HEALTH_CHECK_RETRY_MAX_ATTEMPT) <= SPOT_INSTANCE_INITIAL_HEALTH_CHECK
+# assert (HEALTH_CHECK_WAIT_TIMEOUT + HEALTH_CHECK_TIMEOUT) <= SPOT_INSTANCE_INITIAL_HEALTH_CHECK
+
+
+class LocalServerExitedError(Exception):
+    pass
 
 
 class LocalServerManager:
-    def __init__(self, local_server):
+    def __init__(self, local_server, pool_size=10):
         self._server = local_server
+        self._pool_size = pool_size
+        self._session = None
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if self._session is not None:
+            self._session.close()
         self._server.stop()
 
-    @retry(wait_fixed=HEALTH_CHECK_RETRY_INTERVAL,
-           stop_max_attempt_number=HEALTH_CHECK_RETRY_MAX_ATTEMPT)
-    def wait_until_running(self, health_check_url):
+    @property
+    def session(self):
+        """
+        session to keep connections to the local server,
+        which can be shared by ``pool_size`` threads.
+        """
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def wait_until_running(self, health_check_url, timeout=HEALTH_CHECK_WAIT_TIMEOUT):
         """
-        timeout * wait * stop must be within two minutes
+        poll health check with exponential backoff until the server gets ready.
+
+        timeout must be within two minutes
         which is time that stop instance first receive health check.
 
+        The container logs are followed in background, and a new line triggers the
+        next poll at once because it often means the server has started listening.
+        Such polls are made at most once per ``HEALTH_CHECK_MIN_INTERVAL`` seconds, and
+        the container status is inspected only on the scheduled ones. The end of the
+        logs means the container has exited, which fails immediately.
+
         :param health_check_url:
-        :return:
+        :param timeout: seconds to wait
+        :raises LocalServerExitedError: if the container exits before getting ready
         """
-        res = requests.get(health_check_url,
-                           timeout=HEALTH_CHECK_TIMEOUT)
-        res.raise_for_status()
+        try:
+            self._wait_until_running(health_check_url, timeout)
+        except Exception:
+            # a warm server which failed to get ready must not be reused
+            self._server.keep_warm = False
+            raise
+
+    def _wait_until_running(self, health_check_url, timeout):
+        wakeup = threading.Event()
+        exited = threading.Event()
+        stopped = threading.Event()
+        threading.Thread(target=self._watch_logs, args=(wakeup, exited, stopped), daemon=True).start()
+        try:
+            self._poll_health_check(health_check_url, timeout, wakeup, exited)
+        finally:
+            # the log stream can't be closed from another thread,
+            # so the follower returns at the next line
+            stopped.set()
+
+    def _poll_health_check(self, health_check_url, timeout, wakeup, exited):
+        deadline = time.monotonic() + timeout
+        interval = HEALTH_CHECK_MIN_INTERVAL
+        woken = False
+        while True:
+            checked_at = time.monotonic()
+            try:
+                res = self.session.get(health_check_url, timeout=HEALTH_CHECK_TIMEOUT)
+                res.raise_for_status()
+                return
+            except requests.RequestException as e:
+                error = e
+
+            # new log lines mean the container is alive, so it's not inspected then
+            if exited.is_set() or (not woken and self._server.status() not in CONTAINER_STARTING_STATUSES):
+                raise LocalServerExitedError('local server exited before getting ready')
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise error
+            woken = wakeup.wait(min(interval, remaining))
+            if woken:
+                wakeup.clear()
+                time.sleep(max(0.0, checked_at + HEALTH_CHECK_MIN_INTERVAL - time.monotonic()))
+            interval = min(interval * 2, HEALTH_CHECK_MAX_INTERVAL)
+
+    def _watch_logs(self, wakeup, exited, stopped):
+        try:
+            for _ in self._server.logs(follow=True, stream=True):
+                if stopped.is_set():
+                    return
+                wakeup.set()
+        except Exception as e:
+            # only polling is used then
+            logger.debug('failed to follow logs of local server : {}'.format(e))
+            return
+        exited.set()
+        wakeup.set()
 
     def send_request(self, method, endpoint, headers=None, data=None):
         if not headers:
@@ -41,7 +133,7 @@ class LocalServerManager:
 
         # We intentionally make a request can wait forever by specifying
         # the `timeout` value is `None`.
-        res = requests.request(
+        res = self.session.request(
             method, endpoint, headers=headers, data=data, timeout=None)
         res.raise_for_status()
         return res
@@ -0,0 +1,239 @@
+import datetime
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from abejacli.config import (
+    LOG_FETCH_WORKER_NUM,
+    LOG_FOLLOW_INTERVAL,
+    LOG_PREFETCH_EVENT_NUM
+)
+
+LOG_EVENTS_KEY = 'events'
+LOG_NEXT_TOKEN_KEY = 'next_token'
+LOG_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+Fetch = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def _event_key(event: Dict[str, Any]) -> str:
+    return json.dumps(event, sort_keys=True)
+
+
+def _parse_timestamp(timestamp: Any) -> Optional[datetime.datetime]:
+    """
+    parse the timestamp of a log event, which is epoch milliseconds or
+    an ISO 8601 string, into a naive datetime in UTC
+
+    >>> _parse_timestamp(1566529144938)
+    datetime.datetime(2019, 8, 23, 2, 59, 4, 938000)
+    >>> _parse_timestamp('2019-08-23T11:59:04.938+09:00')
+    datetime.datetime(2019, 8, 23, 2, 59, 4, 938000)
+    """
+    if isinstance(timestamp, str) and timestamp.isdigit():
+        timestamp = int(timestamp)
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        return _EPOCH + datetime.timedelta(milliseconds=timestamp)
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class _LastEvents(object):
+    """
+    The time of the latest event yielded so far and the events at that time,
+    to skip events of overlapping pages which have been yielded already.
+    """
+
+    def __init__(self):
+        self.time = None
+        self._counts = Counter()
+
+    @property
+    def start_time(self) -> Optional[str]:
+        """
+        the time of the latest event in ``LOG_TIME_FORMAT``, truncated to seconds
+        """
+        if self.time is None:
+            return None
+        return self.time.strftime(LOG_TIME_FORMAT)
+
+    def record(self, events: List[Dict[str, Any]]):
+        for event in events:
+            event_time = _parse_timestamp(event.get('timestamp'))
+            if event_time is None:
+                continue
+            if self.time is None or event_time > self.time:
+                self.time, self._counts = event_time, Counter()
+            if event_time == self.time:
+                self._counts[_event_key(event)] += 1
+
+    def skip_seen(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        return events except those before the latest event and those at its time
+        which have been yielded
+        """
+        if self.time is None:
+            return events
+        counts = self._counts.copy()
+        unseen = []
+        for event in events:
+            event_time = _parse_timestamp(event.get('timestamp'))
+            if event_time is not None and event_time < self.time:
+                continue
+            if event_time == self.time:
+                key = _event_key(event)
+                if counts[key]:
+                    counts[key] -= 1
+                    continue
+            unseen.append(event)
+        return unseen
+
+
+def _fetch_later(delay: float, fetch: Fetch, params: Dict[str, Any]) -> Dict[str, Any]:
+    time.sleep(delay)
+    return fetch(params)
+
+
+def iter_log_events(fetch: Fetch, params: Dict[str, Any], follow: bool = False,
+                    interval: float = LOG_FOLLOW_INTERVAL) -> Iterator[Dict[str, Any]]:
+    """
+    yield log events of all pages following ``next_token`` until it's missing or
+    repeated, even across empty pages. The next page is fetched in background
+    while the events of the current page are consumed.
+
+    With ``follow``, new events are polled every ``interval`` seconds after the
+    last page until interrupted, with the last ``next_token`` if any, or from
+    the time of the last event otherwise.
+
+    :param fetch: function to get a page of logs with query parameters
+    :param params: query parameters of the first page
+    :param follow: keep polling new events
+    :param interval: seconds to wait before polling new events
+    :return: iterator of log events
+    """
+    last_events = _LastEvents()
+    overlapping = False
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fetch, params)
+        while future is not None:
+            page = future.result()
+            events = page.get(LOG_EVENTS_KEY) or []
+            if overlapping:
+                events = last_events.skip_seen(events)
+            last_events.record(events)
+
+            token = page.get(LOG_NEXT_TOKEN_KEY)
+            if token and token != params.get(LOG_NEXT_TOKEN_KEY):
+                params = {**params, LOG_NEXT_TOKEN_KEY: token}
+                future, overlapping = executor.submit(fetch, params), False
+            elif follow:
+                if not token:
+                    # poll again from the last event, and skip events which have been yielded
+                    params = {**params, LOG_NEXT_TOKEN_KEY: None}
+                    if last_events.start_time:
+                        params['start_time'] = last_events.start_time
+                    overlapping = True
+                future = executor.submit(_fetch_later, interval, fetch, params)
+            else:
+                future = None
+
+            yield from events
+
+
+def split_time_range(start_time: str, end_time: str, parts: int) -> List[Tuple[str, str]]:
+    """
+    split the time range into ``parts`` consecutive sub-ranges of the same length
+    in seconds. Adjacent sub-ranges share their boundary.
+
+    >>> split_time_range('2017-01-01T00:00:00Z', '2017-01-01T00:00:10Z', 2)
+    [('2017-01-01T00:00:00Z', '2017-01-01T00:00:05Z'), ('2017-01-01T00:00:05Z', '2017-01-01T00:00:10Z')]
+    """
+    start = datetime.datetime.strptime(start_time, LOG_TIME_FORMAT)
+    end = datetime.datetime.strptime(end_time, LOG_TIME_FORMAT)
+    if end <= start:
+        raise ValueError('end time must be after start time')
+    seconds = int((end - start).total_seconds())
+    parts = max(1, min(parts, seconds))
+    bounds = [start + datetime.timedelta(seconds=seconds * i // parts) for i in range(parts)] + [end]
+    return [(bounds[i].strftime(LOG_TIME_FORMAT), bounds[i + 1].strftime(LOG_TIME_FORMAT))
+            for i in range(parts)]
+
+
+def iter_log_events_in_parallel(fetch: Fetch, params: Dict[str, Any], parts: int,
+                                max_workers: int = LOG_FETCH_WORKER_NUM,
+                                prefetch: int = LOG_PREFETCH_EVENT_NUM) -> Iterator[Dict[str, Any]]:
+    """
+    yield log events between ``start_time`` and ``end_time`` of ``params`` in order,
+    fetching all pages of ``parts`` sub-ranges of the time range by ``max_workers``
+    threads. Events of the first sub-range are yielded while they are fetched, and
+    at most ``prefetch`` events of each later sub-range are fetched meanwhile. Events
+    at a shared boundary of sub-ranges are yielded once.
+
+    ``fetch`` is called from many threads, so it should not share a session among them.
+
+    :param fetch: function to get a page of logs with query parameters
+    :param params: query parameters with start_time and end_time
+    :param parts: number of sub-ranges
+    :param max_workers: number of sub-ranges fetched at a time
+    :param prefetch: number of events buffered for each sub-range
+    :return: iterator of log events
+    """
+    end = object()
+    stopped = threading.Event()
+
+    def _put(events, event):
+        # give up when the events are no longer read
+        while not stopped.is_set():
+            try:
+                events.put(event, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch_range(time_range, events):
+        start_time, end_time = time_range
+        try:
+            for event in iter_log_events(fetch, {**params, 'start_time': start_time, 'end_time': end_time}):
+                if not _put(events, event):
+                    return
+        except Exception as e:
+            _put(events, e)
+        _put(events, end)
+
+    last_events = _LastEvents()
+    time_ranges = split_time_range(params['start_time'], params['end_time'], parts)
+    queues = [queue.Queue(maxsize=max(1, prefetch)) for _ in time_ranges]
+    # sub-ranges are started in order, so that the one being yielded is always fetched
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(time_ranges))))
+    futures = [executor.submit(_fetch_range, time_range, events)
+               for time_range, events in zip(time_ranges, queues)]
+    try:
+        for events in queues:
+            while True:
+                event = events.get()
+                if event is end:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                for unseen in last_events.skip_seen([event]):
+                    last_events.record([unseen])
+                    yield unseen
+    finally:
+        stopped.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Thread-safe limiter to keep the rate of operations under ``rate`` per second.
+    Operations are spaced evenly instead of being sent in bursts.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: max number of operations per second. ``None`` or 0 means no limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        block until the next operation is allowed
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(self._next_time, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
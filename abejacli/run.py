@@ -2,11 +2,11 @@
 # -*- coding: utf-8 -*
 import datetime
 import json
-import mimetypes
 import os
 import sys
+import tempfile
+import threading
 import time
-import urllib
 from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
 from pathlib import Path
@@ -14,6 +14,7 @@ from typing import Optional
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
 
 # run_test.py will rewrite the variable `CONFIG_FILE_PATH` so we have to access
 # the variable through the module. Don't import variable directly.
@@ -34,11 +35,13 @@ from abejacli.click_custom import (
     convert_to_local_image_callback
 )
 from abejacli.common import (
+    OUTPUT_FORMAT_KEY,
+    OUTPUT_FORMATS,
     __try_get_organization_id,
-    json_output_formatter,
-    progress_status,
-    version_archive
+    json_output_formatter
 )
+from abejacli.common.archive import write_source_archive
+from abejacli.common.download import download_and_extract, download_file
 from abejacli.config import (
     DEFAULT_EXCLUDE_FILES,
     ERROR_EXITCODE,
@@ -76,11 +79,21 @@ from abejacli.fs_utils import (
 )
 from abejacli.labs.commands import labs
 from abejacli.logger import get_logger
+from abejacli.model.batch_request import (
+    BatchInputs,
+    UnsupportedInputError,
+    is_batch_input,
+    iter_batch_inputs,
+    read_input_file,
+    run_batch
+)
+from abejacli.model.benchmark import run_load
 from abejacli.model.docker_handler import (
     LOCAL_MODEL_TYPE_KEY,
     LocalModelHandler
 )
 from abejacli.model.local_server_manager import LocalServerManager
+from abejacli.model.logs import iter_log_events, iter_log_events_in_parallel
 from abejacli.model.runtime_utils import (
     format_container_log,
     get_runtime_command
@@ -93,7 +106,8 @@ from abejacli.session import (
     api_get,
     api_get_data,
     api_patch,
-    api_post
+    api_post,
+    generate_user_session
 )
 from abejacli.startapp.commands import startapp
 from abejacli.training.commands import training
@@ -115,9 +129,11 @@ logger = get_logger()
 
 @click.group(help='ABEJA command line interface')
 @click.version_option(version=__version__, message='v%(version)s')
+@click.option('--output', 'output_format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help='Output format of responses. By default json is highlighted only on a terminal')
 @click.pass_context
-def main(ctx):
-    pass
+def main(ctx, output_format):
+    ctx.ensure_object(dict)[OUTPUT_FORMAT_KEY] = output_format
 
 
 @main.group(help='Model operation commands')
@@ -412,27 +428,18 @@ def _create_deployment_version(ctx, deployment_id, version, image, handler=None,
     }
 
     upload_url = r['upload_url']
-    name = _get_deployment_name(deployment_id)
-    try:
-        temp_file = version_archive(name, DEFAULT_EXCLUDE_FILES)
+    # the pre-signed url requires Content-Length, so the archive is written into
+    # a temporary file which is removed when it's closed
+    with tempfile.TemporaryFile(suffix='.tar.gz') as archive:
+        write_source_archive(archive, DEFAULT_EXCLUDE_FILES)
+        archive.seek(0)
         # TODO:  Confirm what is this doing?  Should we use it's result?
-        _version_upload(upload_url, temp_file.name)
-    finally:
-        if os.path.exists(temp_file.name):
-            temp_file.close()
-            os.unlink(temp_file.name)
+        _version_upload(upload_url, archive)
     return result
 
 
-def _get_deployment_name(deployment_id):
-    url = '{}/deployments/{}'.format(ORGANIZATION_ENDPOINT, deployment_id)
-    r = api_get(url)
-    return r['name']
-
-
-def _version_upload(upload_url, tar_name):
-    with open(tar_name, "rb") as file:
-        result = requests.put(upload_url, data=file)
+def _version_upload(upload_url, archive):
+    result = requests.put(upload_url, data=archive)
 
     return result
 
@@ -514,25 +521,35 @@ def _describe_deployment_versions(deployment_id, version_id):
 @click.option('-d', '--deployment_id', '--deployment-id', 'deployment_id', type=str, help='Deployment identifier',
               required=True)
 @click.option('-v', '--version-id', '--version_id', 'version_id', type=str, help='Version identifier', required=True)
-def download_deployment_version(deployment_id, version_id):
+@click.option('--extract', 'extract', is_flag=True,
+              help='Extract the archive into a directory while downloading, without saving the archive')
+def download_deployment_version(deployment_id, version_id, extract):
     try:
-        r = _download_deployment_version(deployment_id, version_id)
+        r = _download_deployment_version(deployment_id, version_id, extract)
     except:
         sys.exit(ERROR_EXITCODE)
 
-    click.echo('Downloaded a file {}.'.format(r))
+    if extract:
+        click.echo('Extracted files into {}.'.format(r))
+    else:
+        click.echo('Downloaded a file {}.'.format(r))
 
 
-def _download_deployment_version(deployment_id, version_id):
+def _download_deployment_version(deployment_id, version_id, extract=False):
     url = '{}/deployments/{}/versions/{}/download'.format(
         ORGANIZATION_ENDPOINT, deployment_id, version_id)
     r = api_get(url)
     download_uri = r['download_uri']
+    if extract:
+        return download_and_extract(
+            download_uri, '{}_{}'.format(deployment_id, version_id),
+            url_provider=lambda: api_get(url)['download_uri'])
     file_name = os.path.basename(download_uri[:download_uri.find('?')])
     _, ext = os.path.splitext(file_name)
     target_file_name = '{}_{}{}'.format(deployment_id, version_id, ext)
-    urllib.request.urlretrieve(
-        download_uri, target_file_name, progress_status)
+    download_file(
+        download_uri, target_file_name,
+        url_provider=lambda: api_get(url)['download_uri'])
 
     cf = get_compressed_file(target_file_name)
     if cf is not None:
@@ -826,13 +843,85 @@ def _update_endpoint(deployment_id, service_id, endpoint_id):
     return r
 
 
+def _positive_number_callback(ctx, param, value):
+    if value is not None and value <= 0:
+        raise click.BadParameter('must be a positive number')
+    return value
+
+
+def _load_options(f):
+    f = click.option('--rate', 'rate', type=float, default=None, required=False, callback=_positive_number_callback,
+                     help='Target requests per second. '
+                          'Requests are sent regardless of responses (open-loop) if specified')(f)
+    f = click.option('--duration', 'duration', type=click.IntRange(min=1), default=None, required=False,
+                     help='Seconds to keep sending requests')(f)
+    f = click.option('-n', '--requests', 'requests_num', type=click.IntRange(min=1), default=None, required=False,
+                     help='Number of requests to send')(f)
+    f = click.option('-c', '--concurrency', 'concurrency', type=click.IntRange(min=1), default=4, required=False,
+                     help='Number of concurrent requests')(f)
+    return f
+
+
+def _validate_load_options(requests_num, duration, rate):
+    if rate and not (requests_num or duration):
+        raise click.UsageError('--rate requires --requests or --duration')
+
+
+def _generate_endpoint_session(pool_size):
+    session = generate_user_session(json_content_type=False)
+    # no retries so that errors and latencies of the endpoint are measured as they are
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _bench_endpoint(url, items, content_type, concurrency, requests_num, duration, rate):
+    """
+    send each item in turn to the endpoint and print the summary.
+    an item is either a body or a path of the file to stream the body from.
+    """
+    headers = {'Content-Type': content_type}
+    session = _generate_endpoint_session(concurrency)
+
+    def _send(item):
+        if isinstance(item, Path):
+            with item.open('rb') as f:
+                res = session.post(url, data=f, headers=headers)
+        else:
+            res = session.post(url, data=item, headers=headers)
+        res.raise_for_status()
+
+    try:
+        summary = run_load(_send, items, concurrency=concurrency, requests_num=requests_num,
+                           duration=duration, rate=rate)
+    finally:
+        session.close()
+    click.echo(json_output_formatter(summary))
+
+
+def _endpoint_url(deployment_id, service_id):
+    if service_id:
+        return "{}/deployments/{}/services/{}".format(
+            WEB_API_ENDPOINT, deployment_id, service_id)
+    return "{}/deployments/{}".format(WEB_API_ENDPOINT, deployment_id)
+
+
 @model.command(name='check-endpoint-json', help='Check endpoint json')
 @click.option('-d', '--deployment_id', '--deployment-id', 'deployment_id', type=str, help='Deployment identifier',
               required=True)
 @click.option('-s', '--service_id', '--service-id', 'service_id', type=str, help='Service identifier', required=False)
 @click.option('-k', '--key', 'key', type=str, help='Key', required=True)
 @click.option('-v', '--value', 'value', type=str, help='Value', required=True)
-def check_endpoint_json(deployment_id, service_id, key, value):
+@_load_options
+def check_endpoint_json(deployment_id, service_id, key, value, concurrency, requests_num, duration, rate):
+    _validate_load_options(requests_num, duration, rate)
+    # benchmark the endpoint by sending the same json repeatedly
+    if requests_num or duration:
+        url = _endpoint_url(deployment_id, service_id)
+        _bench_endpoint(url, [json.dumps({key: value})], 'application/json',
+                        concurrency, requests_num, duration, rate)
+        return
     try:
         r = _check_endpoint_json(deployment_id, service_id, key, value)
     except:
@@ -846,11 +935,7 @@ def _check_endpoint_json(deployment_id, service_id, key, value):
     }
     json_data = json.dumps(parameter)
 
-    if service_id:
-        url = "{}/deployments/{}/services/{}".format(
-            WEB_API_ENDPOINT, deployment_id, service_id)
-    else:
-        url = "{}/deployments/{}".format(WEB_API_ENDPOINT, deployment_id)
+    url = _endpoint_url(deployment_id, service_id)
     r = api_post(url, json_data)
 
     return r
@@ -861,8 +946,15 @@ def _check_endpoint_json(deployment_id, service_id, key, value):
               required=True)
 @click.option('-s', '--service_id', '--service-id', 'service_id', type=str, help='Service identifier', required=False)
 @click.option('-t', '--type', 'type', type=str, help='Contant type', required=True)
-@click.option('-i', '--image_path', '--image-path', 'image_path', type=str, help='Image file', required=True)
-def check_endpoint_image(deployment_id, service_id, type, image_path):
+@click.option('-i', '--image_path', '--image-path', 'image_path', type=str, required=True,
+              help='Image file, or directory of image files to benchmark the endpoint')
+@_load_options
+def check_endpoint_image(deployment_id, service_id, type, image_path, concurrency, requests_num, duration, rate):
+    _validate_load_options(requests_num, duration, rate)
+    if os.path.isdir(image_path) or requests_num or duration:
+        _bench_endpoint_image(deployment_id, service_id, type, image_path,
+                              concurrency, requests_num, duration, rate)
+        return
     try:
         r = _check_endpoint_image(deployment_id, service_id, type, image_path)
     except:
@@ -876,23 +968,38 @@ def _check_endpoint_image(deployment_id, service_id, type, image_path):
         click.echo('image {} not found'.format(image_path))
         raise click.Abort()
 
-    if service_id:
-        url = "{}/deployments/{}/services/{}".format(
-            WEB_API_ENDPOINT, deployment_id, service_id)
-    else:
-        url = "{}/deployments/{}".format(WEB_API_ENDPOINT, deployment_id)
+    url = _endpoint_url(deployment_id, service_id)
     content_type = "image/{}".format(type)
-    with open(image_path, 'rb') as f:
-        data = f.read()
     headers = {
         'Content-Type': content_type
     }
 
-    r = api_post(url, data=data, headers=headers)
+    # stream the image from the file instead of reading the whole image
+    with open(image_path, 'rb') as f:
+        r = api_post(url, data=f, headers=headers)
 
     return r.json()
 
 
+def _bench_endpoint_image(deployment_id, service_id, type, image_path, concurrency, requests_num, duration, rate):
+    path = Path(image_path)
+    if path.is_dir():
+        items = sorted(p for p in path.rglob('*') if p.is_file() and not p.name.startswith('.'))
+    elif path.is_file():
+        items = [path]
+    else:
+        items = []
+    if not items:
+        click.secho('[error] image {} not found'.format(image_path), err=True, fg='red')
+        sys.exit(ERROR_EXITCODE)
+    if not requests_num and not duration:
+        # send each image once
+        requests_num = len(items)
+
+    url = _endpoint_url(deployment_id, service_id)
+    _bench_endpoint(url, items, "image/{}".format(type), concurrency, requests_num, duration, rate)
+
+
 # ---------------------------------------------------
 # submit-run
 # ---------------------------------------------------
@@ -1091,6 +1198,64 @@ def _delete_trigger(deployment_id, trigger_id):
 # ---------------------------------------------------
 # log
 # ---------------------------------------------------
+def _log_paging_options(f):
+    f = click.option('--parallel', 'parallel', type=click.IntRange(min=1), default=None, required=False,
+                     help='Split the time range into the number of sub-ranges and fetch them concurrently. '
+                          'Both start time and end time are required')(f)
+    f = click.option('--follow', 'follow', is_flag=True, type=bool, default=False, required=False,
+                     help='Fetch all pages and keep polling new logs until interrupted')(f)
+    f = click.option('--all', 'fetch_all', is_flag=True, type=bool, default=False, required=False,
+                     help='Fetch all pages following next token')(f)
+    return f
+
+
+def _describe_logs(url, params, fetch_all, follow, parallel):
+    """
+    print a page of logs as it is, or log events of all pages as JSON lines
+    with `--all`, `--follow` or `--parallel`.
+    """
+    if not (fetch_all or follow or parallel):
+        try:
+            r = api_get_data(url, params)
+        except:
+            sys.exit(ERROR_EXITCODE)
+        return click.echo(json_output_formatter(r))
+
+    if follow and (parallel or params['end_time']):
+        raise click.UsageError('--follow cannot be used with --parallel or --end-time')
+    if parallel and not (params['start_time'] and params['end_time']):
+        raise click.UsageError('--parallel requires --start-time and --end-time')
+
+    # pages are fetched by background threads, and each thread has its own session
+    local = threading.local()
+    sessions = []
+
+    def _fetch(page_params):
+        if not hasattr(local, 'session'):
+            local.session = generate_user_session()
+            sessions.append(local.session)
+        r = local.session.get(url, params=page_params)
+        r.raise_for_status()
+        return r.json()
+
+    try:
+        if parallel:
+            events = iter_log_events_in_parallel(_fetch, params, parallel)
+        else:
+            events = iter_log_events(_fetch, params, follow=follow)
+        for event in events:
+            click.echo(json.dumps(event, ensure_ascii=False))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error('describe logs aborted: {}'.format(e))
+        click.echo('describe logs aborted.', err=True)
+        sys.exit(ERROR_EXITCODE)
+    finally:
+        for session in sessions:
+            session.close()
+
+
 @model.command(name='describe-service-logs', help='Get service log')
 @click.option('-d', '--deployment_id', '--deployment-id', 'deployment_id', type=str, help='Deployment identifier',
               required=True)
@@ -1100,7 +1265,8 @@ def _delete_trigger(deployment_id, trigger_id):
 @click.option('--end_time', '--end-time', 'end_time', type=str, help='End time / 2017-12-31T00:00:00Z', default=None,
               required=False)
 @click.option('--next_token', '--next-token', 'next_token', type=str, help='Next token', default=None, required=False)
-def describe_service_logs(deployment_id, service_id, start_time, end_time, next_token):
+@_log_paging_options
+def describe_service_logs(deployment_id, service_id, start_time, end_time, next_token, fetch_all, follow, parallel):
     params = {
         'next_token': next_token,
         'start_time': start_time,
@@ -1108,12 +1274,7 @@ def describe_service_logs(deployment_id, service_id, start_time, end_time, next_
     }
     url = "{}/deployments/{}/services/{}/logs".format(
         ORGANIZATION_ENDPOINT, deployment_id, service_id)
-    try:
-        r = api_get_data(url, params)
-    except:
-        sys.exit(ERROR_EXITCODE)
-
-    return click.echo(json_output_formatter(r))
+    return _describe_logs(url, params, fetch_all, follow, parallel)
 
 
 @model.command(name='describe-run-logs', help='Get run log')
@@ -1123,7 +1284,8 @@ def describe_service_logs(deployment_id, service_id, start_time, end_time, next_
 @click.option('--start_time', '--start-time', 'start_time', type=str, help='Start time', default=None, required=False)
 @click.option('--end_time', '--end-time', 'end_time', type=str, help='End time', default=None, required=False)
 @click.option('--next_token', '--next-token', 'next_token', type=str, help='Next token', default=None, required=False)
-def describe_run_logs(deployment_id, run_id, start_time, end_time, next_token):
+@_log_paging_options
+def describe_run_logs(deployment_id, run_id, start_time, end_time, next_token, fetch_all, follow, parallel):
     params = {
         'next_token': next_token,
         'start_time': start_time,
@@ -1131,12 +1293,7 @@ def describe_run_logs(deployment_id, run_id, start_time, end_time, next_token):
     }
     url = "{}/deployments/{}/runs/{}/logs".format(
         ORGANIZATION_ENDPOINT, deployment_id, run_id)
-    try:
-        r = api_get_data(url, params)
-    except:
-        sys.exit(ERROR_EXITCODE)
-
-    return click.echo(json_output_formatter(r))
+    return _describe_logs(url, params, fetch_all, follow, parallel)
 
 
 @model.command(name='run-local', help='Local run commands')
@@ -1147,7 +1304,13 @@ def describe_run_logs(deployment_id, run_id, start_time, end_time, next_token):
               type=click.Choice(
                   ['x86_cpu', 'x86_gpu', 'jetson_tx2', 'raspberry3']),
               help='Device type', default='x86_cpu')
-@click.option('--input', 'input', type=str, help='Input data', required=True)
+@click.option('--input', 'input', type=str, required=True,
+              help='Input data. A directory or a JSONL manifest runs a batch of requests')
+@click.option('--concurrency', 'concurrency', type=click.IntRange(min=1), default=4, required=False,
+              help='Number of concurrent requests for batch input')
+@click.option('--results', 'results', type=click.Path(dir_okay=False, writable=True),
+              default='run_local_results.jsonl', required=False,
+              help='Path of the JSONL file to write results of batch input')
 @click.option('-e', '--environment', type=ENVIRONMENT_STR, help='Environment variables', default=None,
               required=False, multiple=True)
 @click.option('-o', '--organization_id', '--organization-id', 'organization_id', type=str, required=False,
@@ -1156,11 +1319,54 @@ def describe_run_logs(deployment_id, run_id, start_time, end_time, next_token):
                    '`ABEJA_ORGANIZATION_ID` from this arg takes priority over one in `--environment`.',
               callback=__try_get_organization_id)
 @click.option('--no-cache', '--no_cache', is_flag=True, type=bool, help='Not use built cache', required=False)
+@click.option('--keep-warm', '--keep_warm', 'keep_warm', is_flag=True, type=bool, required=False,
+              help='Keep the server running to reuse it while the parameters and the source files are the same')
 @click.option('-q', '--quiet', is_flag=True, type=bool, help='Suppress info logs', required=False)
 @click.option('--v1', is_flag=True, type=bool, help='Specify if you use old custom runtime image', default=False,
               required=False)
-def run_local(handler, image, device_type, input, environment, organization_id, no_cache, quiet, v1):
+def run_local(handler, image, device_type, input, concurrency, results, environment, organization_id,
+              no_cache, keep_warm, quiet, v1):
     image = str(image)
+    batch = is_batch_input(input)
+    if batch:
+        _check_input_exists(input)
+    else:
+        headers, data = _get_headers_and_data(input)
+
+    local_server = _setup_local_server(
+        handler, image, device_type, environment, organization_id, no_cache, quiet, v1, keep_warm)
+    endpoint = local_server.endpoint
+    health_check_url = '{}/health_check'.format(endpoint)
+
+    def server_logging():
+        for log in local_server.logs():
+            formatted_message = format_container_log(log)
+            click.echo(formatted_message)
+
+    if not quiet:
+        # This thread permanently tails all coming logs from the container.
+        # It is a daemon thread not to wait for a warm server which keeps running.
+        threading.Thread(target=server_logging, daemon=True).start()
+
+    with LocalServerManager(local_server, pool_size=concurrency) as manager:
+        _wait_local_server(manager, health_check_url, quiet)
+
+        if batch:
+            _run_batch_requests(manager, endpoint, input, results, concurrency, quiet)
+            return
+
+        res = _send_request(manager, endpoint, headers, data, quiet)
+
+    if not quiet:
+        click.echo("[info] finish requesting to model")
+    try:
+        click.echo(json.dumps(res.json(), indent=4))
+    except:
+        click.echo(res.content)
+
+
+def _setup_local_server(handler, image, device_type, environment, organization_id, no_cache, quiet, v1,
+                        keep_warm=False):
     local_model = LocalModelHandler()
 
     if not check_docker_installation():
@@ -1197,87 +1403,147 @@ def run_local(handler, image, device_type, input, environment, organization_id,
             image=built_image.id, handler=handler, device_type=device_type,
             env_vars=dict(environment), command=runtime_command,
             organization_id=organization_id)
-        local_server = local_model.create_local_server(command)
+        return local_model.create_local_server(command, keep_warm=keep_warm)
     except:
         click.secho("[error] failed to create local server",
                     err=True, fg='red')
         sys.exit(ERROR_EXITCODE)
 
-    endpoint = local_server.endpoint
-    health_check_url = '{}/health_check'.format(endpoint)
-    headers, data = _get_headers_and_data(input)
-
-    with ThreadPoolExecutor() as executor:
-        def server_logging():
-            for log in local_server.logs():
-                formatted_message = format_container_log(log)
-                click.echo(formatted_message)
 
-        if not quiet:
-            # This thread finish when local server container is skilled,
-            # because it permanently tails all coming logs from the container.
-            executor.submit(server_logging)
+def _wait_local_server(manager, health_check_url, quiet):
+    if not quiet:
+        click.echo("[info] waiting server running")
+    try:
+        manager.wait_until_running(health_check_url)
+    except Exception as e:
+        click.secho("[error] failed to run local server : {}".format(
+            e), err=True, fg='red')
+        click.secho("\n ------ Local Server Error ------ ",
+                    err=True, fg='red')
+        click.secho(manager.dump_logs(), err=True, fg='red')
+        sys.exit(ERROR_EXITCODE)
 
-        with LocalServerManager(local_server) as manager:
-            if not quiet:
-                click.echo("[info] waiting server running")
-            try:
-                manager.wait_until_running(health_check_url)
-            except Exception as e:
-                click.secho("[error] failed to run local server : {}".format(
-                    e), err=True, fg='red')
-                click.secho("\n ------ Local Server Error ------ ",
-                            err=True, fg='red')
-                click.secho(manager.dump_logs(), err=True, fg='red')
-                sys.exit(ERROR_EXITCODE)
-
-            if not quiet:
-                click.echo("[info] sending request to model")
-            # TODO: need to support get and other methods
-            # post request to local server
-            try:
-                res = manager.send_request('post', endpoint, headers, data)
-            except Exception as e:
-                click.secho("[error] failed to send request : {}".format(
-                    e), err=True, fg='red')
-                click.secho("\n ------ Local Server Error ------ ",
-                            err=True, fg='red')
-                click.secho(manager.dump_logs(), err=True, fg='red')
-                sys.exit(ERROR_EXITCODE)
 
+def _send_request(manager, endpoint, headers, data, quiet):
     if not quiet:
-        click.echo("[info] finish requesting to model")
+        click.echo("[info] sending request to model")
+    # TODO: need to support get and other methods
+    # post request to local server
     try:
-        click.echo(json.dumps(res.json(), indent=4))
-    except:
-        click.echo(res.content)
+        return manager.send_request('post', endpoint, headers, data)
+    except Exception as e:
+        click.secho("[error] failed to send request : {}".format(
+            e), err=True, fg='red')
+        click.secho("\n ------ Local Server Error ------ ",
+                    err=True, fg='red')
+        click.secho(manager.dump_logs(), err=True, fg='red')
+        sys.exit(ERROR_EXITCODE)
 
 
-def _get_headers_and_data(input):
-    mimetype, _ = mimetypes.guess_type(input)
-    if not mimetypes:
-        click.secho("[error] not supported file format {}: ".format(
-            input), err=True, fg='red')
+def _run_batch_requests(manager, endpoint, input, results, concurrency, quiet):
+    if not quiet:
+        click.echo("[info] sending requests to model with concurrency {}".format(concurrency))
+    try:
+        summary = run_batch(
+            lambda headers, data: manager.send_request('post', endpoint, headers, data),
+            iter_batch_inputs(input), results, concurrency)
+    except (OSError, UnsupportedInputError) as e:
+        click.secho("[error] failed to run batch requests : {}".format(
+            e), err=True, fg='red')
+        sys.exit(ERROR_EXITCODE)
+    click.echo(json_output_formatter(summary))
+    if summary['failed']:
         sys.exit(ERROR_EXITCODE)
 
+
+def _check_input_exists(input):
     if not os.path.exists(input):
         click.secho("[error] specifield file doesn't exist {}: ".format(
             input), err=True, fg='red')
         sys.exit(ERROR_EXITCODE)
 
-    if mimetype in ('application/json',):
-        with open(input, 'r') as f:
-            _data = f.read()
-            data = json.dumps(json.loads(_data))
-    elif mimetype in ('image/jpeg', 'image/png', 'image/gif'):
-        with open(input, 'rb') as f:
-            data = f.read()
-    else:
+
+def _get_headers_and_data(input):
+    _check_input_exists(input)
+    try:
+        return read_input_file(input)
+    except UnsupportedInputError:
         click.secho("[error] not supported {}: ".format(
             input), err=True, fg='red')
         sys.exit(ERROR_EXITCODE)
-    headers = {'Content-Type': mimetype}
-    return headers, data
+
+
+@model.command(name='bench-local', help='Benchmark a model on a local server')
+@click.option('-h', '--handler', 'handler', type=str, help='Model hanlder', required=True)
+@click.option('-i', '--image', 'image', type=str, help='Base-image name. ex) abeja-inc/all-cpu:19.10', required=True,
+              callback=convert_to_local_image_callback)
+@click.option('-d', '--device_type', '--device-type', 'device_type',
+              type=click.Choice(
+                  ['x86_cpu', 'x86_gpu', 'jetson_tx2', 'raspberry3']),
+              help='Device type', default='x86_cpu')
+@click.option('--input', 'input', type=str, required=True,
+              help='Input data. A directory or a JSONL manifest sends each input in turn')
+@_load_options
+@click.option('-e', '--environment', type=ENVIRONMENT_STR, help='Environment variables', default=None,
+              required=False, multiple=True)
+@click.option('-o', '--organization_id', '--organization-id', 'organization_id', type=str, required=False,
+              help='Organization ID, organization_id of current credential organization is used by default. '
+                   'this value is set as an environment variable named `ABEJA_ORGANIZATION_ID`. '
+                   '`ABEJA_ORGANIZATION_ID` from this arg takes priority over one in `--environment`.',
+              callback=__try_get_organization_id)
+@click.option('--no-cache', '--no_cache', is_flag=True, type=bool, help='Not use built cache', required=False)
+@click.option('--keep-warm', '--keep_warm', 'keep_warm', is_flag=True, type=bool, required=False,
+              help='Keep the server running to reuse it while the parameters and the source files are the same')
+@click.option('-q', '--quiet', is_flag=True, type=bool, help='Suppress info logs', required=False)
+@click.option('--v1', is_flag=True, type=bool, help='Specify if you use old custom runtime image', default=False,
+              required=False)
+def bench_local(handler, image, device_type, input, concurrency, requests_num, duration, rate, environment,
+                organization_id, no_cache, keep_warm, quiet, v1):
+    if is_batch_input(input):
+        _check_input_exists(input)
+        # inputs are read lazily while they are sent
+        items = BatchInputs(input)
+        try:
+            first_item = next(iter(items), None)
+        except (OSError, UnsupportedInputError) as e:
+            click.secho("[error] failed to read input : {}".format(e), err=True, fg='red')
+            sys.exit(ERROR_EXITCODE)
+        if first_item is None:
+            click.secho("[error] no supported input in {}".format(input), err=True, fg='red')
+            sys.exit(ERROR_EXITCODE)
+    else:
+        headers, data = _get_headers_and_data(input)
+        items = [(input, headers, data)]
+    if requests_num is None and duration is None:
+        requests_num = 100
+
+    local_server = _setup_local_server(
+        handler, str(image), device_type, environment, organization_id, no_cache, quiet, v1, keep_warm)
+    endpoint = local_server.endpoint
+    health_check_url = '{}/health_check'.format(endpoint)
+
+    with LocalServerManager(local_server, pool_size=concurrency) as manager:
+        _wait_local_server(manager, health_check_url, quiet)
+
+        if not quiet:
+            click.echo("[info] sending requests to model")
+        try:
+            summary = run_load(
+                lambda item: manager.send_request('post', endpoint, item[1], item[2]),
+                items, concurrency=concurrency, requests_num=requests_num, duration=duration, rate=rate)
+        except (OSError, UnsupportedInputError) as e:
+            click.secho("[error] failed to read input : {}".format(e), err=True, fg='red')
+            sys.exit(ERROR_EXITCODE)
+    click.echo(json_output_formatter(summary))
+
+
+@model.command(name='stop-warm-servers', help='Stop local servers kept running by `--keep-warm`')
+def stop_warm_servers():
+    if not check_docker_installation():
+        click.secho("[error] docker command is required", err=True, fg='red')
+        sys.exit(ERROR_EXITCODE)
+    stopped = LocalModelHandler().stop_warm_servers()
+    click.echo("[info] stopped {} local server(s)".format(stopped))
 
 
 @model.command(name='run-local-server', help='Local run commands')
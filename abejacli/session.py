@@ -1,3 +1,4 @@
+import uuid
 from json import JSONDecodeError
 
 import requests
@@ -13,21 +14,81 @@ from abejacli.logger import get_logger
 from abejacli.version import VERSION
 
 
-def generate_retry_session():
+class MultipartStreamBody(object):
+    """
+    multipart/form-data request body which is iterated part by part, so that a large
+    file part is streamed instead of being loaded into memory.
+
+    Each part is a tuple of (name, filename, content, content_type). ``content`` is
+    bytes or an iterable of bytes like SourceArchiveStream. The length is unknown in
+    advance, so the body is sent with chunked transfer encoding. Each iteration starts
+    from the first part again, so that the request can be retried.
+    """
+
+    def __init__(self, parts):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        self._parts = []
+        for name, filename, content, content_type in parts:
+            header = (
+                '--{}\r\n'
+                'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                'Content-Type: {}\r\n\r\n'
+            ).format(self.boundary, name, filename, content_type)
+            self._parts.append((header.encode('utf-8'), content))
+
+    def __iter__(self):
+        for header, content in self._parts:
+            yield header
+            if isinstance(content, bytes):
+                yield content
+            else:
+                yield from content
+            yield b'\r\n'
+        yield '--{}--\r\n'.format(self.boundary).encode('utf-8')
+
+
+def is_retryable_error(exception):
+    """
+    return True if the request may succeed by retrying:
+    connection errors, timeouts, 429 and 5xx
+    """
+    if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(exception, requests.exceptions.HTTPError) and exception.response is not None:
+        status_code = exception.response.status_code
+        return status_code == 429 or status_code >= 500
+    return False
+
+
+def generate_session():
+    # for callers which retry requests on their own, e.g. with pre-signed urls
     session = requests.Session()
     session.headers.update({
         'User-Agent': 'abeja-platform-cli/{}'.format(VERSION)
     })
-    retries = Retry(total=5,
-                    backoff_factor=1,
-                    method_whitelist=('GET', 'POST', 'PUT', 'DELETE', 'PATCH'),
-                    status_forcelist=(500, 502, 503, 504),
-                    raise_on_status=False)
+    return session
+
+
+def generate_retry_session():
+    session = generate_session()
+    try:
+        retries = Retry(total=5,
+                        backoff_factor=1,
+                        allowed_methods=('GET', 'POST', 'PUT', 'DELETE', 'PATCH'),
+                        status_forcelist=(500, 502, 503, 504),
+                        raise_on_status=False)
+    except TypeError:
+        retries = Retry(total=5,
+                        backoff_factor=1,
+                        method_whitelist=('GET', 'POST', 'PUT', 'DELETE', 'PATCH'),
+                        status_forcelist=(500, 502, 503, 504),
+                        raise_on_status=False)
     session.mount('https://', HTTPAdapter(max_retries=retries))
     return session
 
 
-def generate_user_session(json_content_type=True):
+def generate_user_session(json_content_type=True, retry=True):
     session = requests.Session()
     session.headers.update({
         'User-Agent': 'abeja-platform-cli/{}'.format(VERSION)
@@ -46,6 +107,10 @@ def generate_user_session(json_content_type=True):
             'Content-Type': 'application/json'
         })
 
+    # callers which retry requests on their own don't multiply the attempts
+    if not retry:
+        return session
+
     # If we update requests version , urllib3 version will updated automatically.
     # In urllib3 version 1.26.0 or later, method_whitelist was deprecated. so, we need to use allowed_methods.
     # https://github.com/urllib3/urllib3/blob/main/CHANGES.rst#1260-2020-11-10
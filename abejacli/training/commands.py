@@ -1,7 +1,6 @@
 import json
 import os
 import sys
-import urllib
 from io import StringIO
 from operator import itemgetter
 from typing import Dict, Optional
@@ -20,10 +19,11 @@ from abejacli.common import (
     __get_job_definition_name,
     __try_get_organization_id,
     json_output_formatter,
-    progress_status,
-    training_model_archive,
-    version_archive
+    training_model_archive
 )
+from abejacli.common.archive import SourceArchiveStream
+from abejacli.common.download import download_and_extract, download_file
+from abejacli.common.snapshot import SourceSnapshot
 from abejacli.config import (
     ABEJA_PLATFORM_TOKEN,
     ABEJA_PLATFORM_USER_ID,
@@ -34,13 +34,21 @@ from abejacli.config import (
     SUCCESS_EXITCODE
 )
 from abejacli.docker.commands.run import build_volumes
+from abejacli.docker.container_run import PULL_POLICIES, PULL_POLICY_ALWAYS
 from abejacli.exceptions import (
     ConfigFileNotFoundError,
     InvalidConfigException,
+    InvalidSweepException,
     ResourceNotFound
 )
 from abejacli.logger import get_logger
-from abejacli.session import api_get, api_get_data, api_patch, api_post
+from abejacli.session import (
+    MultipartStreamBody,
+    api_get,
+    api_get_data,
+    api_patch,
+    api_post
+)
 from abejacli.training import (
     CONFIGFILE_NAME,
     TrainingConfig,
@@ -49,8 +57,10 @@ from abejacli.training import (
 )
 from abejacli.training.jobs import (
     TrainingJobDebugRun,
-    TrainingJobLocalContainerRun
+    TrainingJobLocalContainerRun,
+    TrainingJobStatus
 )
+from abejacli.training.sweep import TrainingJobSweep, load_sweep
 
 logger = get_logger()
 
@@ -277,15 +287,17 @@ def start_notebook(job_definition_name, notebook_id, notebook_type, datalakes, b
               required=False, multiple=True)
 @click.option('--dataset-premounted', is_flag=True, type=bool, required=False,
               help='[Alpha stage option] Flag for pre-mounting datasets. Use this along with "--datasets" option.')
+@click.option('--no-cache', 'no_cache', is_flag=True, type=bool, required=False,
+              help='Always upload the source code. By default, uploading is skipped and the existing version is '
+                   'shown if the source code and parameters are the same as the last created version.')
 def create_training_version(
         job_definition_name, handler, image, description, environment, exclude,
-        datalakes, buckets, datasets, dataset_premounted):
+        datalakes, buckets, datasets, dataset_premounted, no_cache):
     if exclude is None:
         excludes = []
     else:
         excludes = list(exclude)
 
-    archive = None
     try:
         name = __get_job_definition_name(job_definition_name, training_config)
         config_data = training_config.read(training_config.create_version_schema)
@@ -325,12 +337,21 @@ def create_training_version(
         user_exclude_files = config_data.pop('ignores', [])
         exclude_files = set(user_exclude_files + DEFAULT_EXCLUDE_FILES + excludes)
 
-        archive = version_archive(name, exclude_files)
-
         url = "{}/training/definitions/{}/versions".format(
             ORGANIZATION_ENDPOINT, name)
 
-        r = _create_training_version(url, payload, archive)
+        snapshot = None
+        if not no_cache:
+            snapshot = SourceSnapshot(url, payload, exclude_files)
+            r = _find_snapshot_training_version(name, snapshot)
+            if r is not None:
+                click.echo('[info] source code and parameters are not changed from version {}. '
+                           'skip uploading.'.format(r.get('job_definition_version')), err=True)
+                click.echo(json_output_formatter(r))
+                return
+
+        archive = SourceArchiveStream(exclude_files)
+        r = _create_training_version(url, payload, archive, snapshot)
     except ConfigFileNotFoundError:
         logger.error('training configuration file does not exists.')
         click.echo('training configuration file does not exists.')
@@ -347,21 +368,41 @@ def create_training_version(
         logger.error('create training version aborted: {}'.format(e))
         click.echo('create training version aborted.')
         sys.exit(ERROR_EXITCODE)
-    finally:
-        if archive and os.path.exists(archive.name):
-            archive.close()
-            os.unlink(archive.name)
     click.echo(json_output_formatter(r))
 
 
-def _create_training_version(url: str, payload: Dict[str, str], archive):
-    with open(archive.name, 'rb') as archive_file:
-        json_params = json.dumps(payload)
-        files = {
-            'source_code': ('archive.tar.gz', archive_file, 'application/tar+gzip'),
-            'parameters': ('params.json', StringIO(json_params), 'application/json'),
-        }
-        return api_post(url, files=files)
+def _create_training_version(url: str, payload: Dict[str, str], archive,
+                             snapshot: Optional[SourceSnapshot] = None):
+    # the archive is compressed while it's sent as a chunked request body
+    json_params = json.dumps(payload)
+    body = MultipartStreamBody([
+        ('source_code', 'archive.tar.gz', archive, 'application/tar+gzip'),
+        ('parameters', 'params.json', json_params.encode('utf-8'), 'application/json'),
+    ])
+    r = api_post(url, data=body, headers={'Content-Type': body.content_type})
+    if snapshot and isinstance(r, dict) and 'job_definition_version' in r:
+        snapshot.record(r)
+    return r
+
+
+def _find_snapshot_training_version(name: str, snapshot: SourceSnapshot) -> Optional[Dict]:
+    """
+    return the version created from the same snapshot if it's still available
+    """
+    version = snapshot.find()
+    if not version:
+        return None
+    url = "{}/training/definitions/{}/versions/{}".format(
+        ORGANIZATION_ENDPOINT, name, version['job_definition_version'])
+    try:
+        r = api_get(url)
+    except Exception as e:
+        logger.info('version {} in the snapshot is not available: {}'.format(
+            version['job_definition_version'], e))
+        return None
+    if r.get('archived'):
+        return None
+    return r
 
 
 @training.command(name='create-version-from-git',
@@ -671,25 +712,35 @@ def describe_jobs(job_definition_name, include_archived, limit, offset):
 @click.option('-jd', '--job_definisin_id', '--job-definisin-id', 'job_definisin_id', type=str,
               help='job definition id', required=True)
 @click.option('-j', '--job_id', '--job-id', 'job_id', type=str, help='job id', required=True)
-def download_jobs_result(job_definisin_id, job_id):
+@click.option('--extract', 'extract', is_flag=True,
+              help='Extract the archive into a directory while downloading, without saving the archive')
+def download_jobs_result(job_definisin_id, job_id, extract):
     try:
-        r = _download_result(job_definisin_id, job_id)
+        r = _download_result(job_definisin_id, job_id, extract)
     except:
         sys.exit(ERROR_EXITCODE)
 
-    click.echo('Downloaded a file {}.'.format(r))
+    if extract:
+        click.echo('Extracted files into {}.'.format(r))
+    else:
+        click.echo('Downloaded a file {}.'.format(r))
 
 
-def _download_result(job_definition_id, job_id):
+def _download_result(job_definition_id, job_id, extract=False):
 
     url = '{}/training/definitions/{}/jobs/{}/result'.format(
         ORGANIZATION_ENDPOINT, job_definition_id, job_id)
     r = api_get(url)
     download_uri = r['artifacts']['complete']['uri']
+    if extract:
+        return download_and_extract(
+            download_uri, '{}_{}'.format(job_definition_id, job_id),
+            url_provider=lambda: api_get(url)['artifacts']['complete']['uri'])
     file_name = os.path.basename(download_uri[:download_uri.find('?')])
     target_file_name = '{}_{}_{}'.format(job_definition_id, job_id, file_name)
-    urllib.request.urlretrieve(
-        download_uri, target_file_name, progress_status)
+    download_file(
+        download_uri, target_file_name,
+        url_provider=lambda: api_get(url)['artifacts']['complete']['uri'])
 
     return target_file_name
 
@@ -1151,6 +1202,7 @@ def debug_local(
         with TrainingJobDebugRun(
             handler=handler, image=image, organization_id=organization_id,
             datasets=datasets, environment=environment, volume=volume, no_cache=no_cache,
+            exclude_patterns=config_data.get('ignores') or [],
             build_only=build_only, quiet=quiet, stdout=click.echo, runtime=runtime,
             platform_user_id=ABEJA_PLATFORM_USER_ID,
             platform_personal_access_token=ABEJA_PLATFORM_TOKEN, v1flag=v1
@@ -1192,12 +1244,26 @@ def debug_local(
               required=False)
 @click.option('--runtime', 'runtime', type=str, required=False,
               help='Runtime, equivalent to docker run `--runtime` option')
+@click.option('--pull', 'pull_policy', type=click.Choice(PULL_POLICIES), default=PULL_POLICY_ALWAYS,
+              show_default=True, required=False,
+              help='Pull the image always, only if it does not exist locally, or never')
+@click.option('--cpus', 'cpus', type=click.FloatRange(min=0), required=False,
+              help='Number of CPUs of each container, equivalent to docker run `--cpus` option')
+@click.option('--memory', 'memory', type=str, required=False,
+              help='Memory limit of each container, equivalent to docker run `--memory` option. ex) 4g')
+@click.option('--sweep', 'sweep', type=click.Path(exists=True, dir_okay=False), required=False,
+              help='YAML or JSON file of a list of environment variables, or a grid of their values. '
+                   'A training job is run for each set of environment variables')
+@click.option('--parallel', 'parallel', type=click.IntRange(min=1), required=False,
+              help='Max number of training jobs of a sweep at a time. By default, as many as '
+                   'CPUs and memory of docker host allow, or one by one with `--runtime`')
 @click_config_file.configuration_option(
     provider=__training_config_provider, implicit=True,
     default=CONFIGFILE_NAME,  # by setting `default`, not allow to use `click.get_app_dir`
     config_file_name=CONFIGFILE_NAME,
     help='Read Configuration from PATH. By default read from `{}`'.format(CONFIGFILE_NAME))
-def train_local(organization_id, name, version, description, datasets, environment, volume, v1, runtime=None):
+def train_local(organization_id, name, version, description, datasets, environment, volume, v1, runtime=None,
+                pull_policy=PULL_POLICY_ALWAYS, cpus=None, memory=None, sweep=None, parallel=None):
     try:
         name = __get_job_definition_name(name, training_config)
         config_data = training_config.read(training_config.local_schema)
@@ -1216,14 +1282,33 @@ def train_local(organization_id, name, version, description, datasets, environme
 
         volume = build_volumes(volume) if volume else {}
 
+        if sweep:
+            results = TrainingJobSweep(
+                load_sweep(sweep), organization_id=organization_id, job_definition_name=name,
+                job_definition_version=version, description=description,
+                datasets=datasets, environment=environment, volume=volume, runtime=runtime,
+                cpus=cpus, memory=memory, parallel=parallel, pull_policy=pull_policy,
+                stdout=click.echo, platform_user_id=ABEJA_PLATFORM_USER_ID,
+                platform_personal_access_token=ABEJA_PLATFORM_TOKEN, v1flag=v1
+            ).run()
+            click.echo(json_output_formatter(results))
+            if any(result['status'] != TrainingJobStatus.COMPLETED.value for result in results):
+                sys.exit(ERROR_EXITCODE)
+            return
+
         with TrainingJobLocalContainerRun(
             organization_id=organization_id, job_definition_name=name,
             job_definition_version=version, description=description,
             datasets=datasets, environment=environment, volume=volume, runtime=runtime,
             stdout=click.echo, platform_user_id=ABEJA_PLATFORM_USER_ID,
-            platform_personal_access_token=ABEJA_PLATFORM_TOKEN, v1flag=v1
+            platform_personal_access_token=ABEJA_PLATFORM_TOKEN, v1flag=v1,
+            pull_policy=pull_policy, cpus=cpus, memory=memory
         ) as job:
             job.watch()
+    except InvalidSweepException as e:
+        logger.error('invalid sweep file: {}'.format(e))
+        click.echo('invalid sweep file: {}'.format(e))
+        sys.exit(ERROR_EXITCODE)
     except ConfigFileNotFoundError:
         logger.error('training configuration file does not exists.')
         click.echo('training configuration file does not exists.')
@@ -1,21 +1,31 @@
 import copy
+import gzip
 import json
 import os
+import queue
+import tempfile
+import threading
 import time
-import zipfile
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime
 from enum import Enum
 from tempfile import TemporaryDirectory
-from typing import Optional
+from typing import Callable, Optional
 
 from requests.exceptions import HTTPError
+from retrying import retry
 
 from abejacli.common import convert_to_local_image_name
+from abejacli.common.archive import ParallelZipWriter
 from abejacli.config import (
     ABEJA_API_URL,
+    ARTIFACT_UPLOAD_RETRY_ATTEMPT_NUMBER,
+    LOG_COMPRESS,
     LOG_FLUSH_INTERVAL,
+    LOG_FLUSH_TIMEOUT,
     LOG_MAX_SIZE,
+    LOG_OVERFLOW_POLICY,
+    LOG_QUEUE_SIZE,
     ORGANIZATION_ENDPOINT,
     POLLING_INTERVAL,
     RESERVED_ENV_VAR,
@@ -32,14 +42,35 @@ from abejacli.docker.commands.run import (
     get_default_volume,
     get_storage_volume
 )
-from abejacli.docker.container_run import ContainerBuildAndRun, ContainerRun
+from abejacli.docker.container_run import (
+    PULL_POLICY_ALWAYS,
+    ContainerBuildAndRun,
+    ContainerRun
+)
 from abejacli.docker.utils import parse_image
+from abejacli.logger import get_logger
 from abejacli.model.docker_handler import LOCAL_TRAIN_TYPE_VALUE  # deprecate
-from abejacli.session import generate_retry_session, generate_user_session
+from abejacli.session import (
+    generate_retry_session,
+    generate_session,
+    generate_user_session,
+    is_retryable_error
+)
 from abejacli.training.client import (
     create_local_training_job,
     describe_training_version
 )
+from abejacli.training.status_watcher import PollingStatusSource, StatusWatcher
+
+logger = get_logger()
+
+
+def _is_retryable_upload_error(exception):
+    # a pre-signed url is rejected when it is expired
+    if isinstance(exception, HTTPError) and exception.response is not None \
+            and exception.response.status_code == 403:
+        return True
+    return is_retryable_error(exception)
 
 
 class TrainingJobDebugRun(ContainerBuildAndRun):
@@ -107,16 +138,240 @@ def truncate_log_line(
     if max_size < len(json.dumps({**log_line, 'message': suffix}, ensure_ascii=False).encode(encoding)):
         raise ValueError('max_size should be greater than size of payload without message')
 
-    trimmed = False
-    while len(json.dumps(log_line, ensure_ascii=False).encode(encoding)) > max_size:
-        log_line['message'] = log_line['message'][:-1]
-        trimmed = True
+    def _size(message):
+        return len(json.dumps({**log_line, 'message': message}, ensure_ascii=False).encode(encoding))
+
+    message = log_line['message']
+    if _size(message) <= max_size:
+        return log_line
+
+    # binary search the longest prefix which fits with the suffix.
+    # the size is monotonic in the prefix length, and every character takes
+    # at least one byte, so the prefix is never longer than max_size.
+    low, high = 0, min(len(message), max_size)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _size(message[:mid] + suffix) <= max_size:
+            low = mid
+        else:
+            high = mid - 1
 
-    if trimmed:
-        log_line['message'] = log_line['message'][:-3] + suffix
+    log_line['message'] = message[:low] + suffix
     return log_line
 
 
+class LogShipper(object):
+    """
+    Send log lines from a background thread, so that reading container logs
+    never waits for the platform API.
+
+    Lines are batched until the batch reaches ``max_size`` bytes or ``flush_interval``
+    seconds have passed since the first line of the batch. When the sender falls behind
+    and the queue is full, lines are written to a temporary file and sent later (``spill``),
+    discarded (``drop``), or the caller waits for the sender (``block``).
+
+    One shipper can be shared by many jobs: lines put with a ``key`` are batched
+    per key and sent by ``send(logs, key)`` instead of ``send(logs)``.
+    """
+
+    _END = object()
+
+    def __init__(self, send: Callable[..., None], max_size: int = LOG_MAX_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, queue_size: int = LOG_QUEUE_SIZE,
+                 overflow_policy: str = LOG_OVERFLOW_POLICY):
+        self._send = send
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        # iterator of lines read from the spill file taken by the background thread
+        self._spilled = None
+        self._spill_file = None
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        # key -> (log lines, size of them)
+        self._batches = OrderedDict()
+        self._deadline = None
+
+    def start(self) -> 'LogShipper':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, message: str, timestamp: Optional[int] = None, key: Optional[str] = None):
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        item = (message, timestamp, time.monotonic(), key)
+        if self.overflow_policy == 'block':
+            self._queue.put(item)
+            return
+
+        with self._spill_lock:
+            # once lines are spilled, following lines are spilled too to keep the order
+            if self._spill_file is None:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+            if self.overflow_policy == 'drop':
+                if not self.dropped:
+                    logger.warning('sending logs falls behind, drop log lines')
+                self.dropped += 1
+                return
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+                logger.warning('sending logs falls behind, spill log lines to disk')
+            self._spill_file.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    def flush(self, timeout: Optional[float] = LOG_FLUSH_TIMEOUT) -> bool:
+        """
+        send log lines put so far, and wait until they are sent
+
+        :param timeout: seconds to wait
+        :return: False if they are not sent within ``timeout``
+        """
+        if self._thread is None:
+            return True
+        sent = threading.Event()
+        try:
+            self._queue.put(sent, timeout=timeout)
+        except queue.Full:
+            pass
+        else:
+            if sent.wait(timeout):
+                return True
+        logger.warning('sending logs did not finish in {} seconds'.format(timeout))
+        return False
+
+    def close(self):
+        """
+        send remaining log lines and stop the background thread
+        """
+        if self._thread is None:
+            return
+        self._queue.put(self._END)
+        self._thread.join()
+        self._thread = None
+        if self.dropped:
+            logger.warning('{} log lines were dropped'.format(self.dropped))
+
+    @staticmethod
+    def _read_spilled(spill_file):
+        with spill_file:
+            spill_file.seek(0)
+            for line in spill_file:
+                yield tuple(json.loads(line))
+
+    def _take_spilled(self) -> bool:
+        with self._spill_lock:
+            spill_file, self._spill_file = self._spill_file, None
+        if spill_file is None:
+            return False
+        self._spilled = self._read_spilled(spill_file)
+        return True
+
+    def _next_spilled(self, take: bool = False):
+        """
+        return the next spilled line, which is read from the spill file one by one.
+        with ``take``, the current spill file is taken after the previous one is consumed.
+        """
+        while True:
+            if self._spilled is None and not (take and self._take_spilled()):
+                return None
+            item = next(self._spilled, None)
+            if item is not None:
+                return item
+            self._spilled = None
+
+    def _next_item(self, deadline: Optional[float]):
+        item = self._next_spilled()
+        if item is not None:
+            return item
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        # spilled lines are older than lines queued after the queue is drained
+        item = self._next_spilled(take=True)
+        if item is not None:
+            return item
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout > threading.TIMEOUT_MAX:
+                timeout = None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _encode(self, message: str, timestamp: int):
+        log_line = {'message': message, 'timestamp': timestamp}
+        log_line_size = len(json.dumps(log_line, ensure_ascii=False).encode('utf-8'))
+        # trim log line if one log line exceeds limit
+        if log_line_size > self.max_size:
+            return truncate_log_line(log_line, max_size=self.max_size), self.max_size
+        return log_line, log_line_size
+
+    def _add(self, item):
+        message, timestamp, enqueued_at, key = item
+        if self._deadline is not None and enqueued_at >= self._deadline:
+            self._flush()
+        log_line, log_line_size = self._encode(message, timestamp)
+        logs, size = self._batches.get(key, ([], 0))
+        logs.append(log_line)
+        self._batches[key] = (logs, size + log_line_size)
+        if self._deadline is None:
+            self._deadline = enqueued_at + self.flush_interval
+        if size + log_line_size >= self.max_size:
+            self._flush_batch(key)
+
+    def _add_all_spilled(self):
+        while True:
+            item = self._next_spilled(take=True)
+            if item is None:
+                return
+            self._add(item)
+
+    def _flush(self):
+        for key in list(self._batches):
+            self._flush_batch(key)
+
+    def _flush_batch(self, key: Optional[str]):
+        logs, _ = self._batches.pop(key)
+        if not self._batches:
+            self._deadline = None
+        try:
+            if key is None:
+                self._send(logs)
+            else:
+                self._send(logs, key)
+        except Exception as e:
+            # designed to allow missing logs, not to stop training job.
+            logger.warning('failed to send logs, error : {}'.format(e))
+
+    def _run(self):
+        while True:
+            item = self._next_item(self._deadline)
+            if item is None:
+                # flush interval has passed
+                self._flush()
+            elif item is self._END:
+                # lines spilled until closing are the last ones
+                self._add_all_spilled()
+                self._flush()
+                return
+            elif isinstance(item, threading.Event):
+                # lines spilled until flushing are put before it
+                self._add_all_spilled()
+                self._flush()
+                item.set()
+            else:
+                self._add(item)
+
+
 class TrainingJobLocalContainerRun(ContainerRun):
 
     def __init__(
@@ -127,7 +382,10 @@ class TrainingJobLocalContainerRun(ContainerRun):
             runtime=None, stdout=None, remove=True,
             platform_user_id=None, platform_personal_access_token=None,
             v1flag=False, log_flush_interval=LOG_FLUSH_INTERVAL,
-            log_max_size=LOG_MAX_SIZE, polling_interval=POLLING_INTERVAL):
+            log_max_size=LOG_MAX_SIZE, polling_interval=POLLING_INTERVAL,
+            log_compress=LOG_COMPRESS, status_source=None,
+            pull_policy=PULL_POLICY_ALWAYS, cpus=None, memory=None,
+            log_shipper=None, status_poller=None):
         self.job_definition_name = job_definition_name
         self.job_definition_version = job_definition_version
         self.description = description
@@ -138,14 +396,25 @@ class TrainingJobLocalContainerRun(ContainerRun):
         self.log_max_size = log_max_size
         self.log_flush_interval = log_flush_interval
         self.polling_interval = polling_interval
-        self.executor = None
+        self.log_compress = log_compress
+        self.status_source = status_source
+        self.status_watcher = None
+        self.cpus = cpus
+        self.memory = memory
+        # shared by jobs running together, see TrainingJobSweep
+        self.log_shipper = log_shipper
+        self.status_poller = status_poller
+        self._log_session = None
+        self._status_session = None
         self.is_finished = False
+        self.status = None
 
         super().__init__(
             None, None, organization_id, datasets, environment, volume,
             no_cache=True, runtime=runtime, stdout=stdout, build_only=False,
             quiet=False, platform_user_id=platform_user_id, remove=remove,
-            platform_personal_access_token=platform_personal_access_token)
+            platform_personal_access_token=platform_personal_access_token,
+            pull_policy=pull_policy)
 
     def watch(self):
         # update container info
@@ -153,51 +422,46 @@ class TrainingJobLocalContainerRun(ContainerRun):
         if self.container is None:
             raise RuntimeError("container does not exist")
 
-        # periodically check remote status
+        # watch remote status
         # and stop container if remote status is STOPPED
-        self.executor = ThreadPoolExecutor()
-        self.executor.submit(self._check_remote_status_and_stop_if_canceled)
-
-        # flush every LOG_FLUSH_INTERVAL seconds or
-        # if log buffer exceeds LOG_BUFFER_SIZE.
-        logs = []
-        log_size = 0
-        start = time.monotonic()
-
-        for out in self.container.logs(stream=True):
-            line = out.decode('utf-8').rstrip()
-            if self.stdout:
-                self.stdout(line)
-
-            # 43 bytes of overhead
-            log_line = {'message': line, 'timestamp': int(time.time() * 1000)}
-
-            # trim log line if one log line exceeds limit
-            log_line_size = len(json.dumps(log_line, ensure_ascii=False).encode('utf-8'))
-            if log_line_size > self.log_max_size:
-                log_line = truncate_log_line(
-                    log_line, max_size=self.log_max_size)
-                log_size += self.log_max_size
+        if self.status_poller is not None:
+            self.status_poller.add(self.training_job_id, self._get_remote_status, self._on_remote_stopped)
+        else:
+            source = self.status_source or PollingStatusSource(self._get_remote_status)
+            self.status_watcher = StatusWatcher(
+                source, [TrainingJobStatus.STOPPED.value], self._on_remote_stopped,
+                max_interval=self.polling_interval).start()
+
+        # logs are sent by a background thread in batches,
+        # so that the training output never waits for the platform API.
+        if self.log_shipper is not None:
+            shipper, key = self.log_shipper, self.training_job_id
+        else:
+            shipper, key = LogShipper(
+                self._send_logs, max_size=self.log_max_size,
+                flush_interval=self.log_flush_interval).start(), None
+        try:
+            for out in self.container.logs(stream=True):
+                line = out.decode('utf-8').rstrip()
+                if self.stdout:
+                    self.stdout(line)
+                shipper.put(line, key=key)
+        finally:
+            if self.log_shipper is not None:
+                # send logs before the status is updated
+                shipper.flush()
             else:
-                log_size += log_line_size
-
-            logs.append(log_line)
-
-            # flush logs if logs exceeds buffer limit
-            if (log_size >= self.log_max_size) or \
-                    (time.monotonic() - start) >= self.log_flush_interval:
-                self._send_logs(logs)
-
-                # reset conditions
-                logs = []
-                log_size = 0
-                start = time.monotonic()
-
-        if len(logs) > 0:
-            self._send_logs(logs)
+                shipper.close()
 
         self.is_finished = True
-        self.executor.shutdown(wait=False)
+        self._stop_watching_status()
+
+    def _stop_watching_status(self):
+        if self.status_poller is not None:
+            self.status_poller.remove(self.training_job_id)
+        if self.status_watcher:
+            # NOTE: allow to call stop even if it is already so.
+            self.status_watcher.stop(timeout=0)
 
     def _prepare(self):
         version = describe_training_version(
@@ -268,7 +532,8 @@ class TrainingJobLocalContainerRun(ContainerRun):
             platform_organization_id=self.organization_id,
             command=run_command,
             volume=volume_options,
-            remove=False    # do not remove container to check the status
+            remove=False,   # do not remove container to check the status
+            cpus=self.cpus, memory=self.memory
         )
 
     def _start(self):
@@ -281,8 +546,9 @@ class TrainingJobLocalContainerRun(ContainerRun):
     def _on_end(self):
         # TODO: better to allow upload artifact in Active status,
         # and change status to Complete if succeeded in uploading artifact.
+        self.status = self._get_container_status()
         self._update_status({
-            'status': self._get_container_status(),
+            'status': self.status,
             'completion_time': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
         })
 
@@ -304,8 +570,7 @@ class TrainingJobLocalContainerRun(ContainerRun):
     def _upload_artifact(self):
         """upload training job artifact to platform.
 
-        TODO: retry as many times as possible not to lose the artifact file,
-        or consider to save artifact file in local if fail in uploading.
+        the archive is kept if it fails in uploading, so as not to lose the artifact.
         """
         archived_file_path = self._archive_artifact()
 
@@ -313,10 +578,21 @@ class TrainingJobLocalContainerRun(ContainerRun):
         if archived_file_path is None:
             return
 
-        with generate_retry_session() as session:
-            session.headers.update({
-                'Authorization': 'Bearer {}'.format(self.platform_auth_token)
-            })
+        try:
+            self._put_artifact(archived_file_path)
+        except Exception:
+            self.logger.error('failed to upload artifact of training job {}, the archive is kept in {}'.format(
+                self.training_job_id, archived_file_path))
+            raise
+        os.remove(archived_file_path)
+
+    @retry(stop_max_attempt_number=ARTIFACT_UPLOAD_RETRY_ATTEMPT_NUMBER,
+           wait_exponential_multiplier=1000, wait_exponential_max=30000,
+           retry_on_exception=_is_retryable_upload_error)
+    def _put_artifact(self, archived_file_path: str):
+        # get a new upload url on every attempt, because the previous one may be expired.
+        # the sessions don't retry by themselves, not to multiply the attempts.
+        with self._generate_job_session(retry=False) as session:
             url = '{}/training/definitions/{}/jobs/{}/result'.format(
                 ORGANIZATION_ENDPOINT, self.job_definition_name, self.training_job_id)
             res = session.post(url)
@@ -325,32 +601,37 @@ class TrainingJobLocalContainerRun(ContainerRun):
 
         presigned_upload_url = res['uri']
 
-        with generate_retry_session() as session:
+        # the file is streamed, not loaded into memory, and it's opened again on retries
+        with generate_session() as session:
             with open(archived_file_path, 'rb') as f:
                 headers = {'Content-Type': 'application/zip'}
                 res = session.put(presigned_upload_url, headers=headers, data=f)
                 res.raise_for_status()
 
     def _archive_artifact(self):
-        archive_filename = '{}.zip'.format(self.training_job_id)
         archive_dir_path = self.temporary_archive_dir.name
-        archive_filepath = os.path.join(archive_dir_path, archive_filename)
-
-        target_files = []
-        for root, dirs, files in os.walk(archive_dir_path):
-            for file in files:
-                abs_file_path = os.path.join(root, file)
-                if os.path.exists(abs_file_path):
-                    target_files.append(abs_file_path)
-
-        if not target_files:
+        # write the archive outside of the directory to archive,
+        # and keep the name of it if it fails in uploading.
+        archive_filepath = os.path.join(
+            os.path.dirname(archive_dir_path), '{}.zip'.format(self.training_job_id))
+
+        archived = False
+        with open(archive_filepath, 'wb') as f, ParallelZipWriter(f) as z:
+            for root, dirs, files in os.walk(archive_dir_path):
+                dirs.sort()
+                for file in sorted(files):
+                    abs_file_path = os.path.join(root, file)
+                    if not os.path.isfile(abs_file_path):
+                        continue
+                    # keep sub directories not to overwrite files with the same name
+                    rel_path = os.path.relpath(abs_file_path, archive_dir_path).replace(os.sep, '/')
+                    z.write(abs_file_path, arcname='{}/{}'.format(self.training_job_id, rel_path))
+                    archived = True
+
+        if not archived:
+            os.remove(archive_filepath)
             return None
 
-        with zipfile.ZipFile(archive_filepath, 'w', compression=zipfile.ZIP_DEFLATED) as z:
-            for target_file in target_files:
-                file = os.path.basename(target_file)
-                z.write(target_file, arcname=os.path.join(self.training_job_id, file))
-
         return archive_filepath
 
     def _update_status(self, status: dict):
@@ -371,36 +652,41 @@ class TrainingJobLocalContainerRun(ContainerRun):
             res = session.put(url, json=status)
             res.raise_for_status()
 
-    def _get_remote_status(self) -> Optional[str]:
-        with generate_retry_session() as session:
-            session.headers.update({
-                'Authorization': 'Bearer {}'.format(self.platform_auth_token)
-            })
-            url = '{}/training/definitions/{}/jobs/{}'.format(
-                ORGANIZATION_ENDPOINT, self.job_definition_name, self.training_job_id)
-            res = session.get(url)
-            res.raise_for_status()
-            res = res.json()
-            return res.get('status')
+    def _generate_job_session(self, retry=True):
+        session = generate_retry_session() if retry else generate_session()
+        session.headers.update({
+            'Authorization': 'Bearer {}'.format(self.platform_auth_token)
+        })
+        return session
 
-    def _check_remote_status_and_stop_if_canceled(self):
+    def _get_remote_status(self) -> Optional[str]:
+        # keep one session to reuse the connection while watching
+        if self._status_session is None:
+            self._status_session = self._generate_job_session()
         self.logger.debug('checking training job {} remote status'.format(self.training_job_id))
-        current_status = self._get_remote_status()
-        while current_status != TrainingJobStatus.STOPPED.value:
-            time.sleep(self.polling_interval)
-            self.logger.debug('checking training job {} remote status'.format(self.training_job_id))
-            current_status = self._get_remote_status()
-            if self.is_finished:
-                return
+        url = '{}/training/definitions/{}/jobs/{}'.format(
+            ORGANIZATION_ENDPOINT, self.job_definition_name, self.training_job_id)
+        res = self._status_session.get(url)
+        res.raise_for_status()
+        res = res.json()
+        return res.get('status')
+
+    def _on_remote_stopped(self, status: str):
+        if self.is_finished:
+            return
         self.logger.info('stop training job {} because remote status is stopped'.format(self.training_job_id))
         self._stop()
 
     def _clean(self):
         super()._clean()
 
-        if self.executor:
-            # NOTE: allow to call shutdown even if it is already so.
-            self.executor.shutdown(wait=False)
+        self._stop_watching_status()
+
+        for session in (self._log_session, self._status_session):
+            if session is not None:
+                session.close()
+        self._log_session = None
+        self._status_session = None
 
         # NOTE: no need to flush container logs
         # because sending logs when they are emitted.
@@ -442,17 +728,21 @@ class TrainingJobLocalContainerRun(ContainerRun):
         NOTE: designed to allow missing logs,
         not to stop training job.
         """
-        with generate_retry_session() as session:
-            session.headers.update({
-                'Authorization': 'Bearer {}'.format(self.platform_auth_token)
-            })
-            url = '{}/training/definitions/{}/jobs/{}/logs'.format(
-                ORGANIZATION_ENDPOINT, self.job_definition_name, self.training_job_id)
-            res = session.post(url, json={'logs': logs})
-            try:
-                res.raise_for_status()
-            except HTTPError as e:
-                self.logger.warn('failed to send logs, error : {}'.format(e))
+        # keep one session to reuse the connection
+        if self._log_session is None:
+            self._log_session = self._generate_job_session()
+        url = '{}/training/definitions/{}/jobs/{}/logs'.format(
+            ORGANIZATION_ENDPOINT, self.job_definition_name, self.training_job_id)
+        data = json.dumps({'logs': logs}).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.log_compress:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+        res = self._log_session.post(url, data=data, headers=headers)
+        try:
+            res.raise_for_status()
+        except HTTPError as e:
+            self.logger.warn('failed to send logs, error : {}'.format(e))
 
     def _get_run_command(self):
         try:
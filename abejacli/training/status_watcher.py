@@ -0,0 +1,144 @@
+import threading
+from typing import Callable, Iterable, Optional
+
+from abejacli.config import POLLING_INTERVAL, POLLING_MIN_INTERVAL
+from abejacli.logger import get_logger
+
+logger = get_logger()
+
+
+class PollingStatusSource(object):
+    """
+    Source of the remote status which fetches the current status on every call.
+
+    A source is any object with ``get_status(last_status)`` and ``blocking``.
+    A source backed by long polling or server-sent events waits on the server
+    until the status differs from ``last_status``, and sets ``blocking`` to True
+    so that the watcher calls it again without waiting.
+    """
+
+    blocking = False
+
+    def __init__(self, fetch: Callable[[], Optional[str]]):
+        self._fetch = fetch
+
+    def get_status(self, last_status: Optional[str] = None) -> Optional[str]:
+        return self._fetch()
+
+
+class StatusWatcher(object):
+    """
+    Watch the remote status in a background thread, and call ``callback``
+    once the status becomes one of ``target_statuses``.
+
+    While the status stays the same, the interval between polls grows from
+    ``min_interval`` up to ``max_interval``, and it is reset when the status
+    changes. Errors are retried with the same backoff. ``stop()`` wakes the
+    thread up immediately.
+    """
+
+    def __init__(self, source, target_statuses: Iterable[str], callback: Callable[[str], None],
+                 min_interval: float = POLLING_MIN_INTERVAL, max_interval: float = POLLING_INTERVAL,
+                 backoff: float = 2.0):
+        self.source = source
+        self.target_statuses = set(target_statuses)
+        self.callback = callback
+        self.max_interval = max_interval
+        self.min_interval = min(min_interval, max_interval)
+        self.backoff = backoff
+        self.status = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'StatusWatcher':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stopped.is_set():
+            try:
+                status = self.source.get_status(self.status)
+            except Exception as e:
+                logger.debug('failed to get remote status, error : {}'.format(e))
+                interval = min(interval * self.backoff, self.max_interval)
+                if self._stopped.wait(interval):
+                    return
+                continue
+
+            if self._stopped.is_set():
+                return
+            if status in self.target_statuses:
+                self.status = status
+                self.callback(status)
+                return
+
+            if status != self.status:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            self.status = status
+            if not self.source.blocking and self._stopped.wait(interval):
+                return
+
+
+class StatusPoller(object):
+    """
+    Watch the remote statuses of many jobs in one background thread, so that
+    jobs running together do not poll the platform on their own.
+
+    Every ``interval`` seconds, the status of each watched job is fetched in turn,
+    and ``callback`` of the job is called once its status becomes one of
+    ``target_statuses``. Errors are ignored until the next round.
+    """
+
+    def __init__(self, target_statuses: Iterable[str], interval: float = POLLING_INTERVAL):
+        self.target_statuses = set(target_statuses)
+        self.interval = interval
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'StatusPoller':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def add(self, key: str, fetch: Callable[[], Optional[str]], callback: Callable[[str], None]):
+        with self._lock:
+            self._watches[key] = (fetch, callback)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._watches.pop(key, None)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                watches = list(self._watches.items())
+            for key, (fetch, callback) in watches:
+                if self._stopped.is_set():
+                    return
+                try:
+                    status = fetch()
+                except Exception as e:
+                    logger.debug('failed to get remote status of {}, error : {}'.format(key, e))
+                    continue
+                if status in self.target_statuses:
+                    with self._lock:
+                        # the job may be removed while fetching
+                        if self._watches.pop(key, None) is None:
+                            continue
+                    callback(status)
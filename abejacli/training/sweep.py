@@ -0,0 +1,202 @@
+import itertools
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+from docker.utils import parse_bytes
+from ruamel.yaml import YAML
+
+from abejacli.common import convert_to_local_image_name
+from abejacli.config import POLLING_INTERVAL
+from abejacli.docker.container_run import (
+    PULL_POLICY_ALWAYS,
+    PULL_POLICY_NEVER,
+    prepare_image
+)
+from abejacli.exceptions import InvalidSweepException
+from abejacli.task import ClickLogger
+from abejacli.training.client import describe_training_version
+from abejacli.training.jobs import (
+    LogShipper,
+    TrainingJobLocalContainerRun,
+    TrainingJobStatus
+)
+from abejacli.training.status_watcher import StatusPoller
+
+yaml = YAML()
+
+
+def load_sweep(path: str) -> List[Dict[str, str]]:
+    """
+    load environment variables of each run from a yaml or json file, which is
+    either a list of environment variables of each run:
+
+        - {LEARNING_RATE: 0.1}
+        - {LEARNING_RATE: 0.01, BATCH_SIZE: 64}
+
+    or a grid of values of each variable, whose all combinations are run:
+
+        LEARNING_RATE: [0.1, 0.01]
+        BATCH_SIZE: [32, 64]
+
+    :param path: sweep file path
+    :return: list of environment variables
+    """
+    with open(path, 'r') as f:
+        sweep = yaml.load(f)
+
+    if isinstance(sweep, dict):
+        names = list(sweep.keys())
+        values = [v if isinstance(v, list) else [v] for v in sweep.values()]
+        overrides = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+    elif isinstance(sweep, list) and all(isinstance(override, dict) for override in sweep):
+        overrides = sweep
+    else:
+        raise InvalidSweepException('sweep must be a list of environment variables or a grid of their values')
+    if not overrides:
+        raise InvalidSweepException('sweep has no runs')
+    return [{str(k): str(v) for k, v in override.items()} for override in overrides]
+
+
+def sweep_parallelism(runs: int, parallel: Optional[int] = None, cpus: Optional[float] = None,
+                      memory: Optional[str] = None, runtime: Optional[str] = None,
+                      host_info: Optional[Dict[str, Any]] = None) -> int:
+    """
+    return the number of runs to run at a time, which is ``parallel`` or all runs by default,
+    bounded by the CPUs and the memory of the docker host divided by ``cpus`` and
+    ``memory`` of each run. Runs with ``runtime`` (e.g. nvidia) share its devices,
+    so they run one by one unless ``parallel`` is given.
+
+    :param runs: number of runs
+    :param parallel: max number of runs at a time
+    :param cpus: number of CPUs of each run
+    :param memory: memory limit of each run, e.g. 4g
+    :param runtime: docker runtime
+    :param host_info: result of `docker info`
+    :return: number of runs at a time
+    """
+    limits = [runs, parallel or (1 if runtime else runs)]
+    host_info = host_info or {}
+    if cpus and host_info.get('NCPU'):
+        limits.append(int(host_info['NCPU'] // cpus))
+    if memory and host_info.get('MemTotal'):
+        limits.append(host_info['MemTotal'] // parse_bytes(memory))
+    return max(1, min(limits))
+
+
+def _prefixed(stdout: Optional[Callable[[str], None]], prefix: str) -> Optional[Callable[[str], None]]:
+    if stdout is None:
+        return None
+    return lambda line: stdout('{} {}'.format(prefix, line))
+
+
+class TrainingJobSweep(object):
+    """
+    Run local training jobs of a job definition version with each set of
+    environment variables in ``overrides``, ``parallel`` jobs at a time.
+
+    The jobs share the image which is pulled once, one log shipper and one
+    status poller, instead of pulling and polling on their own.
+    """
+
+    def __init__(self, overrides: List[Dict[str, str]], job_definition_name: str,
+                 job_definition_version: int, environment: Optional[dict] = None,
+                 parallel: Optional[int] = None, cpus: Optional[float] = None,
+                 memory: Optional[str] = None, runtime: Optional[str] = None,
+                 pull_policy: str = PULL_POLICY_ALWAYS, polling_interval: float = POLLING_INTERVAL,
+                 stdout: Optional[Callable[[str], None]] = None, **kwargs):
+        """
+        :param kwargs: other arguments of ``TrainingJobLocalContainerRun``
+        """
+        self.overrides = overrides
+        self.job_definition_name = job_definition_name
+        self.job_definition_version = job_definition_version
+        self.environment = environment or {}
+        self.parallel = parallel
+        self.cpus = cpus
+        self.memory = memory
+        self.runtime = runtime
+        self.pull_policy = pull_policy
+        self.polling_interval = polling_interval
+        self.stdout = stdout
+        self.run_kwargs = kwargs
+        self.logger = ClickLogger()
+        self.runs = []
+        self._cancelled = threading.Event()
+
+    def run(self) -> List[Dict[str, Any]]:
+        """
+        run all jobs, and return the environment variables, the training job id
+        and the status of each job.
+        """
+        client = docker.from_env()
+        version = describe_training_version(self.job_definition_name, self.job_definition_version)
+        image_name = convert_to_local_image_name(version['image'])
+        prepare_image(client, client.api, image_name, self.pull_policy, self.logger)
+
+        parallelism = sweep_parallelism(
+            len(self.overrides), self.parallel, self.cpus, self.memory, self.runtime, client.info())
+        self.logger.info('run {} training jobs, {} at a time'.format(len(self.overrides), parallelism))
+
+        shipper = LogShipper(self._send_logs).start()
+        poller = StatusPoller([TrainingJobStatus.STOPPED.value], interval=self.polling_interval).start()
+        try:
+            # runs are created in the main thread because they set signal handlers
+            self.runs = [self._create_run(i, override, shipper, poller)
+                         for i, override in enumerate(self.overrides)]
+            signal.signal(signal.SIGINT, self._signal_handler)
+            signal.signal(signal.SIGTERM, self._signal_handler)
+            executor = ThreadPoolExecutor(max_workers=parallelism)
+            futures = [executor.submit(self._run_job, run) for run in self.runs]
+            try:
+                statuses = [future.result() for future in futures]
+            finally:
+                # queued jobs are not started on interruption
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+        finally:
+            shipper.close()
+            poller.stop(timeout=0)
+
+        return [{
+            'environment': override,
+            'training_job_id': run.training_job_id,
+            'status': status
+        } for override, run, status in zip(self.overrides, self.runs, statuses)]
+
+    def _create_run(self, index: int, override: Dict[str, str], shipper: LogShipper,
+                    poller: StatusPoller) -> TrainingJobLocalContainerRun:
+        return TrainingJobLocalContainerRun(
+            job_definition_name=self.job_definition_name,
+            job_definition_version=self.job_definition_version,
+            environment={**self.environment, **override}, runtime=self.runtime,
+            cpus=self.cpus, memory=self.memory, stdout=_prefixed(self.stdout, '[{}]'.format(index)),
+            # the image is already prepared
+            pull_policy=PULL_POLICY_NEVER, log_shipper=shipper, status_poller=poller,
+            **self.run_kwargs)
+
+    def _run_job(self, run: TrainingJobLocalContainerRun) -> str:
+        if self._cancelled.is_set():
+            return TrainingJobStatus.STOPPED.value
+        try:
+            with run as job:
+                job.watch()
+        except Exception as e:
+            self.logger.error('training job {} failed: {}'.format(run.training_job_id, e))
+        return run.status or TrainingJobStatus.FAILED.value
+
+    def _send_logs(self, logs: List[dict], training_job_id: str):
+        for run in self.runs:
+            if run.training_job_id == training_job_id:
+                run._send_logs(logs)
+                return
+
+    def _signal_handler(self, _signum, _frame):
+        self._cancelled.set()
+        for run in self.runs:
+            run._clean()
+        sys.exit(1)
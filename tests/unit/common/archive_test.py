@@ -0,0 +1,201 @@
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from unittest import TestCase
+
+from mock import patch
+
+from abejacli.common import version_archive
+from abejacli.common.archive import (
+    ExcludeMatcher,
+    ParallelGzipWriter,
+    ParallelZipWriter,
+    SourceArchiveStream,
+    write_source_archive
+)
+
+
+class ExcludeMatcherTest(TestCase):
+
+    def test_match_wildcard_at_any_depth(self):
+        matcher = ExcludeMatcher(['*.pyc', '.git*'])
+        self.assertTrue(matcher.match('a/b/c.pyc'))
+        self.assertFalse(matcher.match('a/b/c.py'))
+        self.assertTrue(matcher.match('sub/.gitignore'))
+
+    def test_match_plain_name_at_root(self):
+        matcher = ExcludeMatcher(['.git', 'data', './models'])
+        self.assertTrue(matcher.match('.git', is_dir=True))
+        self.assertFalse(matcher.match('sub/.git', is_dir=True))
+        self.assertTrue(matcher.match('data', is_dir=True))
+        self.assertTrue(matcher.match('models', is_dir=True))
+        # nested directories of the same name are not excluded
+        self.assertFalse(matcher.match('src/data', is_dir=True))
+        self.assertFalse(matcher.match('src/models', is_dir=True))
+
+    def test_match_anchored(self):
+        matcher = ExcludeMatcher(['data/raw', '/model.h5', './logs'])
+        self.assertTrue(matcher.match('data/raw', is_dir=True))
+        self.assertFalse(matcher.match('sub/data/raw', is_dir=True))
+        self.assertTrue(matcher.match('model.h5'))
+        self.assertFalse(matcher.match('sub/model.h5'))
+        self.assertTrue(matcher.match('logs', is_dir=True))
+
+    def test_match_dir_only(self):
+        matcher = ExcludeMatcher(['build/'])
+        self.assertTrue(matcher.match('build', is_dir=True))
+        self.assertFalse(matcher.match('build', is_dir=False))
+
+    def test_match_double_star(self):
+        matcher = ExcludeMatcher(['**/cache', 'out/**'])
+        self.assertTrue(matcher.match('cache', is_dir=True))
+        self.assertTrue(matcher.match('a/b/cache', is_dir=True))
+        self.assertTrue(matcher.match('out/x/y.txt'))
+        self.assertFalse(matcher.match('out', is_dir=True))
+
+    def test_match_negation(self):
+        matcher = ExcludeMatcher(['*.csv', '!keep.csv'])
+        self.assertTrue(matcher.match('a.csv'))
+        self.assertFalse(matcher.match('keep.csv'))
+
+    def test_match_absolute_path(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            matcher = ExcludeMatcher([os.path.join(root_dir, 'data')], root_dir)
+            self.assertTrue(matcher.match('data', is_dir=True))
+            self.assertFalse(matcher.match('sub/data', is_dir=True))
+
+
+class ParallelGzipWriterTest(TestCase):
+
+    def test_write(self):
+        data = os.urandom(1000) * 100
+        out = io.BytesIO()
+        with ParallelGzipWriter(out, block_size=4096, max_workers=4) as gz:
+            for i in range(0, len(data), 1000):
+                gz.write(data[i:i + 1000])
+        self.assertEqual(data, gzip.decompress(out.getvalue()))
+
+    def test_write_empty(self):
+        out = io.BytesIO()
+        with ParallelGzipWriter(out):
+            pass
+        self.assertEqual(b'', gzip.decompress(out.getvalue()))
+
+
+class ParallelZipWriterTest(TestCase):
+
+    def _write_zip(self, files, **kwargs):
+        buf = io.BytesIO()
+        with tempfile.TemporaryDirectory() as root_dir:
+            with ParallelZipWriter(buf, block_size=1024, max_workers=4, **kwargs) as z:
+                for name, content in files.items():
+                    path = os.path.join(root_dir, name.replace('/', '_'))
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                    z.write(path, name)
+        return zipfile.ZipFile(io.BytesIO(buf.getvalue()))
+
+    def test_write(self):
+        files = {
+            'a.txt': b'abc' * 10000,
+            'sub/b.bin': os.urandom(5000),
+            'empty.txt': b'',
+            'model.npz': b'x' * 3000
+        }
+        z = self._write_zip(files)
+        self.assertIsNone(z.testzip())
+        for name, content in files.items():
+            self.assertEqual(z.read(name), content)
+        self.assertEqual(z.getinfo('a.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(z.getinfo('a.txt').compress_size, 1000)
+        self.assertEqual(z.getinfo('model.npz').compress_type, zipfile.ZIP_STORED)
+
+    def test_write_zip64(self):
+        files = {'{}.txt'.format(i): os.urandom(1000) for i in range(10)}
+        with patch.object(zipfile, 'ZIP64_LIMIT', 2000), patch.object(zipfile, 'ZIP_FILECOUNT_LIMIT', 5):
+            z = self._write_zip(files)
+        self.assertIsNone(z.testzip())
+        for name, content in files.items():
+            self.assertEqual(z.read(name), content)
+
+
+class SourceArchiveTest(TestCase):
+
+    def _make_tree(self, root_dir):
+        for path in ['train.py', 'lib/util.py', 'lib/util.pyc', '.git/HEAD', 'data/a.csv']:
+            path = os.path.join(root_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(path)
+
+    def test_write_source_archive(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            self._make_tree(root_dir)
+            out = io.BytesIO()
+            write_source_archive(out, ['.git', '*.pyc', 'data/'], root_dir)
+            out.seek(0)
+            with tarfile.open(fileobj=out, mode='r:gz') as tar:
+                names = tar.getnames()
+        self.assertEqual(['lib', 'lib/util.py', 'train.py'], names)
+
+    def test_write_source_archive_keeps_nested_directory_of_same_name(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            self._make_tree(root_dir)
+            os.makedirs(os.path.join(root_dir, 'lib', 'data'))
+            with open(os.path.join(root_dir, 'lib', 'data', 'b.csv'), 'w') as f:
+                f.write('b')
+            out = io.BytesIO()
+            write_source_archive(out, ['.git', 'data', './lib/util.pyc'], root_dir)
+            out.seek(0)
+            with tarfile.open(fileobj=out, mode='r:gz') as tar:
+                names = tar.getnames()
+        self.assertEqual(['lib', 'lib/data', 'lib/data/b.csv', 'lib/util.py', 'train.py'], names)
+
+    def test_version_archive(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as root_dir:
+            self._make_tree(root_dir)
+            try:
+                os.chdir(root_dir)
+                archive = version_archive('test', ['.git'])
+            finally:
+                os.chdir(cwd)
+            try:
+                with tarfile.open(archive.name, mode='r:gz') as tar:
+                    names = tar.getnames()
+            finally:
+                archive.close()
+                os.unlink(archive.name)
+        self.assertEqual(['data', 'data/a.csv', 'lib', 'lib/util.py', 'lib/util.pyc', 'train.py'], names)
+
+    def test_source_archive_stream(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            self._make_tree(root_dir)
+            archive = SourceArchiveStream(['.git'], root_dir)
+            content = b''.join(archive)
+            # each iteration produces the archive again to retry requests
+            self.assertEqual(content, b''.join(archive))
+
+        with tarfile.open(fileobj=io.BytesIO(content), mode='r:gz') as tar:
+            names = tar.getnames()
+        self.assertEqual(['data', 'data/a.csv', 'lib', 'lib/util.py', 'lib/util.pyc', 'train.py'], names)
+
+    def test_source_archive_stream_stop(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            self._make_tree(root_dir)
+            threads = threading.active_count()
+            chunks = iter(SourceArchiveStream(['.git'], root_dir))
+            next(chunks)
+            # the producer thread gives up when the iteration is closed
+            chunks.close()
+            self.assertEqual(threads, threading.active_count())
+
+    def test_source_archive_stream_error(self):
+        archive = SourceArchiveStream(['.git'], '/not/found')
+        with patch('abejacli.common.archive.write_source_archive', side_effect=FileNotFoundError):
+            with self.assertRaises(FileNotFoundError):
+                b''.join(archive)
@@ -0,0 +1,201 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import zipfile
+from unittest import TestCase
+
+import requests_mock
+from mock import patch
+
+from abejacli.common.download import (
+    ArchiveExtractor,
+    DownloadVerificationError,
+    FileDownloader,
+    UnsupportedArchiveError
+)
+
+DOWNLOAD_URL = 'https://example.com/file.tar.gz?signature=1'
+
+
+def _serve(content, etag=None, ranged=True, fail_ranges=(), content_md5=None):
+    """return a callback to serve the content with ranged requests"""
+    failures = set(fail_ranges)
+
+    def _callback(request, context):
+        if etag:
+            context.headers['ETag'] = '"{}"'.format(etag)
+        range_header = request.headers.get('Range')
+        if not ranged or not range_header:
+            context.status_code = 200
+            if content_md5:
+                context.headers['Content-MD5'] = content_md5
+            return content
+        start, end = (int(v) for v in range_header[len('bytes='):].split('-'))
+        if range_header in failures:
+            failures.remove(range_header)
+            context.status_code = 503
+            return b''
+        context.status_code = 206
+        context.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(content))
+        return content[start:end + 1]
+
+    return _callback
+
+
+@patch('retrying.time.sleep')
+class FileDownloaderTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'file.tar.gz')
+        self.content = os.urandom(1000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download_segments(self, mock_sleep):
+        md5 = hashlib.md5(self.content).hexdigest()
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, etag=md5, fail_ranges=['bytes=300-399']))
+            FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, max_workers=4, progress=False).download()
+
+            # probe + 10 segments + 1 retry
+            self.assertEqual(mock.call_count, 12)
+        self.assertEqual(self._read(), self.content)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+        self.assertFalse(os.path.exists(self.path + '.part.json'))
+
+    def test_resume(self, mock_sleep):
+        with open(self.path + '.part', 'wb') as f:
+            f.write(self.content[:500] + b'\0' * 500)
+        with open(self.path + '.part.json', 'w') as f:
+            json.dump({'size': 1000, 'etag': 'abc', 'segment_size': 100, 'completed': [0, 1, 2, 3, 4]}, f)
+
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, etag='abc'))
+            FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, progress=False).download()
+
+            ranges = sorted(r.headers['Range'] for r in mock.request_history[1:])
+            self.assertEqual(ranges[0], 'bytes=500-599')
+            self.assertEqual(len(ranges), 5)
+        self.assertEqual(self._read(), self.content)
+
+    def test_restart_if_remote_file_is_changed(self, mock_sleep):
+        with open(self.path + '.part', 'wb') as f:
+            f.write(b'\0' * 1000)
+        with open(self.path + '.part.json', 'w') as f:
+            json.dump({'size': 1000, 'etag': 'old', 'segment_size': 100, 'completed': [0, 1, 2, 3, 4]}, f)
+
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, etag='new'))
+            FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, progress=False).download()
+        self.assertEqual(self._read(), self.content)
+
+    def test_md5_mismatch(self, mock_sleep):
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content))
+            with self.assertRaises(DownloadVerificationError):
+                FileDownloader(DOWNLOAD_URL, self.path, expected_md5='0' * 32,
+                               segment_size=100, progress=False).download()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_content_md5_mismatch(self, mock_sleep):
+        content_md5 = base64.b64encode(hashlib.md5(b'other').digest()).decode()
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, ranged=False, content_md5=content_md5))
+            with self.assertRaises(DownloadVerificationError):
+                FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, progress=False).download()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_etag_is_not_verified(self, mock_sleep):
+        # ETag of an encrypted object looks like md5, but it is not md5 of the content
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, etag='0' * 32))
+            FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, progress=False).download()
+        self.assertEqual(self._read(), self.content)
+
+    def test_without_range_support(self, mock_sleep):
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=_serve(self.content, ranged=False))
+            FileDownloader(DOWNLOAD_URL, self.path, segment_size=100, progress=False).download()
+
+            self.assertEqual(mock.call_count, 2)
+        self.assertEqual(self._read(), self.content)
+
+    def test_renew_expired_url(self, mock_sleep):
+        new_url = 'https://example.com/file.tar.gz?signature=2'
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, status_code=403)
+            mock.get(new_url, content=_serve(self.content))
+            FileDownloader(DOWNLOAD_URL, self.path, url_provider=lambda: new_url,
+                           segment_size=100, progress=False).download()
+        self.assertEqual(self._read(), self.content)
+
+
+def _tar_archive(files, mode='w:gz'):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+@patch('retrying.time.sleep')
+class ArchiveExtractorTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dest_dir = os.path.join(self.tmpdir.name, 'dest')
+        self.files = {'model.h5': os.urandom(3000), 'sub/config.json': b'{}'}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _extract(self, content):
+        with requests_mock.Mocker() as mock:
+            mock.get(DOWNLOAD_URL, content=content)
+            return ArchiveExtractor(DOWNLOAD_URL, self.dest_dir, progress=False).extract()
+
+    def _assert_extracted(self):
+        for name, content in self.files.items():
+            with open(os.path.join(self.dest_dir, name), 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_extract_tgz(self, mock_sleep):
+        self._extract(_tar_archive(self.files))
+        self._assert_extracted()
+        # the archive is not saved
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['dest'])
+
+    def test_extract_tar(self, mock_sleep):
+        self._extract(_tar_archive(self.files, mode='w'))
+        self._assert_extracted()
+
+    def test_extract_zip(self, mock_sleep):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as z:
+            for name, content in self.files.items():
+                z.writestr(name, content)
+        self._extract(buf.getvalue())
+        self._assert_extracted()
+
+    def test_unsupported(self, mock_sleep):
+        with self.assertRaises(UnsupportedArchiveError):
+            self._extract(gzip.compress(b'not a tar file' * 100))
+
+    def test_reject_outside_path(self, mock_sleep):
+        with self.assertRaises(tarfile.TarError):
+            self._extract(_tar_archive({'../evil.txt': b'evil'}))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'evil.txt')))
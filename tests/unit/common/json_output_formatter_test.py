@@ -0,0 +1,62 @@
+import json
+
+import click
+from mock import patch
+
+from abejacli.common import OUTPUT_FORMAT_KEY, json_output_formatter
+
+PARSED_JSON = {
+    'items': [
+        {'name': 'xxx', 'count': 1},
+        {'name': 'yyy', 'count': 2, 'tags': ['a']}
+    ],
+    'total_count': 2
+}
+
+
+def test_json_output_formatter_non_tty():
+    with patch('sys.stdout.isatty', return_value=False):
+        actual = json_output_formatter(PARSED_JSON)
+    assert '\x1b' not in actual
+    assert json.loads(actual) == PARSED_JSON
+
+
+def test_json_output_formatter_tty():
+    with patch('sys.stdout.isatty', return_value=True):
+        actual = json_output_formatter(PARSED_JSON)
+    assert '\x1b' in actual
+
+
+def test_json_output_formatter_tty_large_output():
+    with patch('sys.stdout.isatty', return_value=True), \
+            patch('abejacli.common.JSON_HIGHLIGHT_MAX_SIZE', 10):
+        actual = json_output_formatter(PARSED_JSON)
+    assert '\x1b' not in actual
+    assert json.loads(actual) == PARSED_JSON
+
+
+def test_json_output_formatter_compact():
+    # selected by the global `--output` option of the current command
+    with click.Context(click.Command('main'), obj={OUTPUT_FORMAT_KEY: 'compact'}):
+        actual = json_output_formatter(PARSED_JSON)
+    assert '\n' not in actual
+    assert json.loads(actual) == PARSED_JSON
+
+
+def test_json_output_formatter_jsonl():
+    actual = json_output_formatter(PARSED_JSON['items'], 'jsonl')
+    assert [json.loads(line) for line in actual.splitlines()] == PARSED_JSON['items']
+
+
+def test_json_output_formatter_table():
+    actual = json_output_formatter(PARSED_JSON['items'], 'table')
+    assert actual.splitlines() == [
+        'NAME  COUNT  TAGS',
+        'xxx   1',
+        'yyy   2      ["a"]',
+    ]
+
+
+def test_json_output_formatter_json():
+    actual = json_output_formatter(PARSED_JSON, 'json')
+    assert actual == json.dumps(PARSED_JSON, sort_keys=True, ensure_ascii=False, indent=4)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from abejacli.common.snapshot import (
+    FileHashCache,
+    SourceSnapshot,
+    file_digest,
+    file_digests,
+    tree_digest
+)
+from abejacli.model import md5file
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root_dir = os.path.join(self.tmp_dir.name, 'src')
+        for path in ['train.py', 'lib/util.py', '.git/HEAD']:
+            self._write(path, path)
+        self.cache_path = os.path.join(self.tmp_dir.name, 'cache', 'file_hashes.json')
+        self.index_path = os.path.join(self.tmp_dir.name, 'cache', 'source_snapshots.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, path, content):
+        path = os.path.join(self.root_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_tree_digest(self):
+        digest = tree_digest(self.root_dir, ['.git'])
+        self.assertEqual(digest, tree_digest(self.root_dir, ['.git']))
+
+        # excluded files do not affect the digest
+        self._write('.git/HEAD', 'changed')
+        self.assertEqual(digest, tree_digest(self.root_dir, ['.git']))
+
+        self._write('lib/util.py', 'changed')
+        self.assertNotEqual(digest, tree_digest(self.root_dir, ['.git']))
+
+    def test_tree_digest_renamed(self):
+        digest = tree_digest(self.root_dir, ['.git'])
+        os.rename(os.path.join(self.root_dir, 'lib'), os.path.join(self.root_dir, 'lib2'))
+        self.assertNotEqual(digest, tree_digest(self.root_dir, ['.git']))
+
+    def test_file_hash_cache(self):
+        path = os.path.join(self.root_dir, 'train.py')
+        cache = FileHashCache(self.cache_path)
+        digest = file_digest(path, cache)
+        cache.save()
+
+        cache = FileHashCache(self.cache_path)
+        with patch('abejacli.common.snapshot.open', side_effect=AssertionError('must not be read')):
+            self.assertEqual(digest, file_digest(path, cache))
+
+    def test_file_digest(self):
+        path = os.path.join(self.root_dir, 'large.bin')
+        content = os.urandom(64 * 1024)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        self.assertEqual(file_digest(path), hashlib.sha256(content).hexdigest())
+        self.assertEqual(file_digest(path, algorithm='md5'), hashlib.md5(content).hexdigest())
+        # large files are hashed through mmap
+        with patch('abejacli.common.snapshot.FILE_HASH_MMAP_THRESHOLD', 1024):
+            self.assertEqual(file_digest(path, algorithm='blake2b'), hashlib.blake2b(content).hexdigest())
+
+    def test_file_hash_cache_per_algorithm(self):
+        path = os.path.join(self.root_dir, 'train.py')
+        cache = FileHashCache(self.cache_path)
+        file_digest(path, cache)
+        self.assertEqual(file_digest(path, cache, 'md5'), hashlib.md5(b'train.py').hexdigest())
+
+    def test_md5file_uses_file_hash_cache(self):
+        path = os.path.join(self.root_dir, 'train.py')
+        with patch('abejacli.common.snapshot.FILE_HASH_CACHE_PATH', self.cache_path):
+            self.assertEqual(md5file(path), hashlib.md5(b'train.py').hexdigest())
+            with patch('abejacli.common.snapshot._hash_file', side_effect=AssertionError('must not be read')):
+                self.assertEqual(md5file(path), hashlib.md5(b'train.py').hexdigest())
+
+    def test_file_digests(self):
+        paths = [os.path.join(self.root_dir, path) for path in ['train.py', 'lib/util.py', '.git/HEAD']]
+        self.assertEqual(file_digests(paths, max_workers=2), {path: file_digest(path) for path in paths})
+        self.assertEqual(file_digests([]), {})
+
+    def test_source_snapshot(self):
+        with patch('abejacli.common.snapshot.FILE_HASH_CACHE_PATH', self.cache_path):
+            snapshot = SourceSnapshot('key', {'handler': 'train:handler'}, ['.git'],
+                                      self.root_dir, self.index_path)
+            self.assertIsNone(snapshot.find())
+            snapshot.record({'job_definition_version': 1})
+
+            snapshot = SourceSnapshot('key', {'handler': 'train:handler'}, ['.git'],
+                                      self.root_dir, self.index_path)
+            self.assertEqual({'job_definition_version': 1}, snapshot.find())
+
+            # parameters are changed
+            snapshot = SourceSnapshot('key', {'handler': 'train:main'}, ['.git'],
+                                      self.root_dir, self.index_path)
+            self.assertIsNone(snapshot.find())
+
+            # source code is changed
+            self._write('train.py', 'changed')
+            snapshot = SourceSnapshot('key', {'handler': 'train:handler'}, ['.git'],
+                                      self.root_dir, self.index_path)
+            self.assertIsNone(snapshot.find())
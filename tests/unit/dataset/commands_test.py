@@ -4,10 +4,14 @@ import tempfile
 import pytest
 import requests_mock
 from click.testing import CliRunner
+from mock import MagicMock, patch
 from ruamel.yaml import YAML
 
 from abejacli.config import ABEJA_API_URL, ORGANIZATION_ENDPOINT
 from abejacli.dataset.commands import (
+    bulk_create_dataset_items,
+    bulk_delete_dataset_items,
+    bulk_update_dataset_items,
     create_dataset,
     create_dataset_item,
     dataset_import_from_datalake,
@@ -273,6 +277,43 @@ def test_descripe_dataset_items(req_mock, runner, cmd, additional_config, expect
     assert not r.exception
 
 
+def test_descripe_dataset_items_jsonl(req_mock, runner):
+    testing_dataset_id = '123456789'
+    url = "{}/datasets/{}/items".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+    token_url = "{}/datasets/{}/items?next_page_token=nnnn".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+
+    first_response = {
+        "items": [{"name": "xxx"}, {"name": "yyy"}],
+        "next_page_token": "nnnn",
+        "total_count": 3
+    }
+
+    second_response = {
+        "items": [{"name": "zzz"}],
+        "next_page_token": None,
+        "total_count": 3
+    }
+
+    req_mock.register_uri(
+        'GET', url,
+        json=first_response,
+        additional_matcher=lambda request: request.url == url)
+
+    req_mock.register_uri(
+        'GET', token_url,
+        json=second_response,
+        additional_matcher=lambda request: request.url == token_url)
+
+    cmd = ['--dataset_id', testing_dataset_id, '--format', 'jsonl']
+    r = runner.invoke(describe_dataset_items, cmd)
+    assert r.exit_code == 0
+    assert not r.exception
+    lines = r.output.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"name": "xxx"}, {"name": "yyy"}, {"name": "zzz"}
+    ]
+
+
 @pytest.mark.parametrize(
     'cmd,additional_config,expected_payload',
     [
@@ -516,3 +557,122 @@ def test_update_dataset_item(req_mock, runner, cmd, additional_config, expected_
     assert req_mock.called
     assert r.exit_code == 0
     assert not r.exception
+
+
+def test_bulk_create_dataset_items(req_mock, runner):
+    testing_dataset_id = '123456789'
+    url = "{}/datasets/{}/items".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+    payloads = [
+        {"attributes": {"classification": [{"category_id": 1, "label_id": i}]}}
+        for i in range(5)
+    ]
+
+    req_mock.register_uri('POST', url, json={'dataset_item_id': 1})
+
+    with tempfile.NamedTemporaryFile('w', suffix=".jsonl") as fp, \
+            tempfile.NamedTemporaryFile('r', suffix=".jsonl") as manifest:
+        fp.write('\n'.join(json.dumps(p) for p in payloads))
+        fp.flush()
+        cmd = ['--dataset_id', testing_dataset_id, '--payload', fp.name, '--manifest', manifest.name]
+        r = runner.invoke(bulk_create_dataset_items, cmd)
+        results = [json.loads(line) for line in manifest]
+
+    assert r.exit_code == 0
+    assert not r.exception
+    assert req_mock.call_count == len(payloads)
+    assert sorted(json.loads(req.text)['attributes']['classification'][0]['label_id']
+                  for req in req_mock.request_history) == list(range(5))
+    assert sorted(result['index'] for result in results) == list(range(5))
+    assert all(result['status'] == 'success' for result in results)
+
+
+def test_bulk_update_dataset_items(req_mock, runner):
+    testing_dataset_id = '123456789'
+    payloads = [
+        {"dataset_item_id": i, "attributes": {"classification": [{"category_id": 1, "label_id": 2}]}}
+        for i in range(3)
+    ]
+    for i in range(3):
+        url = "{}/datasets/{}/items/{}".format(ORGANIZATION_ENDPOINT, testing_dataset_id, i)
+        req_mock.register_uri('PUT', url, json={})
+
+    with tempfile.NamedTemporaryFile('w', suffix=".yaml") as fp:
+        yaml.dump(payloads, stream=fp)
+        fp.flush()
+        cmd = ['--dataset_id', testing_dataset_id, '--payload', fp.name]
+        r = runner.invoke(bulk_update_dataset_items, cmd)
+
+    assert r.exit_code == 0
+    assert not r.exception
+    assert req_mock.call_count == len(payloads)
+    for req in req_mock.request_history:
+        assert json.loads(req.text) == {"attributes": payloads[0]['attributes']}
+
+
+def test_bulk_delete_dataset_items_with_error(req_mock, runner):
+    testing_dataset_id = '123456789'
+    url = "{}/datasets/{}/items/1".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+    req_mock.register_uri('DELETE', url, json={})
+
+    with tempfile.NamedTemporaryFile('w', suffix=".jsonl") as fp, \
+            tempfile.NamedTemporaryFile('r', suffix=".jsonl") as manifest:
+        # the second payload has no dataset_item_id
+        fp.write('{"dataset_item_id": "1"}\n{}\n')
+        fp.flush()
+        cmd = ['--dataset_id', testing_dataset_id, '--payload', fp.name, '--manifest', manifest.name]
+        r = runner.invoke(bulk_delete_dataset_items, cmd)
+        results = sorted((json.loads(line) for line in manifest), key=lambda x: x['index'])
+
+    assert r.exit_code == 1
+    assert req_mock.call_count == 1
+    assert results[0]['status'] == 'success'
+    assert results[0]['dataset_item_id'] == '1'
+    assert results[1]['status'] == 'error'
+
+
+@patch('retrying.time.sleep', MagicMock())
+@patch('abejacli.dataset.bulk.RateLimiter')
+def test_bulk_create_dataset_items_rate_limits_retries(mock_limiter_class, req_mock, runner):
+    testing_dataset_id = '123456789'
+    url = "{}/datasets/{}/items".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+    req_mock.register_uri('POST', url, [{'status_code': 503}, {'json': {'dataset_item_id': 1}}])
+
+    with tempfile.NamedTemporaryFile('w', suffix=".jsonl") as fp:
+        fp.write('{"attributes": {}}\n')
+        fp.flush()
+        cmd = ['--dataset_id', testing_dataset_id, '--payload', fp.name, '--rate-limit', '10']
+        r = runner.invoke(bulk_create_dataset_items, cmd)
+
+    assert r.exit_code == 0
+    assert req_mock.call_count == 2
+    mock_limiter_class.assert_called_once_with(10.0)
+    assert mock_limiter_class.return_value.acquire.call_count == 2
+
+
+def test_bulk_create_dataset_items_invalid_rate_limit(runner):
+    with tempfile.NamedTemporaryFile('w', suffix=".jsonl") as fp:
+        cmd = ['--dataset_id', '123456789', '--payload', fp.name, '--rate-limit', '-1']
+        r = runner.invoke(bulk_create_dataset_items, cmd)
+
+    assert r.exit_code == 2
+
+
+def test_bulk_create_dataset_items_malformed_payload(req_mock, runner):
+    testing_dataset_id = '123456789'
+    url = "{}/datasets/{}/items".format(ORGANIZATION_ENDPOINT, testing_dataset_id)
+    req_mock.register_uri('POST', url, json={'dataset_item_id': 1})
+
+    with tempfile.NamedTemporaryFile('w', suffix=".jsonl") as fp, \
+            tempfile.NamedTemporaryFile('r', suffix=".jsonl") as manifest:
+        # the third line is broken
+        fp.write('{"attributes": {}}\n{"attributes": {}}\n{"attributes":\n{"attributes": {}}\n')
+        fp.flush()
+        cmd = ['--dataset_id', testing_dataset_id, '--payload', fp.name, '--manifest', manifest.name]
+        r = runner.invoke(bulk_create_dataset_items, cmd)
+        results = sorted((json.loads(line) for line in manifest), key=lambda x: x['index'])
+
+    assert r.exit_code == 1
+    # the payloads sent before the broken line are recorded
+    assert req_mock.call_count == 2
+    assert [(result['index'], result['status']) for result in results] == [
+        (0, 'success'), (1, 'success'), (2, 'error')]
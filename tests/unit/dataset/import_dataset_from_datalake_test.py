@@ -1,10 +1,14 @@
 """Tests related to ``model`` and ``deployment``"""
+import json
 import math
+import os
 import random
+import tempfile
 from unittest import TestCase
 
 import requests_mock
 from click.testing import CliRunner
+from mock import patch
 
 from abejacli.config import (
     ABEJA_API_URL,
@@ -15,8 +19,10 @@ from abejacli.dataset import (
     create_request_element,
     filter_items_by_max_size,
     import_dataset_from_datalake,
+    iter_items_by_max_size,
     register_dataset_items
 )
+from abejacli.dataset.checkpoint import RegisterCheckpoint, chunk_digest
 
 DATASET_ID = 1
 CHANNEL_ID = '1111111111111'
@@ -101,6 +107,132 @@ class DatasetImportFromDatalakeTest(TestCase):
         expected_request_count = math.ceil(item_count / DATASET_CHUNK_SIZE)
         self.assertEqual(expected_request_count, len(mock.request_history))
 
+    @requests_mock.Mocker()
+    def test_register_dataset_items_resume_from_checkpoint(self, mock):
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, json=DATASET_ITEM_RESPONSE)
+
+        item_count = 1501
+        dataset_items = [DATASET_ITEM_RESPONSE for _ in range(item_count)]
+        digest = chunk_digest(dataset_items[:DATASET_CHUNK_SIZE])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+            with open(checkpoint_path, 'w') as f:
+                json.dump({
+                    'dataset_id': str(DATASET_ID),
+                    'chunk_size': DATASET_CHUNK_SIZE,
+                    'source': {'channel_id': CHANNEL_ID}
+                }, f)
+                # the last line was broken by an interruption
+                f.write('\n0 {}\n2 {}\n3 {}'.format(digest, digest, digest[:10]))
+            actual = register_dataset_items(
+                DATASET_ID, dataset_items, checkpoint_path, source={'channel_id': CHANNEL_ID})
+
+            self.assertEqual(item_count, actual)
+            # chunk 1 and 3 are remaining
+            self.assertEqual(2, len(mock.request_history))
+            # checkpoint is removed after all chunks are registered
+            self.assertFalse(os.path.exists(checkpoint_path))
+
+    @requests_mock.Mocker()
+    def test_register_dataset_items_ignore_checkpoint_of_other_source(self, mock):
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, json=DATASET_ITEM_RESPONSE)
+
+        dataset_items = [DATASET_ITEM_RESPONSE for _ in range(DATASET_CHUNK_SIZE * 2)]
+        digest = chunk_digest(dataset_items[:DATASET_CHUNK_SIZE])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+            with open(checkpoint_path, 'w') as f:
+                json.dump({
+                    'dataset_id': str(DATASET_ID),
+                    'chunk_size': DATASET_CHUNK_SIZE,
+                    'source': {'channel_id': '2222222222222'}
+                }, f)
+                f.write('\n0 {}\n1 {}\n'.format(digest, digest))
+            register_dataset_items(
+                DATASET_ID, dataset_items, checkpoint_path, source={'channel_id': CHANNEL_ID})
+
+        self.assertEqual(2, len(mock.request_history))
+
+    @requests_mock.Mocker()
+    def test_register_dataset_items_register_changed_chunk_again(self, mock):
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, json=DATASET_ITEM_RESPONSE)
+
+        dataset_items = [DATASET_ITEM_RESPONSE for _ in range(DATASET_CHUNK_SIZE * 2)]
+        changed_item = dict(DATASET_ITEM_RESPONSE, source_data=[{'data_uri': 'datalake://1/2'}])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+            with open(checkpoint_path, 'w') as f:
+                json.dump({
+                    'dataset_id': str(DATASET_ID),
+                    'chunk_size': DATASET_CHUNK_SIZE,
+                    'source': {}
+                }, f)
+                f.write('\n0 {}\n1 {}\n'.format(
+                    chunk_digest(dataset_items[:DATASET_CHUNK_SIZE]),
+                    chunk_digest([changed_item] * DATASET_CHUNK_SIZE)))
+            register_dataset_items(DATASET_ID, dataset_items, checkpoint_path)
+
+        # only chunk 1, whose items differ from the checkpoint, is registered
+        self.assertEqual(1, len(mock.request_history))
+
+    @requests_mock.Mocker()
+    @patch('retrying.time.sleep')
+    def test_register_dataset_items_retry(self, mock, m_sleep):
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, [
+            {'status_code': 503},
+            {'json': DATASET_ITEM_RESPONSE}
+        ])
+
+        dataset_items = [DATASET_ITEM_RESPONSE for _ in range(10)]
+        register_dataset_items(DATASET_ID, dataset_items)
+
+        self.assertEqual(2, len(mock.request_history))
+
+    @requests_mock.Mocker()
+    def test_register_dataset_items_failure_keeps_checkpoint(self, mock):
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, [
+            {'json': DATASET_ITEM_RESPONSE},
+            {'status_code': 400}
+        ])
+
+        dataset_items = [DATASET_ITEM_RESPONSE for _ in range(DATASET_CHUNK_SIZE + 1)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+            with self.assertRaises(Exception):
+                register_dataset_items(
+                    DATASET_ID, dataset_items, checkpoint_path, max_workers=1)
+            with open(checkpoint_path) as f:
+                header = json.loads(f.readline())
+                lines = f.readlines()
+            self.assertEqual(str(DATASET_ID), header['dataset_id'])
+            self.assertEqual(
+                ['0 {}\n'.format(chunk_digest(dataset_items[:DATASET_CHUNK_SIZE]))], lines)
+
+    def test_checkpoint_append_after_broken_line(self):
+        chunk = [DATASET_ITEM_RESPONSE]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+            checkpoint = RegisterCheckpoint(checkpoint_path, DATASET_ID, DATASET_CHUNK_SIZE)
+            checkpoint.complete(0, chunk)
+            checkpoint.close()
+            with open(checkpoint_path, 'a') as f:
+                f.write('1 abc')
+
+            checkpoint = RegisterCheckpoint(checkpoint_path, DATASET_ID, DATASET_CHUNK_SIZE)
+            self.assertTrue(checkpoint.is_completed(0, chunk))
+            self.assertFalse(checkpoint.is_completed(1, chunk))
+            checkpoint.complete(1, chunk)
+            checkpoint.close()
+
+            checkpoint = RegisterCheckpoint(checkpoint_path, DATASET_ID, DATASET_CHUNK_SIZE)
+            self.assertTrue(checkpoint.is_completed(0, chunk))
+            self.assertTrue(checkpoint.is_completed(1, chunk))
+
     def test_filter_items_by_max_size(self):
 
         def generate_labeled_dataset_item(label):
@@ -144,6 +276,50 @@ class DatasetImportFromDatalakeTest(TestCase):
         self.assertEqual(9, sum(label3 == i['attributes']['classification'][0]['label']
                                 for i in filtered_dataset_items))
 
+    def test_iter_items_by_max_size(self):
+
+        def generate_labeled_dataset_items():
+            for i in range(100):
+                yield {
+                    'attributes': {
+                        'classification': [
+                            {
+                                'label': str(i % 3),
+                            }
+                        ]
+                    }
+                }
+
+        filtered_items = iter_items_by_max_size(
+            generate_labeled_dataset_items(), 5)
+        labels = [i['attributes']['classification'][0]['label']
+                  for i in filtered_items]
+        self.assertEqual(['0', '1', '2'] * 5, labels)
+
+    @requests_mock.Mocker()
+    def test_register_dataset_items_from_datalake_paginated(self, mock):
+        url = '{}/channels/{}'.format(ABEJA_API_URL, CHANNEL_ID)
+        mock.register_uri('GET', url, [
+            {'json': {
+                'files': [DATALAKE_FILE_RESPONSE for _ in range(DATASET_CHUNK_SIZE)],
+                'next_page_token': 'nnnn'
+            }},
+            {'json': {
+                'files': [DATALAKE_FILE_RESPONSE for _ in range(10)]
+            }}
+        ])
+        url = '{}/datasets/{}/items'.format(ORGANIZATION_ENDPOINT, DATASET_ID)
+        mock.register_uri('POST', url, json=DATASET_ITEM_RESPONSE)
+
+        result = import_dataset_from_datalake(
+            CHANNEL_ID, DATASET_ID,
+            [METADATA_LABEL_KEY, METADATA_LABEL_ID_KEY], CATEGORY_ID,
+            'classification', None
+        )
+        self.assertEqual(DATASET_CHUNK_SIZE + 10, result['dataset_items'])
+        post_requests = [r for r in mock.request_history if r.method == 'POST']
+        self.assertEqual(2, len(post_requests))
+
     @requests_mock.Mocker()
     def test_register_dataset_items_from_datalake(self, mock):
         url = '{}/channels/{}'.format(ABEJA_API_URL, CHANNEL_ID)
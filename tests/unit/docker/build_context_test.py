@@ -0,0 +1,72 @@
+import os
+import tarfile
+import tempfile
+from unittest import TestCase
+
+from abejacli.docker.build_context import (
+    BUILD_DOCKERFILE_NAME,
+    build_context,
+    build_context_exclude_patterns,
+    read_dockerignore
+)
+
+DOCKERFILE = 'FROM abeja/all-cpu:19.10\n'
+
+
+class BuildContextTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root_dir = self.tmpdir.name
+        for path in ('main.py', 'requirements.txt', 'data/train.csv', 'logs/run.log',
+                     '.git/HEAD', 'src/model.py', 'src/__pycache__/model.pyc'):
+            self._write(path, 'content')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, path, content):
+        path = os.path.join(self.root_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _members(self, patterns):
+        exclude_patterns = build_context_exclude_patterns(patterns, root_dir=self.root_dir)
+        with build_context(DOCKERFILE, exclude_patterns, root_dir=self.root_dir) as context:
+            with tarfile.open(fileobj=context, mode='r') as tar:
+                members = {m.name: m for m in tar.getmembers()}
+                dockerfile = tar.extractfile(members[BUILD_DOCKERFILE_NAME]).read().decode('utf-8')
+        self.assertEqual(dockerfile, DOCKERFILE)
+        return {name for name, m in members.items() if m.isfile()}
+
+    def test_exclude_ignores(self):
+        members = self._members(['data/', '**/__pycache__'])
+        self.assertEqual(members, {
+            BUILD_DOCKERFILE_NAME, 'main.py', 'requirements.txt', 'logs/run.log', 'src/model.py'})
+
+    def test_exclude_dockerignore(self):
+        self._write('.dockerignore', '# comment\nlogs\n*.csv\n')
+        self._write('test.csv', 'content')
+        members = self._members([])
+        self.assertNotIn('logs/run.log', members)
+        self.assertNotIn('test.csv', members)
+        # patterns are relative to the root directory as docker does
+        self.assertIn('data/train.csv', members)
+        self.assertIn('.dockerignore', members)
+        self.assertIn('src/model.py', members)
+
+    def test_read_dockerignore(self):
+        self._write('.dockerignore', '# comment\n\n  logs  \n*.csv\n./data/\n/src/**/*.pyc\n! keep.csv\n')
+        self.assertEqual(read_dockerignore(self.root_dir), [
+            '/logs', '/*.csv', '/data/', '/src/**/*.pyc', '!/keep.csv'])
+        self.assertEqual(read_dockerignore(os.path.join(self.root_dir, 'src')), [])
+
+    def test_always_include_dependency_manifests(self):
+        members = self._members(['*.txt'])
+        self.assertIn('requirements.txt', members)
+
+    def test_replace_dockerfile_of_same_name(self):
+        self._write(BUILD_DOCKERFILE_NAME, 'FROM ubuntu\n')
+        # the generated Dockerfile is checked in _members
+        self.assertIn(BUILD_DOCKERFILE_NAME, self._members([]))
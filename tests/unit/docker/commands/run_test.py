@@ -105,6 +105,17 @@ class CommandTest(TestCase):
             'bind': '/data',
             'mode': 'rw'
         })
+        self.assertNotIn('nano_cpus', params)
+        self.assertNotIn('mem_limit', params)
+
+    def test_train_run_command_create_with_limits(self):
+        train_run_command = TrainRunCommand.create(
+            image='abeja/all-cpu:18.10', handler='train:handler', cpus=1.5, memory='4g')
+
+        params = train_run_command.to_dict()
+
+        self.assertEqual(params['nano_cpus'], 1500000000)
+        self.assertEqual(params['mem_limit'], '4g')
 
     def test_build_volumes(self):
         volume_params = (
@@ -1,10 +1,19 @@
 import json
 import os
 
+import docker
 import pytest
 from mock import MagicMock, patch
 
-from abejacli.docker.container_run import ContainerBuildAndRun
+from abejacli.docker.container_run import (
+    PULL_POLICY_ALWAYS,
+    PULL_POLICY_IF_NOT_PRESENT,
+    PULL_POLICY_NEVER,
+    ContainerBuildAndRun,
+    ContainerRun,
+    _pull_progress
+)
+from abejacli.docker.image_cache import ImageCache
 
 
 @pytest.fixture
@@ -19,27 +28,123 @@ def container_build_and_run():
             volume={}, no_cache=False)
 
 
+def generate_container_run(pull_policy, local_image=None, pulled_image=None):
+    with patch.object(ContainerRun, '_setup_docker'):
+        container_run = ContainerRun(
+            handler='train:handler', image='abeja/all-cpu:18.10',
+            organization_id='1234567890123', datasets={}, environment={},
+            volume={}, no_cache=False, quiet=True, pull_policy=pull_policy)
+    container_run._client = MagicMock()
+    container_run._client.images.get.side_effect = [
+        local_image or docker.errors.ImageNotFound('not found'), pulled_image]
+    container_run._docker_cli = MagicMock()
+    container_run._docker_cli.pull.return_value = iter([])
+    return container_run
+
+
+class TestContainerRun:
+
+    def test_prepare_image_always(self):
+        local_image, pulled_image = MagicMock(id='sha256:old'), MagicMock(id='sha256:new')
+        container_run = generate_container_run(PULL_POLICY_ALWAYS, local_image, pulled_image)
+
+        container_run._prepare_image()
+
+        assert container_run.image == pulled_image
+        # pulled only once
+        container_run._docker_cli.pull.assert_called_once_with('abeja/all-cpu:18.10', stream=True, decode=True)
+        container_run._client.images.pull.assert_not_called()
+
+    @pytest.mark.parametrize('pull_policy', [PULL_POLICY_IF_NOT_PRESENT, PULL_POLICY_NEVER])
+    def test_prepare_image_present(self, pull_policy):
+        local_image = MagicMock()
+        container_run = generate_container_run(pull_policy, local_image)
+
+        container_run._prepare_image()
+
+        assert container_run.image == local_image
+        container_run._docker_cli.pull.assert_not_called()
+
+    def test_prepare_image_if_not_present(self):
+        pulled_image = MagicMock()
+        container_run = generate_container_run(PULL_POLICY_IF_NOT_PRESENT, pulled_image=pulled_image)
+
+        container_run._prepare_image()
+
+        assert container_run.image == pulled_image
+        container_run._docker_cli.pull.assert_called_once()
+
+    def test_prepare_image_never_not_present(self):
+        container_run = generate_container_run(PULL_POLICY_NEVER)
+
+        with pytest.raises(RuntimeError):
+            container_run._prepare_image()
+        container_run._docker_cli.pull.assert_not_called()
+
+    def test_pull_progress(self):
+        lines = [
+            {'status': 'Pulling from abeja/all-cpu', 'id': '18.10'},
+            {'status': 'Already exists', 'progressDetail': {}, 'id': 'a'},
+            {'status': 'Pulling fs layer', 'progressDetail': {}, 'id': 'b'},
+            {'status': 'Downloading', 'progressDetail': {'current': 1, 'total': 2}, 'progress': '[=>]', 'id': 'b'},
+            {'status': 'Pull complete', 'progressDetail': {}, 'id': 'b'},
+            {'status': 'Digest: sha256:abc'},
+            {'status': 'Status: Downloaded newer image for abeja/all-cpu:18.10'}
+        ]
+        assert list(_pull_progress(lines)) == [
+            'Pulling from abeja/all-cpu',
+            '1/1 layers ready',
+            '2/2 layers ready',
+            'Digest: sha256:abc',
+            'Status: Downloaded newer image for abeja/all-cpu:18.10'
+        ]
+
+    def test_pull_progress_error(self):
+        with pytest.raises(RuntimeError):
+            list(_pull_progress([{'error': 'manifest unknown'}]))
+
+
 class TestContainerBuildAndRun:
 
-    def test_find_or_build_image(self, container_build_and_run):
-        container_build_and_run._find_built_image = MagicMock(
-            return_value=None)
+    @patch('abejacli.docker.container_run.ImageCache')
+    def test_find_or_build_image(self, mock_image_cache, container_build_and_run):
+        container_build_and_run._client = MagicMock()
+        mock_image_cache.return_value.find.return_value = None
         container_build_and_run._build_image = MagicMock()
 
         with pytest.raises(RuntimeError):
             container_build_and_run._find_or_build_image()
+        container_build_and_run._build_image.assert_called_once_with(
+            mock_image_cache.return_value.key.return_value)
+
+    @patch('abejacli.docker.container_run.ImageCache')
+    def test_find_built_image(self, mock_image_cache, container_build_and_run):
+        container_build_and_run._client = MagicMock()
+        built_image = MagicMock()
+        mock_image_cache.return_value.find.return_value = built_image
+        container_build_and_run._build_image = MagicMock()
+
+        assert container_build_and_run._find_or_build_image() == built_image
+        container_build_and_run._build_image.assert_not_called()
 
-    @pytest.mark.parametrize("test_dir, expected", [
-        ('tests/unit/resources/container_run_test/exist_pipfile', 'a7251a3b0a5586a6301d450b9bab8501'),
-        ('tests/unit/resources/container_run_test/exist_requirements', 'abdc069736ab4b295de3d8581dc050bd'),
-        ('tests/unit/resources/container_run_test/no_requirements', 'a83daf73508de5f3294cd744dc2b06f1'),
-    ])
-    def test_calc_md5(self, test_dir, expected, container_build_and_run):
+    def test_image_key(self, container_build_and_run, tmp_path):
+        client = MagicMock()
+        client.images.get.return_value.id = 'sha256:base'
+        image_cache = ImageCache(client, index_path=str(tmp_path / 'index.json'))
         base_dir = os.getcwd()
-        os.chdir(os.path.join(base_dir, test_dir))
-        actual = container_build_and_run._calc_md5()
-        os.chdir(base_dir)
-        assert expected == actual
+        keys = []
+        try:
+            with patch('abejacli.common.snapshot.FILE_HASH_CACHE_PATH', str(tmp_path / 'hashes.json')):
+                for test_dir in ('exist_pipfile', 'exist_requirements', 'no_requirements', 'exist_pipfile'):
+                    os.chdir(os.path.join(base_dir, 'tests/unit/resources/container_run_test', test_dir))
+                    keys.append(container_build_and_run._image_key(image_cache))
+        finally:
+            os.chdir(base_dir)
+
+        # the key depends on the dependency files, and it is stable
+        assert len(set(keys[:3])) == 3
+        assert keys[0] == keys[3]
+        client.images.get.assert_called_with('abeja/all-cpu:18.10')
 
     def test_stdout_build_output(self, container_build_and_run):
         output_1 = "Step 1/6 : FROM abeja-inc/all-cpu:18.10"
@@ -0,0 +1,82 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import docker
+from mock import MagicMock, patch
+
+from abejacli.docker.image_cache import LOCAL_IMAGE_KEY, ImageCache
+
+BASE_IMAGE = 'abeja/all-cpu:19.10'
+DOCKERFILE = 'FROM abeja/all-cpu:19.10'
+
+
+class ImageCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client = MagicMock()
+        self.client.images.get.return_value.id = 'sha256:base'
+        self.image_cache = ImageCache(self.client, index_path=os.path.join(self.tmpdir.name, 'index.json'))
+        self.patcher = patch('abejacli.common.snapshot.FILE_HASH_CACHE_PATH',
+                             os.path.join(self.tmpdir.name, 'hashes.json'))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+    def _key(self, files=()):
+        return self.image_cache.key(BASE_IMAGE, DOCKERFILE, 'inference', files=files)
+
+    def test_key(self):
+        requirements = os.path.join(self.tmpdir.name, 'requirements.txt')
+        with open(requirements, 'w') as f:
+            f.write('numpy\n')
+
+        key = self._key([requirements])
+        self.assertEqual(self._key([requirements]), key)
+        self.assertNotEqual(self._key(), key)
+        self.assertNotEqual(self.image_cache.key(BASE_IMAGE, DOCKERFILE + '\n', 'inference', [requirements]), key)
+        self.assertNotEqual(self.image_cache.key(BASE_IMAGE, DOCKERFILE, 'train', [requirements]), key)
+
+        with open(requirements, 'w') as f:
+            f.write('numpy==1.19.5\n')
+        self.assertNotEqual(self._key([requirements]), key)
+
+    def test_key_depends_on_base_image_content(self):
+        key = self._key()
+        self.client.images.get.return_value.id = 'sha256:updated'
+        self.assertNotEqual(self._key(), key)
+
+    def test_pull_missing_base_image(self):
+        self.client.images.get.side_effect = docker.errors.ImageNotFound('not found')
+        self.client.images.pull.return_value.id = 'sha256:pulled'
+
+        self.image_cache.base_image_id(BASE_IMAGE)
+
+        self.client.images.pull.assert_called_once_with('abeja/all-cpu', tag='19.10')
+
+    def test_find(self):
+        image = MagicMock(id='sha256:built', labels={LOCAL_IMAGE_KEY: 'key'})
+        self.client.images.list.return_value = []
+        self.assertIsNone(self.image_cache.find('key'))
+
+        # found by the label and recorded into the index
+        self.client.images.list.return_value = [image]
+        self.assertEqual(self.image_cache.find('key'), image)
+        self.client.images.list.assert_called_with(filters={'label': '{}=key'.format(LOCAL_IMAGE_KEY)})
+
+        # found by the index
+        self.client.images.list.reset_mock()
+        self.client.images.get.return_value = image
+        self.assertEqual(self.image_cache.find('key'), image)
+        self.client.images.get.assert_called_with('sha256:built')
+        self.client.images.list.assert_not_called()
+
+    def test_find_removed_image(self):
+        self.image_cache.record('key', MagicMock(id='sha256:removed'))
+        self.client.images.get.side_effect = docker.errors.ImageNotFound('not found')
+        self.client.images.list.return_value = []
+
+        self.assertIsNone(self.image_cache.find('key'))
@@ -1,3 +1,4 @@
+import gzip
 import os
 import random
 import tarfile
@@ -13,6 +14,7 @@ from abejacli.fs_utils import (
     TGZFile,
     UploadFileSpec,
     ZIPFile,
+    detect_compressed_file,
     generate_upload_bucket_iter,
     generate_upload_file_iter,
     get_compressed_file
@@ -214,6 +216,11 @@ class GetCompressedFileTest(TestCase):
         self.assertEqual(cf.extension_name, TARFile.extension_name,
                          msg='test_tar_file faild: ext={}'.format(cf.extension_name))
 
+    def test_detect_compressed_file(self):
+        self.assertIsNone(detect_compressed_file(gzip.compress(b'text' * 1000)))
+        self.assertIsNone(detect_compressed_file(b'text' * 1000))
+        self.assertIsNone(detect_compressed_file(b''))
+
     def assertFileExists(self, file_path):
         self.assertTrue(os.path.exists(file_path),
                         msg='File {0} does not exist'.format(file_path))
@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from abejacli.iter_utils import prefetch_iter
+
+
+class PrefetchIterTest(TestCase):
+
+    def test_prefetch_iter(self):
+        self.assertEqual(list(range(100)), list(prefetch_iter(range(100), 3)))
+
+    def test_prefetch_iter_empty(self):
+        self.assertEqual([], list(prefetch_iter([])))
+
+    def test_prefetch_iter_raises_error(self):
+
+        def generate():
+            yield 1
+            raise ValueError('error in producer')
+
+        it = prefetch_iter(generate())
+        self.assertEqual(1, next(it))
+        with self.assertRaises(ValueError):
+            next(it)
+
+    def test_prefetch_iter_stop_consuming(self):
+        it = prefetch_iter(range(100))
+        self.assertEqual(0, next(it))
+        it.close()
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import pytest
+import requests
+import requests_mock
+
+from abejacli.model.batch_request import (
+    UnsupportedInputError,
+    is_batch_input,
+    iter_batch_inputs,
+    latency_summary,
+    read_input_file,
+    run_batch
+)
+
+ENDPOINT = 'http://localhost:8080'
+
+
+def _send(headers, data):
+    res = requests.post(ENDPOINT, headers=headers, data=data)
+    res.raise_for_status()
+    return res
+
+
+class BatchRequestTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.results_file = os.path.join(self.tmpdir.name, 'results.jsonl')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content, mode='w'):
+        path = os.path.join(self.tmpdir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode) as f:
+            f.write(content)
+        return path
+
+    def _read_results(self):
+        with open(self.results_file) as f:
+            return sorted((json.loads(line) for line in f), key=lambda r: r['index'])
+
+    def test_read_input_file(self):
+        headers, data = read_input_file(self._write('input.json', '{"a": 1}'))
+        self.assertEqual(headers, {'Content-Type': 'application/json'})
+        self.assertEqual(json.loads(data), {'a': 1})
+
+        headers, data = read_input_file(self._write('input.png', b'\x89PNG', mode='wb'))
+        self.assertEqual(headers, {'Content-Type': 'image/png'})
+        self.assertEqual(data, b'\x89PNG')
+
+        with self.assertRaises(UnsupportedInputError):
+            read_input_file(self._write('input.txt', 'text'))
+
+    def test_iter_directory(self):
+        input_dir = os.path.join(self.tmpdir.name, 'inputs')
+        self._write('inputs/b.json', '{"b": 1}')
+        self._write('inputs/a.jpg', b'jpeg', mode='wb')
+        self._write('inputs/sub/c.json', '{"c": 1}')
+        self._write('inputs/README.txt', 'ignored')
+
+        self.assertTrue(is_batch_input(input_dir))
+        inputs = list(iter_batch_inputs(input_dir))
+        self.assertEqual([name for name, _, _ in inputs], ['a.jpg', 'b.json', os.path.join('sub', 'c.json')])
+        self.assertEqual(inputs[0][1], {'Content-Type': 'image/jpeg'})
+
+    def test_iter_jsonl(self):
+        path = self._write('inputs.jsonl', '{"a": 1}\n\n{"a": 2}\n')
+
+        self.assertTrue(is_batch_input(path))
+        inputs = list(iter_batch_inputs(path))
+        self.assertEqual([name for name, _, _ in inputs], ['{}:1'.format(path), '{}:3'.format(path)])
+        self.assertEqual([json.loads(data) for _, _, data in inputs], [{'a': 1}, {'a': 2}])
+
+    def test_iter_invalid_jsonl(self):
+        path = self._write('inputs.jsonl', '{"a": 1}\nnot json\n')
+        with self.assertRaises(UnsupportedInputError):
+            list(iter_batch_inputs(path))
+
+    def test_run_batch(self):
+        path = self._write('inputs.jsonl', ''.join('{{"n": {}}}\n'.format(n) for n in range(10)))
+
+        def _callback(request, context):
+            n = request.json()['n']
+            context.status_code = 500 if n == 3 else 200
+            return {'result': n * 2}
+
+        with requests_mock.Mocker() as mock:
+            mock.post(ENDPOINT, json=_callback)
+            summary = run_batch(_send, iter_batch_inputs(path), self.results_file, concurrency=3)
+            self.assertEqual(mock.call_count, 10)
+
+        self.assertEqual(summary['total'], 10)
+        self.assertEqual(summary['succeeded'], 9)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(set(summary['latency_ms']), {'mean', 'p50', 'p90', 'p95', 'p99', 'max'})
+
+        results = self._read_results()
+        self.assertEqual([r['index'] for r in results], list(range(10)))
+        self.assertEqual(results[0]['output'], {'result': 0})
+        self.assertEqual(results[3]['status'], 'failed')
+        self.assertEqual(results[3]['status_code'], 500)
+        self.assertTrue(all(r['latency_ms'] >= 0 for r in results))
+
+
+@pytest.mark.parametrize(
+    'latencies,expected', [
+        ([], {}),
+        ([5.0], {'mean': 5.0, 'p50': 5.0, 'p90': 5.0, 'p95': 5.0, 'p99': 5.0, 'max': 5.0}),
+        (list(range(1, 101)), {'mean': 50.5, 'p50': 50, 'p90': 90, 'p95': 95, 'p99': 99, 'max': 100}),
+    ]
+)
+def test_latency_summary(latencies, expected):
+    assert latency_summary(latencies) == expected
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from abejacli.model.benchmark import LoadResult, latency_histogram, run_load
+
+
+def _response_error(status_code):
+    res = requests.Response()
+    res.status_code = status_code
+    return requests.HTTPError(response=res)
+
+
+class _Server(object):
+
+    def __init__(self, latency=0.0, fail=()):
+        self.latency = latency
+        self.fail = set(fail)
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send(self, item):
+        with self._lock:
+            self.sent.append(item)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if item in self.fail:
+                raise _response_error(500)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def test_closed_loop():
+    server = _Server(latency=0.01, fail=['b'])
+    summary = run_load(server.send, ['a', 'b', 'c'], concurrency=3, requests_num=9)
+
+    assert sorted(server.sent) == ['a'] * 3 + ['b'] * 3 + ['c'] * 3
+    assert server.max_in_flight <= 3
+    assert summary['mode'] == 'closed'
+    assert summary['requests'] == 9
+    assert summary['succeeded'] == 6
+    assert summary['failed'] == 3
+    assert summary['error_rate'] == pytest.approx(1 / 3, abs=1e-4)
+    assert summary['errors'] == {'500': 3}
+    assert summary['latency_ms']['p50'] >= 10
+
+
+def test_closed_loop_with_duration():
+    server = _Server(latency=0.01)
+    started = time.perf_counter()
+    summary = run_load(server.send, ['a'], concurrency=2, duration=0.1)
+
+    assert time.perf_counter() - started < 1
+    assert 0 < summary['requests'] == len(server.sent)
+    assert summary['failed'] == 0
+
+
+def test_open_loop():
+    server = _Server()
+    started = time.perf_counter()
+    summary = run_load(server.send, ['a'], concurrency=2, requests_num=5, rate=50)
+
+    # requests are scheduled every 20 milliseconds
+    assert time.perf_counter() - started >= 0.08
+    assert summary['mode'] == 'open'
+    assert summary['target_rps'] == 50
+    assert summary['requests'] == 5
+
+
+def test_open_loop_bounds_pending_requests():
+    server = _Server(latency=0.02)
+    summary = run_load(server.send, ['a'], concurrency=1, requests_num=6, rate=1000)
+
+    assert summary['requests'] == 6
+    # requests queued behind the slow server are measured from their scheduled time
+    assert summary['latency_ms']['max'] >= 100
+
+
+class _Items(object):
+    """re-iterable items, which count how many times they are iterated"""
+
+    def __init__(self, items):
+        self.items = items
+        self.iterated = 0
+
+    def __iter__(self):
+        self.iterated += 1
+        return iter(self.items)
+
+
+@pytest.mark.parametrize('rate', [None, 1000])
+def test_iterate_items_lazily(rate):
+    server = _Server()
+    items = _Items(['a', 'b'])
+    summary = run_load(server.send, items, requests_num=5, rate=rate)
+
+    assert summary['requests'] == 5
+    assert sorted(server.sent) == ['a', 'a', 'a', 'b', 'b']
+    # once to check they are not empty, and once for each round
+    assert items.iterated == 4
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        run_load(lambda item: None, [], requests_num=1)
+    with pytest.raises(ValueError):
+        run_load(lambda item: None, ['a'])
+
+
+def test_load_result_errors():
+    result = LoadResult()
+    result.record(1.0)
+    result.record(2.0, _response_error(503))
+    result.record(3.0, requests.ConnectionError())
+
+    summary = result.summary(elapsed=1.0)
+    assert summary['errors'] == {'503': 1, 'ConnectionError': 1}
+    assert summary['throughput_rps'] == 3.0
+
+
+def test_latency_histogram():
+    histogram = latency_histogram([0.5, 1, 1.5, 7, 40000], buckets=(1, 2, 10))
+    assert histogram == {'<=1': 2, '<=2': 1, '<=10': 1, '>10': 1}
+    assert list(histogram) == ['<=1', '<=2', '<=10', '>10']
@@ -1,17 +1,18 @@
 import json
+import os
 from unittest.mock import MagicMock, Mock, patch
 
 from pyfakefs.fake_filesystem_unittest import TestCase
 
 from abejacli.docker.commands.run import ModelRunCommand
-from abejacli.model import md5file
 from abejacli.model.docker_handler import (
     BUILT_IMAGE_SUFFIX,
     DOCKERFILE_RUN_LOCAL_TEMPLATE,
-    LOCAL_MODEL_REQUIREMENTS_MD5_KEY,
     LOCAL_MODEL_TYPE_VALUE,
     REQUIREMENTS_TXT,
-    LocalModelHandler
+    WARM_SERVER_KEY,
+    LocalModelHandler,
+    LocalServer
 )
 
 IMAGE = 'abeja/test-model'
@@ -27,76 +28,60 @@ class LocalModelHandlerTest(TestCase):
     def test_generate_run_dockerfile(self, m):
         dockerfile = self.local_model._generate_run_dockerfile(IMAGE, TAG)
         self.assertIn('FROM {}:{}'.format(IMAGE, TAG), dockerfile)
+        self.assertNotIn('requirements.txt', dockerfile)
 
     @patch('abejacli.model.docker_handler.docker')
-    def test_check_rebuild_required_without_requirements_txt(self, m):
-        not_exist_file_path = ''  # os.path.exists returns False with empty string
-        self.local_model.requirements_file = not_exist_file_path
-        self.assertFalse(self.local_model.check_rebuild_required())
-
-    @patch('abejacli.model.docker_handler.docker')
-    def test_check_rebuild_required_without_built_image(self, m):
-        self.local_model._find_built_image = Mock(return_value=None)
-        self.fs.create_file(REQUIREMENTS_TXT, contents='')
-        self.assertTrue(self.local_model.check_rebuild_required())
-
-    @patch('abejacli.model.docker_handler.docker')
-    def test_check_rebuild_required_with_built_image_no_label(self, m):
-        dummy_image = Mock()
-        dummy_image.labels = {}
-        self.local_model._find_built_image = Mock(return_value=dummy_image)
-        self.fs.create_file(REQUIREMENTS_TXT, contents='')
-        self.assertTrue(self.local_model.check_rebuild_required())
-
-    @patch('abejacli.model.docker_handler.docker')
-    def test_check_rebuild_required_with_built_image_different_prev_label(self, m):
-        self.fs.create_file(REQUIREMENTS_TXT, contents='')
-
-        dummy_image = Mock()
-        dummy_image.labels = {
-            LOCAL_MODEL_REQUIREMENTS_MD5_KEY: ''
-        }
-        self.local_model._find_built_image = Mock(return_value=dummy_image)
-        self.assertTrue(self.local_model.check_rebuild_required())
-
-    @patch('abejacli.model.docker_handler.docker')
-    def test_check_rebuild_required_with_built_image_same_prev_label(self, m):
-        self.fs.create_file(REQUIREMENTS_TXT, contents='')
-
-        dummy_image = Mock()
-        dummy_image.labels = {
-            LOCAL_MODEL_REQUIREMENTS_MD5_KEY: md5file(REQUIREMENTS_TXT)
-        }
-        self.local_model._find_built_image = Mock(return_value=dummy_image)
-        self.assertFalse(self.local_model.check_rebuild_required())
+    def test_generate_run_dockerfile_with_requirements_txt(self, m):
+        self.fs.create_file(REQUIREMENTS_TXT, contents='numpy\n')
+        dockerfile = self.local_model._generate_run_dockerfile(IMAGE, TAG)
+        # dependencies are installed before adding source files
+        self.assertLess(dockerfile.index('pip install'), dockerfile.index('ADD . /srv/app'))
+        self.assertIn('COPY requirements.txt', dockerfile)
 
+    @patch('abejacli.model.docker_handler.ImageCache')
     @patch('abejacli.model.docker_handler.docker')
-    def test_build_run_image_without_built_image(self, m):
+    def test_build_run_image_without_built_image(self, m, mock_image_cache):
+        image_cache = mock_image_cache.return_value
+        image_cache.key.return_value = 'key'
+        built_image = Mock()
+        image_cache.find.side_effect = [None, built_image]
         mock_build_image = Mock()
-        self.local_model._find_built_image = Mock(return_value=None)
         self.local_model._build_image = mock_build_image
 
-        self.local_model.build_run_image(IMAGE, TAG, LOCAL_MODEL_TYPE_VALUE)
+        self.assertEqual(self.local_model.build_run_image(IMAGE, TAG, LOCAL_MODEL_TYPE_VALUE), built_image)
 
         expected_image = '{}/{}/{}-{}'.format(
             IMAGE, TAG, LOCAL_MODEL_TYPE_VALUE, BUILT_IMAGE_SUFFIX)
         expected_dockerfile = DOCKERFILE_RUN_LOCAL_TEMPLATE.format(
-            IMAGE='{}:{}'.format(IMAGE, TAG))
+            IMAGE='{}:{}'.format(IMAGE, TAG), INSTALL_REQUIREMENTS='')
+        image_cache.key.assert_called_once_with(
+            '{}:{}'.format(IMAGE, TAG), expected_dockerfile, LOCAL_MODEL_TYPE_VALUE)
         mock_build_image.assert_called_once_with(
-            expected_image, expected_dockerfile, LOCAL_MODEL_TYPE_VALUE, None)
+            expected_image, expected_dockerfile, LOCAL_MODEL_TYPE_VALUE, 'key', None, ())
 
+    @patch('abejacli.model.docker_handler.ImageCache')
     @patch('abejacli.model.docker_handler.docker')
-    def test_build_run_image_with_built_image(self, m):
-        self.local_model._find_built_image = Mock(return_value=Mock())
-
-        self.local_model.check_rebuild_required = Mock(return_value=False)
+    def test_build_run_image_with_built_image(self, m, mock_image_cache):
+        built_image = Mock()
+        mock_image_cache.return_value.find.return_value = built_image
         mock_build_image = Mock()
         self.local_model._build_image = mock_build_image
 
-        self.local_model.build_run_image(IMAGE, TAG)
+        self.assertEqual(self.local_model.build_run_image(IMAGE, TAG), built_image)
 
         mock_build_image.assert_not_called()
 
+    @patch('abejacli.model.docker_handler.ImageCache')
+    @patch('abejacli.model.docker_handler.docker')
+    def test_build_run_image_no_cache(self, m, mock_image_cache):
+        mock_image_cache.return_value.find.return_value = Mock()
+        mock_build_image = Mock()
+        self.local_model._build_image = mock_build_image
+
+        self.local_model.build_run_image(IMAGE, TAG, no_cache=True)
+
+        mock_build_image.assert_called_once()
+
     @patch('abejacli.model.docker_handler.docker')
     def test_create_local_server(self, m):
         port = 50000
@@ -108,6 +93,53 @@ class LocalModelHandlerTest(TestCase):
         self.assertEqual(local_server.endpoint,
                          'http://localhost:{}'.format(port))
 
+    @patch('abejacli.model.docker_handler.docker')
+    def test_create_local_server_keep_warm(self, m):
+        self.fs.create_file('/project/main.py', contents='def handler(): pass')
+        os.chdir('/project')
+        containers = []
+
+        def _run_container(run_command):
+            container = MagicMock(labels=run_command.labels)
+            containers.append(container)
+            return container
+
+        self.local_model.run_container = MagicMock(side_effect=_run_container)
+        self.local_model._client = MagicMock()
+        self.local_model._client.containers.list.side_effect = lambda filters: list(containers)
+
+        def _create(port):
+            command = ModelRunCommand.create(
+                image='dummy', handler='main:handler', device_type='x86_cpu', port=port)
+            return self.local_model.create_local_server(command, keep_warm=True)
+
+        # a warm server is created, and it keeps running
+        local_server = _create(50000)
+        self.assertTrue(local_server.keep_warm)
+        local_server.stop()
+        containers[0].kill.assert_not_called()
+        self.assertEqual(self.local_model.run_container.call_count, 1)
+
+        # the warm server is reused with the port it was created with
+        local_server = _create(50001)
+        self.assertEqual(local_server.endpoint, 'http://localhost:50000')
+        self.assertEqual(self.local_model.run_container.call_count, 1)
+
+        # the warm server is replaced when the source is changed
+        with open('main.py', 'w') as f:
+            f.write('def handler(): return 1')
+        local_server = _create(50002)
+        self.assertEqual(local_server.endpoint, 'http://localhost:50002')
+        self.assertEqual(self.local_model.run_container.call_count, 2)
+        containers[0].kill.assert_called_once_with()
+        self.assertNotEqual(containers[0].labels[WARM_SERVER_KEY], containers[1].labels[WARM_SERVER_KEY])
+
+    @patch('abejacli.model.docker_handler.docker')
+    def test_local_server_stop(self, m):
+        container = MagicMock()
+        LocalServer(container, port=50000).stop()
+        container.kill.assert_called_once_with()
+
     @patch('abejacli.model.docker_handler.docker')
     def test_parser_stream(self, m):
         dummy_logs = [{'test': 'dummy_{}'.format(i)} for i in range(10)]
@@ -1,8 +1,34 @@
+import threading
+import time
 from unittest.mock import Mock
 
+import pytest
+import requests
 import requests_mock
 
-from abejacli.model.local_server_manager import LocalServerManager
+from abejacli.model.local_server_manager import (
+    LocalServerExitedError,
+    LocalServerManager
+)
+
+HEALTH_CHECK_URL = 'http://localhost:8080/health_check'
+
+
+def _local_server(status='running', logs=None):
+    """return a mock local server whose logs are followed until it is stopped"""
+    stopped = threading.Event()
+
+    def _logs(follow=True, stream=True):
+        if logs is not None:
+            yield from logs
+            return
+        stopped.wait()
+
+    local_server = Mock()
+    local_server.status.return_value = status
+    local_server.logs.side_effect = _logs
+    local_server.stop.side_effect = stopped.set
+    return local_server
 
 
 def test_exit_is_called_when_exception_raised():
@@ -26,3 +52,83 @@ def test_send_request_timeout():
 
         assert mock.called
         assert mock.last_request.timeout is None
+
+
+def test_send_request_reuses_session():
+    endpoint = 'http://localhost:8080'
+    mock_local_server = Mock()
+    with requests_mock.Mocker() as mock:
+        mock.post(endpoint, json={})
+        with LocalServerManager(mock_local_server, pool_size=4) as server:
+            session = server.session
+            server.send_request('POST', endpoint)
+            server.send_request('POST', endpoint)
+            assert server.session is session
+            assert session.get_adapter(endpoint)._pool_maxsize == 4
+        assert mock.call_count == 2
+
+
+def test_wait_until_running():
+    with requests_mock.Mocker() as mock:
+        mock.get(HEALTH_CHECK_URL, [
+            {'exc': requests.ConnectionError},
+            {'exc': requests.ConnectionError},
+            {'status_code': 200}
+        ])
+        with LocalServerManager(_local_server()) as server:
+            started = time.monotonic()
+            server.wait_until_running(HEALTH_CHECK_URL)
+            # polls with backoff from 10 milliseconds
+            assert time.monotonic() - started < 0.5
+        assert mock.call_count == 3
+
+
+def test_wait_until_running_with_chatty_logs():
+    consumed = []
+    stopped = threading.Event()
+
+    def _logs(follow=True, stream=True):
+        while not stopped.is_set():
+            consumed.append(b'log')
+            time.sleep(0.001)
+            yield b'log'
+
+    local_server = _local_server()
+    local_server.logs.side_effect = _logs
+    with requests_mock.Mocker() as mock:
+        mock.get(HEALTH_CHECK_URL, [{'status_code': 503}] * 10 + [{'status_code': 200}])
+        with LocalServerManager(local_server) as server:
+            started = time.monotonic()
+            server.wait_until_running(HEALTH_CHECK_URL)
+            # log lines trigger polls at most once per 10 milliseconds without inspecting the container
+            assert time.monotonic() - started >= 0.1
+            assert mock.call_count == 11
+            assert local_server.status.call_count <= 2
+
+            # the log follower stops after the server gets ready
+            time.sleep(0.05)
+            count = len(consumed)
+            time.sleep(0.05)
+            assert len(consumed) == count
+    stopped.set()
+
+
+def test_wait_until_running_container_exited():
+    with requests_mock.Mocker() as mock:
+        mock.get(HEALTH_CHECK_URL, exc=requests.ConnectionError)
+        # the end of logs means the container has exited
+        with LocalServerManager(_local_server(logs=[b'Traceback'])) as server:
+            with pytest.raises(LocalServerExitedError):
+                server.wait_until_running(HEALTH_CHECK_URL)
+
+        with LocalServerManager(_local_server(status='exited')) as server:
+            with pytest.raises(LocalServerExitedError):
+                server.wait_until_running(HEALTH_CHECK_URL)
+
+
+def test_wait_until_running_timeout():
+    with requests_mock.Mocker() as mock:
+        mock.get(HEALTH_CHECK_URL, status_code=503)
+        with LocalServerManager(_local_server()) as server:
+            with pytest.raises(requests.HTTPError):
+                server.wait_until_running(HEALTH_CHECK_URL, timeout=0.1)
@@ -0,0 +1,191 @@
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from abejacli.model.logs import (
+    iter_log_events,
+    iter_log_events_in_parallel,
+    split_time_range
+)
+
+
+def _event(timestamp, message):
+    return {'timestamp': timestamp, 'message': message}
+
+
+class _Pages(object):
+    """stands in for the logs API"""
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.params = []
+
+    def fetch(self, params):
+        self.params.append(dict(params))
+        return self.pages.pop(0)
+
+
+def test_iter_log_events():
+    pages = _Pages([
+        {'events': [_event('t1', 'a'), _event('t2', 'b')], 'next_token': 'token-1'},
+        {'events': [_event('t3', 'c')], 'next_token': 'token-2'},
+        {'events': [], 'next_token': 'token-2'}
+    ])
+
+    events = list(iter_log_events(pages.fetch, {'start_time': 's', 'next_token': None}))
+
+    assert [e['message'] for e in events] == ['a', 'b', 'c']
+    assert [p['next_token'] for p in pages.params] == [None, 'token-1', 'token-2']
+    assert all(p['start_time'] == 's' for p in pages.params)
+
+
+def test_iter_log_events_without_next_token():
+    pages = _Pages([{'events': [_event('t1', 'a')], 'next_token': None}])
+
+    assert list(iter_log_events(pages.fetch, {})) == [_event('t1', 'a')]
+    assert len(pages.params) == 1
+
+
+def test_iter_log_events_through_empty_pages():
+    pages = _Pages([
+        {'events': [_event('t1', 'a')], 'next_token': 'token-1'},
+        {'events': [], 'next_token': 'token-2'},
+        {'events': [_event('t3', 'c')], 'next_token': None}
+    ])
+
+    events = list(iter_log_events(pages.fetch, {'next_token': None}))
+
+    assert [e['message'] for e in events] == ['a', 'c']
+    assert [p['next_token'] for p in pages.params] == [None, 'token-1', 'token-2']
+
+
+def test_iter_log_events_follow():
+    # epoch milliseconds of 2017-01-01T00:00:01.500Z, 00:00:02.500Z, ...
+    t1, t2, t3, t4 = (1483228800000 + i * 1000 + 500 for i in range(1, 5))
+    pages = _Pages([
+        {'events': [_event(t1, 'a'), _event(t2, 'b')], 'next_token': None},
+        # polled from the second of the last event, and events which have been yielded are skipped
+        {'events': [_event(t1, 'a'), _event(t2, 'b'), _event(t2, 'c'), _event(t3, 'd')], 'next_token': None},
+        {'events': [_event(t3, 'd')], 'next_token': None},
+        {'events': [_event(t3, 'd'), _event(t4, 'e')], 'next_token': None}
+    ])
+
+    with patch('abejacli.model.logs.time.sleep') as mock_sleep:
+        events = iter_log_events(pages.fetch, {'start_time': 't0', 'next_token': None}, follow=True, interval=3)
+        messages = [next(events)['message'] for _ in range(5)]
+        events.close()
+
+    assert messages == ['a', 'b', 'c', 'd', 'e']
+    # the next poll is prefetched
+    assert [p['start_time'] for p in pages.params][:4] == [
+        't0', '2017-01-01T00:00:02Z', '2017-01-01T00:00:03Z', '2017-01-01T00:00:03Z']
+    mock_sleep.assert_called_with(3)
+
+
+def test_iter_log_events_follow_with_iso_timestamp():
+    pages = _Pages([
+        {'events': [_event('2017-01-01T09:00:01.500+09:00', 'a')], 'next_token': None},
+        {'events': [_event('2017-01-01T00:00:01Z', 'old'), _event('2017-01-01T09:00:01.500+09:00', 'a'),
+                    _event('2017-01-01T00:00:02Z', 'b')], 'next_token': None}
+    ])
+
+    with patch('abejacli.model.logs.time.sleep'):
+        events = iter_log_events(pages.fetch, {'next_token': None}, follow=True)
+        messages = [next(events)['message'] for _ in range(2)]
+        events.close()
+
+    assert messages == ['a', 'b']
+    assert pages.params[1]['start_time'] == '2017-01-01T00:00:01Z'
+
+
+def test_iter_log_events_follow_with_next_token():
+    pages = _Pages([
+        {'events': [_event('t1', 'a')], 'next_token': 'token-1'},
+        {'events': [], 'next_token': 'token-1'},
+        {'events': [_event('t2', 'b')], 'next_token': 'token-2'}
+    ])
+
+    with patch('abejacli.model.logs.time.sleep'):
+        events = iter_log_events(pages.fetch, {'next_token': None}, follow=True)
+        messages = [next(events)['message'] for _ in range(2)]
+        events.close()
+
+    assert messages == ['a', 'b']
+    assert [p['next_token'] for p in pages.params][:3] == [None, 'token-1', 'token-1']
+
+
+def test_split_time_range():
+    assert split_time_range('2017-01-01T00:00:00Z', '2017-01-02T00:00:00Z', 3) == [
+        ('2017-01-01T00:00:00Z', '2017-01-01T08:00:00Z'),
+        ('2017-01-01T08:00:00Z', '2017-01-01T16:00:00Z'),
+        ('2017-01-01T16:00:00Z', '2017-01-02T00:00:00Z')
+    ]
+    # not split into less than a second
+    assert len(split_time_range('2017-01-01T00:00:00Z', '2017-01-01T00:00:02Z', 10)) == 2
+    with pytest.raises(ValueError):
+        split_time_range('2017-01-01T00:00:00Z', '2017-01-01T00:00:00Z', 2)
+
+
+def test_iter_log_events_in_parallel():
+    def fetch(params):
+        if params['next_token'] is None:
+            # the event at the boundary is included in both sub-ranges
+            events = {
+                '2017-01-01T00:00:00Z': [_event('2017-01-01T00:00:00Z', 'a'), _event('2017-01-01T00:00:05Z', 'b')],
+                '2017-01-01T00:00:05Z': [_event('2017-01-01T00:00:05Z', 'b'), _event('2017-01-01T00:00:07Z', 'c')]
+            }[params['start_time']]
+            return {'events': events, 'next_token': params['start_time']}
+        return {'events': [_event(params['end_time'], 'end')], 'next_token': None}
+
+    events = iter_log_events_in_parallel(
+        fetch, {'start_time': '2017-01-01T00:00:00Z', 'end_time': '2017-01-01T00:00:10Z', 'next_token': None}, 2)
+
+    assert [e['message'] for e in events] == ['a', 'b', 'end', 'c', 'end']
+
+
+def test_iter_log_events_in_parallel_streams_first_range():
+    released = threading.Event()
+    started = []
+
+    def fetch(params):
+        started.append(params['start_time'])
+        if params['start_time'] != '2017-01-01T00:00:00Z':
+            released.wait(5)
+        return {'events': [_event(params['start_time'], params['start_time'])], 'next_token': None}
+
+    events = iter_log_events_in_parallel(
+        fetch, {'start_time': '2017-01-01T00:00:00Z', 'end_time': '2017-01-01T00:00:04Z', 'next_token': None},
+        4, max_workers=2)
+
+    # the first range is yielded while the later ones are still fetched
+    assert next(events)['message'] == '2017-01-01T00:00:00Z'
+    released.set()
+    assert [e['message'] for e in events] == [
+        '2017-01-01T00:00:01Z', '2017-01-01T00:00:02Z', '2017-01-01T00:00:03Z']
+    assert len(started) == 4
+
+
+def test_iter_log_events_in_parallel_bounds_prefetch():
+    pages = []
+
+    def fetch(params):
+        if params['start_time'] == '2017-01-01T00:00:00Z':
+            return {'events': [_event('2017-01-01T00:00:00Z', 'first')], 'next_token': None}
+        token = params['next_token'] or 0
+        pages.append(token)
+        if token >= 10:
+            return {'events': [], 'next_token': None}
+        return {'events': [_event('2017-01-01T00:00:06Z', str(token))], 'next_token': token + 1}
+
+    events = iter_log_events_in_parallel(
+        fetch, {'start_time': '2017-01-01T00:00:00Z', 'end_time': '2017-01-01T00:00:10Z', 'next_token': None},
+        2, prefetch=2)
+
+    assert next(events)['message'] == 'first'
+    time.sleep(0.3)
+    # the later range stops fetching while its buffer is full:
+    # 2 buffered events, 1 event waiting to be buffered and 1 page fetched ahead
+    assert len(pages) <= 4
+    assert [e['message'] for e in events] == [str(i) for i in range(10)]
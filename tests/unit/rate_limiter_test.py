@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from mock import patch
+
+from abejacli.rate_limiter import RateLimiter
+
+
+class RateLimiterTest(TestCase):
+
+    @patch('abejacli.rate_limiter.time')
+    def test_acquire(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        limiter = RateLimiter(10)
+        limiter.acquire()
+        limiter.acquire()
+        limiter.acquire()
+        waits = [c[0][0] for c in m_time.sleep.call_args_list]
+        self.assertEqual(2, len(waits))
+        self.assertAlmostEqual(0.1, waits[0])
+        self.assertAlmostEqual(0.2, waits[1])
+
+    @patch('abejacli.rate_limiter.time')
+    def test_acquire_without_limit(self, m_time):
+        limiter = RateLimiter(None)
+        limiter.acquire()
+        m_time.sleep.assert_not_called()
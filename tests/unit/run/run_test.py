@@ -20,6 +20,7 @@ from abejacli.registry.commands import (
     describe_repository_tags
 )
 from abejacli.run import (
+    _run_batch_requests,
     delete_configuration,
     describe_datalake_buckets,
     describe_datalake_channels,
@@ -743,7 +744,11 @@ class RunTest(TestCase):
             self.assertEqual(req.method, 'POST')
             self.assertRegex(
                 req.headers['Content-Type'], r'^multipart/form-data; boundary=')
-            self.assertRegex(req.body, b'Content-Disposition:')
+            # the archive is streamed as chunked request body
+            body = b''.join(req.body)
+            self.assertEqual(req.headers['Transfer-Encoding'], 'chunked')
+            self.assertNotIn('Content-Length', req.headers)
+            self.assertRegex(body, b'Content-Disposition:')
 
     @requests_mock.Mocker()
     @patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
@@ -1160,3 +1165,89 @@ class RunTest(TestCase):
         mock.register_uri('POST', url, json={"message": "dummy"})
         r = self.runner.invoke(unarchive_training_model, cmd)
         self.assertDictEqual(json.loads(r.output), {"message": "dummy"})
+
+    @patch('abejacli.run.ORGANIZATION_ENDPOINT', TEST_ORGANIZATION_DOMAIN)
+    def test_describe_service_logs_all(self):
+        url = '{}/deployments/1111111111111/services/ser-1111/logs'.format(TEST_ORGANIZATION_DOMAIN)
+        with requests_mock.Mocker() as mock:
+            mock.register_uri('GET', url, [
+                {'json': {'events': [{'message': 'a', 'timestamp': 't1'}], 'next_token': 'token-1'}},
+                {'json': {'events': [{'message': 'b', 'timestamp': 't2'}], 'next_token': None}}
+            ])
+            cmd = [
+                'describe-service-logs',
+                '--deployment_id', '1111111111111',
+                '--service_id', 'ser-1111',
+                '--all'
+            ]
+            r = self.runner.invoke(model, cmd)
+            assert not r.exception
+
+            self.assertEqual(mock.call_count, 2)
+            self.assertEqual(mock.last_request.qs['next_token'], ['token-1'])
+        # events are printed as JSON lines
+        self.assertEqual([json.loads(line)['message'] for line in r.output.splitlines()], ['a', 'b'])
+
+    def test_describe_run_logs_follow_with_end_time(self):
+        cmd = [
+            'describe-run-logs',
+            '--deployment_id', '1111111111111',
+            '--run_id', 'run-1111',
+            '--end_time', '2017-12-31T00:00:00Z',
+            '--follow'
+        ]
+        r = self.runner.invoke(model, cmd)
+        self.assertEqual(r.exit_code, 2)
+        self.assertIn('--follow cannot be used', r.output)
+
+    @patch('abejacli.run.WEB_API_ENDPOINT', 'https://web.example.com')
+    def test_check_endpoint_image_bench(self):
+        url = 'https://web.example.com/deployments/1111111111111/services/ser-1111'
+        with tempfile.TemporaryDirectory() as image_dir, requests_mock.Mocker() as mock:
+            for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+                with open(os.path.join(image_dir, name), 'wb') as f:
+                    f.write(name.encode('utf-8'))
+
+            def _callback(request, context):
+                body = request.body.read()
+                context.status_code = 500 if body == b'b.jpg' else 200
+                return {}
+
+            mock.register_uri('POST', url, json=_callback)
+            cmd = [
+                'check-endpoint-image',
+                '--deployment_id', '1111111111111',
+                '--service_id', 'ser-1111',
+                '--type', 'jpeg',
+                '--image_path', image_dir,
+                '--concurrency', '2'
+            ]
+            r = self.runner.invoke(model, cmd)
+            assert not r.exception
+
+            self.assertEqual(mock.call_count, 3)
+            self.assertEqual(mock.last_request.headers['Content-Type'], 'image/jpeg')
+        summary = json.loads(r.output)
+        self.assertEqual(summary['requests'], 3)
+        self.assertEqual(summary['errors'], {'500': 1})
+        self.assertEqual(sum(summary['latency_histogram_ms'].values()), 3)
+
+    def test_check_endpoint_json_rate_without_requests(self):
+        cmd = [
+            'check-endpoint-json',
+            '--deployment_id', '1111111111111',
+            '--key', 'key',
+            '--value', 'value',
+            '--rate', '10'
+        ]
+        r = self.runner.invoke(model, cmd)
+        self.assertEqual(r.exit_code, 2)
+        self.assertIn('--rate requires --requests or --duration', r.output)
+
+    @patch('abejacli.run.run_batch')
+    def test_run_batch_requests_with_failures(self, mock_run_batch):
+        mock_run_batch.return_value = {'total': 2, 'succeeded': 1, 'failed': 1}
+        with patch('abejacli.run.click.echo') as mock_echo, self.assertRaises(SystemExit) as e:
+            _run_batch_requests(None, 'http://localhost:5000', 'inputs', 'results.jsonl', 2, True)
+        self.assertEqual(e.exception.code, 1)
+        self.assertEqual(json.loads(mock_echo.call_args[0][0]), mock_run_batch.return_value)
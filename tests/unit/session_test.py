@@ -0,0 +1,36 @@
+from email.parser import BytesParser
+from unittest import TestCase
+
+from abejacli.session import (
+    MultipartStreamBody,
+    generate_retry_session,
+    generate_session
+)
+
+
+class MultipartStreamBodyTest(TestCase):
+
+    def test_iter(self):
+        body = MultipartStreamBody([
+            ('source_code', 'archive.tar.gz', [b'x' * 5000, b'x' * 5000], 'application/tar+gzip'),
+            ('parameters', 'params.json', b'{"a": 1}', 'application/json'),
+        ])
+        content = b''.join(body)
+
+        message = BytesParser().parsebytes(
+            'Content-Type: {}\r\n\r\n'.format(body.content_type).encode() + content)
+        fields = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                  for part in message.get_payload()}
+        self.assertEqual(b'x' * 10000, fields['source_code'])
+        self.assertEqual(b'{"a": 1}', fields['parameters'])
+
+        # the body is iterated again to retry the request
+        self.assertEqual(content, b''.join(body))
+
+
+class GenerateSessionTest(TestCase):
+
+    def test_generate_session_without_retry(self):
+        session = generate_session()
+        self.assertEqual(0, session.get_adapter('https://example.com').max_retries.total)
+        self.assertEqual(5, generate_retry_session().get_adapter('https://example.com').max_retries.total)
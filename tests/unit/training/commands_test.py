@@ -9,7 +9,7 @@ from click.testing import CliRunner
 from ruamel.yaml import YAML
 
 import abejacli.training
-from abejacli.config import ORGANIZATION_ENDPOINT
+from abejacli.config import ERROR_EXITCODE, ORGANIZATION_ENDPOINT
 from abejacli.exceptions import ResourceNotFound
 from abejacli.training.commands import (
     _get_latest_training_version,
@@ -22,6 +22,7 @@ from abejacli.training.commands import (
     describe_jobs,
     describe_training_models,
     describe_training_versions,
+    download_jobs_result,
     start_notebook,
     stop_training_job,
     train_local,
@@ -389,7 +390,7 @@ def test_start_notebook(
         })
     ]
 )
-@patch('abejacli.training.commands.version_archive', MagicMock(return_value=None))
+@patch('abejacli.training.commands.SourceArchiveStream', MagicMock(return_value=None))
 @patch('abejacli.training.commands.CONFIG', TEST_CONFIG)
 @patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
 def test_create_training_version(
@@ -418,6 +419,52 @@ def test_create_training_version(
     assert not r.exception
 
 
+@patch('abejacli.training.commands.CONFIG', TEST_CONFIG)
+@patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
+def test_create_training_version_skips_unchanged_source(req_mock, runner, tmp_path):
+    config_data = {
+        'name': 'training-1',
+        'handler': 'train:handler',
+        'image': 'abeja-inc/all-cpu:18.10'
+    }
+    url = "{}/training/definitions/{}/versions".format(
+        ORGANIZATION_ENDPOINT, config_data['name'])
+    version = {'job_definition_version': 1, 'handler': 'train:handler', 'archived': False}
+    req_mock.register_uri('POST', url, json=version)
+    req_mock.register_uri('GET', '{}/1'.format(url), json=version)
+
+    with patch('abejacli.common.snapshot.FILE_HASH_CACHE_PATH', str(tmp_path / 'file_hashes.json')), \
+            patch('abejacli.common.snapshot.SOURCE_SNAPSHOT_INDEX_PATH', str(tmp_path / 'snapshots.json')), \
+            runner.isolated_filesystem():
+        with open(abejacli.training.CONFIGFILE_NAME, 'w') as configfile:
+            yaml.dump(config_data, configfile)
+        with open('train.py', 'w') as f:
+            f.write('dummy')
+
+        r = runner.invoke(create_training_version, [])
+        assert not r.exception
+        assert req_mock.call_count == 1
+
+        # nothing is changed
+        r = runner.invoke(create_training_version, [])
+        assert not r.exception
+        assert req_mock.call_count == 2
+        assert req_mock.request_history[-1].method == 'GET'
+        assert 'skip uploading' in r.output
+
+        # --no-cache always uploads
+        r = runner.invoke(create_training_version, ['--no-cache'])
+        assert not r.exception
+        assert req_mock.request_history[-1].method == 'POST'
+
+        # source code is changed
+        with open('train.py', 'w') as f:
+            f.write('changed')
+        r = runner.invoke(create_training_version, [])
+        assert not r.exception
+        assert req_mock.request_history[-1].method == 'POST'
+
+
 @pytest.mark.parametrize(
     'cmd,config_data,expected_payload',
     [
@@ -453,7 +500,7 @@ def test_create_training_version(
         }),
     ]
 )
-@patch('abejacli.training.commands.version_archive', MagicMock(return_value=None))
+@patch('abejacli.training.commands.SourceArchiveStream', MagicMock(return_value=None))
 @patch('abejacli.training.commands.CONFIG', TEST_CONFIG)
 @patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
 def test_create_training_version_for_2002_image(
@@ -506,7 +553,7 @@ def test_create_training_version_for_2002_image(
             {'name': 'training-2'})
     ]
 )
-@patch('abejacli.training.commands.version_archive', MagicMock(return_value=None))
+@patch('abejacli.training.commands.SourceArchiveStream', MagicMock(return_value=None))
 @patch('abejacli.training.commands.CONFIG', TEST_CONFIG)
 @patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
 def test_create_training_version_for_2002_image_invalid(
@@ -655,7 +702,7 @@ def test_create_training_version_for_2002_image_invalid(
         })
     ]
 )
-@patch('abejacli.training.commands.version_archive', MagicMock(return_value=None))
+@patch('abejacli.training.commands.SourceArchiveStream', MagicMock(return_value=None))
 @patch('abejacli.training.commands.CONFIG', TEST_CONFIG)
 @patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
 def test_create_training_version_from_git(
@@ -1160,6 +1207,50 @@ def test_train_local_environment(mock_train_local, mock_get_organization_id, run
     assert r.exit_code == 0, r.output
     args = mock_train_local.call_args[1]
     assert args['job_definition_name'] == 'training-1'
+    assert args['pull_policy'] == 'always'
+
+    r = runner.invoke(train_local, cmd + ['--pull', 'if-not-present'])
+    assert r.exit_code == 0, r.output
+    assert mock_train_local.call_args[1]['pull_policy'] == 'if-not-present'
+
+
+@patch('abejacli.common.get_organization_id')
+@patch('abejacli.training.CONFIGFILE_NAME', get_tmp_training_file_name())
+@patch('abejacli.training.commands.TrainingJobSweep')
+def test_train_local_sweep(mock_sweep, mock_get_organization_id, runner, req_mock, tmp_path):
+    mock_get_organization_id.return_value = '1122334455667'
+    mock_sweep.return_value.run.return_value = [
+        {'environment': {'LEARNING_RATE': '0.1'}, 'training_job_id': '1', 'status': 'Complete'},
+        {'environment': {'LEARNING_RATE': '0.01'}, 'training_job_id': '2', 'status': 'Failed'}
+    ]
+    with open(abejacli.training.CONFIGFILE_NAME, 'w') as configfile:
+        yaml.dump({'name': 'training-1', 'handler': 'train:handler', 'image': 'abeja-inc/all-cpu:18.10'},
+                  configfile)
+    req_mock.register_uri(
+        'GET', "{}/training/definitions/{}/versions/{}".format(ORGANIZATION_ENDPOINT, 'training-1', 1),
+        json={'job_definition_version': 1, 'image': 'abeja-inc/all-cpu:18.10'})
+    sweep_file = tmp_path / 'sweep.yaml'
+    sweep_file.write_text('LEARNING_RATE: [0.1, 0.01]\n')
+
+    cmd = [
+        '--version', '1',
+        '--sweep', str(sweep_file),
+        '--parallel', '2',
+        '--cpus', '1.5',
+        '--memory', '4g',
+        '--config', abejacli.training.CONFIGFILE_NAME,
+    ]
+    r = runner.invoke(train_local, cmd)
+
+    # one of the jobs failed
+    assert r.exit_code == ERROR_EXITCODE, r.output
+    assert json.loads(r.output) == mock_sweep.return_value.run.return_value
+    args, kwargs = mock_sweep.call_args
+    assert args[0] == [{'LEARNING_RATE': '0.1'}, {'LEARNING_RATE': '0.01'}]
+    assert kwargs['job_definition_name'] == 'training-1'
+    assert kwargs['parallel'] == 2
+    assert kwargs['cpus'] == 1.5
+    assert kwargs['memory'] == '4g'
 
 # Job definitions
 
@@ -1630,3 +1721,27 @@ def test_describe_jobs_include_archived(req_mock, runner):
     cmd = ['-j', test_job_name, '--include-archived']
     r = runner.invoke(describe_jobs, cmd)
     assert not r.exception
+
+
+def test_download_jobs_result(req_mock, runner):
+    url = "{}/training/definitions/{}/jobs/{}/result".format(
+        ORGANIZATION_ENDPOINT, 'job-def-1', '1230000000000')
+    download_uri = 'https://example.com/artifact.zip?signature=1'
+    content = b'artifact' * 100
+    req_mock.register_uri(
+        'GET', url, json={'artifacts': {'complete': {'uri': download_uri}}})
+
+    def serve(request, context):
+        start, end = (int(v) for v in request.headers['Range'][len('bytes='):].split('-'))
+        context.status_code = 206
+        context.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(content))
+        return content[start:end + 1]
+
+    req_mock.register_uri('GET', download_uri, content=serve)
+
+    with runner.isolated_filesystem():
+        r = runner.invoke(download_jobs_result, ['-jd', 'job-def-1', '-j', '1230000000000'])
+        assert not r.exception
+        assert 'Downloaded a file job-def-1_1230000000000_artifact.zip.' in r.output
+        with open('job-def-1_1230000000000_artifact.zip', 'rb') as f:
+            assert f.read() == content
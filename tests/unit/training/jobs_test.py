@@ -1,22 +1,31 @@
+import gzip
+import json
 import os
+import threading
 import time
+import zipfile
 from tempfile import TemporaryDirectory
 
 import pytest
+import requests_mock
 from docker.models.images import Image
 from mock import MagicMock, patch
+from requests.exceptions import HTTPError
 
 from abejacli.config import (
+    ORGANIZATION_ENDPOINT,
     TRAIN_DEBUG_COMMAND_V1,
     TRAIN_DEBUG_COMMAND_V2,
     TRAIN_LOCAL_COMMAND_V1,
     TRAIN_LOCAL_COMMAND_V2
 )
 from abejacli.training.jobs import (
+    LogShipper,
     TrainingJobDebugRun,
     TrainingJobLocalContainerRun,
     truncate_log_line
 )
+from abejacli.training.status_watcher import PollingStatusSource
 
 TEST_CONFIG_USER_ID = '12345'
 TEST_CONFIG_TOKEN = 'ntoken12345'
@@ -81,6 +90,30 @@ def test_truncate_line(given, expected):
     assert actual == expected, 'should be {}, but got {}'.format(expected, actual)
 
 
+@pytest.mark.parametrize(
+    "given",
+    [
+        'x' * (4 * 1024 * 1024),
+        '"\\\n\t' * (1024 * 1024),
+        '日本語abc' * (512 * 1024),
+    ]
+)
+def test_truncate_large_line(given):
+    max_size = 1024 * 1024
+    log_line = {'message': given, 'timestamp': int(time.time() * 1000)}
+    truncated = truncate_log_line(log_line, max_size)
+
+    def _size(message):
+        return len(json.dumps({**log_line, 'message': message}, ensure_ascii=False).encode('utf-8'))
+
+    message = truncated['message']
+    assert message.endswith('...')
+    assert given.startswith(message[:-3])
+    assert _size(message) <= max_size
+    # the longest prefix is kept
+    assert _size(given[:len(message) - 2] + '...') > max_size
+
+
 class TestTrainingJobLocalContainerRun:
     @patch('abejacli.training.jobs.create_local_training_job')
     @patch('abejacli.training.jobs.describe_training_version')
@@ -140,6 +173,25 @@ class TestTrainingJobLocalContainerRun:
         assert len(mock_send_logs.call_args_list[0][0][0]) == 100
         assert len(mock_send_logs.call_args_list[1][0][0]) == 10
 
+    def test_watch_with_shared_shipper_and_poller(self, local_container_run):
+        mock_container = MagicMock()
+        mock_container.logs = MagicMock(return_value=[b'message_0', b'message_1'])
+        local_container_run._get_container = MagicMock(return_value=mock_container)
+        local_container_run.training_job_id = 'job-1'
+        local_container_run.log_shipper = shipper = MagicMock()
+        local_container_run.status_poller = poller = MagicMock()
+
+        local_container_run.watch()
+
+        assert shipper.put.call_args_list == [
+            (('message_0',), {'key': 'job-1'}), (('message_1',), {'key': 'job-1'})]
+        # logs are sent before the job ends, but the shared shipper is kept open
+        shipper.flush.assert_called_once_with()
+        shipper.close.assert_not_called()
+        poller.add.assert_called_once_with(
+            'job-1', local_container_run._get_remote_status, local_container_run._on_remote_stopped)
+        poller.remove.assert_called_once_with('job-1')
+
     def test_watch_flush_logs_at_time_interval(self, local_container_run):
         # FIXME: this is fragile and need to find better way.
         # this is because `freezegun` cannot stop time of `time.monotonic`
@@ -187,6 +239,209 @@ class TestTrainingJobLocalContainerRun:
         log_line = mock_send_logs.call_args_list[0][0][0][0]
         assert '...' in log_line['message'], 'message should be trimmed'
 
+    def test_watch_stop_if_canceled(self, local_container_run):
+        stopped = threading.Event()
+
+        def mock_logs(**kwargs):
+            yield 'message'.encode('utf-8')
+            # container is running until it is stopped
+            stopped.wait(5)
+
+        mock_container = MagicMock()
+        mock_container.logs = mock_logs
+        local_container_run._get_container = MagicMock(
+            return_value=mock_container)
+        local_container_run._send_logs = MagicMock()
+        local_container_run._stop = MagicMock(side_effect=lambda: stopped.set())
+        local_container_run.status_source = PollingStatusSource(
+            MagicMock(side_effect=['Active', 'Stopped']))
+        local_container_run.polling_interval = 0.01
+
+        local_container_run.watch()
+
+        assert stopped.is_set()
+        local_container_run._stop.assert_called_once_with()
+
+    def test_send_logs_compressed(self, local_container_run):
+        local_container_run.platform_auth_token = 'dummy'
+        local_container_run.training_job_id = '1230000000000'
+        local_container_run.log_compress = True
+        logs = [{'message': 'message', 'timestamp': 1566529144938}]
+        url = '{}/training/definitions/{}/jobs/{}/logs'.format(
+            ORGANIZATION_ENDPOINT, TEST_JOB_DEF_NAME, '1230000000000')
+
+        with requests_mock.Mocker() as mock:
+            mock.register_uri('POST', url, json={})
+            local_container_run._send_logs(logs)
+            session = local_container_run._log_session
+            local_container_run._send_logs(logs)
+
+            # the session is kept to reuse the connection
+            assert local_container_run._log_session is session
+            assert mock.call_count == 2
+            req = mock.request_history[0]
+            assert req.headers['Content-Encoding'] == 'gzip'
+            assert req.headers['Authorization'] == 'Bearer dummy'
+            assert json.loads(gzip.decompress(req.body).decode('utf-8')) == {'logs': logs}
+
+    def test_archive_artifact(self, local_container_run, tmpdir):
+        local_container_run.training_job_id = '1230000000000'
+        local_container_run.temporary_archive_dir = TemporaryDirectory(prefix=str(tmpdir) + '/')
+        archive_dir = local_container_run.temporary_archive_dir.name
+        os.makedirs(os.path.join(archive_dir, 'epoch1'))
+        os.makedirs(os.path.join(archive_dir, 'epoch2'))
+        for name, content in [('epoch1/model.pt', b'1'), ('epoch2/model.pt', b'2'), ('log.txt', b'log')]:
+            with open(os.path.join(archive_dir, name), 'wb') as f:
+                f.write(content)
+
+        archive_path = local_container_run._archive_artifact()
+
+        assert not archive_path.startswith(archive_dir)
+        with zipfile.ZipFile(archive_path) as z:
+            assert z.read('1230000000000/epoch1/model.pt') == b'1'
+            assert z.read('1230000000000/epoch2/model.pt') == b'2'
+            assert z.read('1230000000000/log.txt') == b'log'
+            # already compressed files are stored
+            assert z.getinfo('1230000000000/epoch1/model.pt').compress_type == zipfile.ZIP_STORED
+            assert z.getinfo('1230000000000/log.txt').compress_type == zipfile.ZIP_DEFLATED
+
+    def test_archive_artifact_empty(self, local_container_run, tmpdir):
+        local_container_run.training_job_id = '1230000000000'
+        local_container_run.temporary_archive_dir = TemporaryDirectory(prefix=str(tmpdir) + '/')
+
+        assert local_container_run._archive_artifact() is None
+        assert os.listdir(str(tmpdir)) == [os.path.basename(local_container_run.temporary_archive_dir.name)]
+
+    @patch('retrying.time.sleep')
+    def test_upload_artifact_retry(self, mock_sleep, local_container_run, tmpdir):
+        local_container_run.platform_auth_token = 'dummy'
+        local_container_run.training_job_id = '1230000000000'
+        archive_path = str(tmpdir.join('1230000000000.zip'))
+        with open(archive_path, 'wb') as f:
+            f.write(b'zip')
+        local_container_run._archive_artifact = MagicMock(return_value=archive_path)
+        url = '{}/training/definitions/{}/jobs/{}/result'.format(
+            ORGANIZATION_ENDPOINT, TEST_JOB_DEF_NAME, '1230000000000')
+        upload_url = 'https://example.com/upload'
+
+        with requests_mock.Mocker() as mock:
+            mock.register_uri('POST', url, json={'uri': upload_url})
+            mock.register_uri('PUT', upload_url, [{'status_code': 403}, {'status_code': 200}])
+            local_container_run._upload_artifact()
+
+            assert [r.method for r in mock.request_history] == ['POST', 'PUT', 'POST', 'PUT']
+            assert mock.request_history[-1].headers['Content-Length'] == '3'
+        assert not os.path.exists(archive_path)
+
+    @patch('retrying.time.sleep')
+    def test_upload_artifact_keep_archive_on_failure(self, mock_sleep, local_container_run, tmpdir):
+        local_container_run.platform_auth_token = 'dummy'
+        local_container_run.training_job_id = '1230000000000'
+        archive_path = str(tmpdir.join('1230000000000.zip'))
+        with open(archive_path, 'wb') as f:
+            f.write(b'zip')
+        local_container_run._archive_artifact = MagicMock(return_value=archive_path)
+        url = '{}/training/definitions/{}/jobs/{}/result'.format(
+            ORGANIZATION_ENDPOINT, TEST_JOB_DEF_NAME, '1230000000000')
+
+        with requests_mock.Mocker() as mock:
+            mock.register_uri('POST', url, status_code=400)
+            with pytest.raises(HTTPError):
+                local_container_run._upload_artifact()
+        assert os.path.exists(archive_path)
+
+
+class TestLogShipper:
+    @pytest.mark.parametrize('policy', ['spill', 'block'])
+    def test_keep_order_when_sender_falls_behind(self, policy):
+        sent = []
+        released = threading.Event()
+
+        def send(logs):
+            released.wait(5)
+            sent.extend(log['message'] for log in logs)
+
+        shipper = LogShipper(send, max_size=100, flush_interval=float('Inf'),
+                             queue_size=3, overflow_policy=policy).start()
+        lines = ['message_{}'.format(i) for i in range(30)]
+        if policy == 'block':
+            threading.Timer(0.1, released.set).start()
+        for line in lines:
+            shipper.put(line)
+        released.set()
+        shipper.close()
+
+        assert sent == lines
+        assert shipper.dropped == 0
+
+    def test_read_spilled_lines_one_by_one(self):
+        shipper = LogShipper(MagicMock(), queue_size=1, overflow_policy='spill')
+        for i in range(3):
+            shipper.put('message_{}'.format(i))
+
+        assert shipper._next_item(None)[0] == 'message_0'
+        assert shipper._next_item(None)[0] == 'message_1'
+        # the rest of the spill file is read when it's consumed
+        assert shipper._spilled is not None
+        shipper.put('message_3')
+        assert [shipper._next_item(None)[0] for _ in range(2)] == ['message_2', 'message_3']
+        assert shipper._spilled is None
+
+    def test_drop(self):
+        sent = []
+        released = threading.Event()
+
+        def send(logs):
+            released.wait(5)
+            sent.extend(log['message'] for log in logs)
+
+        shipper = LogShipper(send, max_size=100, flush_interval=float('Inf'),
+                             queue_size=3, overflow_policy='drop').start()
+        for i in range(30):
+            shipper.put('message_{}'.format(i))
+        released.set()
+        shipper.close()
+
+        assert shipper.dropped > 0
+        assert len(sent) + shipper.dropped == 30
+        assert sent[0] == 'message_0'
+
+    def test_batch_per_key(self):
+        sent = []
+
+        def send(logs, key=None):
+            sent.append((key, [log['message'] for log in logs]))
+
+        shipper = LogShipper(send, max_size=1000, flush_interval=float('Inf')).start()
+        shipper.put('message_0', key='job-1')
+        shipper.put('message_1', key='job-2')
+        shipper.put('message_2', key='job-1')
+        shipper.flush()
+        assert sorted(sent) == [('job-1', ['message_0', 'message_2']), ('job-2', ['message_1'])]
+
+        shipper.put('message_3')
+        shipper.close()
+        assert sent[-1] == (None, ['message_3'])
+
+    def test_flush_timeout(self):
+        released = threading.Event()
+        shipper = LogShipper(lambda logs: released.wait(5), flush_interval=float('Inf')).start()
+        shipper.put('message_0')
+
+        assert shipper.flush(timeout=0.1) is False
+        released.set()
+        assert shipper.flush(timeout=5) is True
+        shipper.close()
+
+    def test_send_error_does_not_stop_shipping(self):
+        send = MagicMock(side_effect=[Exception('error'), None])
+        shipper = LogShipper(send, max_size=50, flush_interval=float('Inf')).start()
+        shipper.put('message_0')
+        shipper.put('message_1')
+        shipper.close()
+
+        assert send.call_count == 2
+
     def test_prepare_command(self, local_container_run):
         mock_temp_dir = MagicMock(spec_set=TemporaryDirectory())
         mock_temp_dir.name = 'dummy_temp_dir'
@@ -0,0 +1,119 @@
+import threading
+
+from mock import MagicMock, patch
+
+from abejacli.training.status_watcher import (
+    PollingStatusSource,
+    StatusPoller,
+    StatusWatcher
+)
+
+
+class StubStatusSource(object):
+    """stands in for the platform API"""
+
+    def __init__(self, statuses, blocking=False):
+        self.statuses = list(statuses)
+        self.blocking = blocking
+        self.calls = []
+
+    def get_status(self, last_status=None):
+        self.calls.append(last_status)
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return status
+
+
+def _run_watcher(source, **kwargs):
+    callback = MagicMock()
+    waits = []
+    watcher = StatusWatcher(source, ['Stopped'], callback, **kwargs)
+    with patch.object(watcher._stopped, 'wait', side_effect=lambda t: waits.append(t) or False):
+        watcher._run()
+    return watcher, callback, waits
+
+
+def test_backoff_while_status_is_unchanged():
+    source = StubStatusSource(['Active', 'Active', 'Active', 'Active', 'Pending', 'Stopped'])
+    watcher, callback, waits = _run_watcher(source, min_interval=1, max_interval=5)
+
+    callback.assert_called_once_with('Stopped')
+    assert watcher.status == 'Stopped'
+    # reset to min interval when the status changes
+    assert waits == [1, 2, 4, 5, 1]
+
+
+def test_retry_on_error():
+    source = StubStatusSource([Exception('error'), Exception('error'), 'Active', 'Stopped'])
+    watcher, callback, waits = _run_watcher(source, min_interval=1, max_interval=10)
+
+    callback.assert_called_once_with('Stopped')
+    assert waits == [2, 4, 1]
+
+
+def test_blocking_source_is_called_without_wait():
+    source = StubStatusSource(['Pending', 'Active', 'Stopped'], blocking=True)
+    watcher, callback, waits = _run_watcher(source)
+
+    callback.assert_called_once_with('Stopped')
+    assert waits == []
+    # the last status is given to wait for changes
+    assert source.calls == [None, 'Pending', 'Active']
+
+
+def test_stop():
+    called = threading.Event()
+
+    def fetch():
+        called.set()
+        return 'Active'
+
+    callback = MagicMock()
+    watcher = StatusWatcher(PollingStatusSource(fetch), ['Stopped'], callback,
+                            min_interval=60, max_interval=60).start()
+    assert called.wait(5)
+    watcher.stop(timeout=5)
+
+    assert not watcher._thread.is_alive()
+    callback.assert_not_called()
+
+
+def test_status_poller_watches_jobs_in_one_thread():
+    statuses = {'job-1': ['Active', 'Stopped'], 'job-2': ['Active', 'Active', 'Active']}
+    callbacks = {key: MagicMock() for key in statuses}
+    poller = StatusPoller(['Stopped'], interval=1)
+    for key in statuses:
+        poller.add(key, lambda key=key: statuses[key].pop(0), callbacks[key])
+
+    rounds = []
+
+    def _wait(t):
+        rounds.append(t)
+        # stop after 3 rounds
+        return len(rounds) > 3
+
+    with patch.object(poller._stopped, 'wait', side_effect=_wait):
+        poller._run()
+
+    callbacks['job-1'].assert_called_once_with('Stopped')
+    callbacks['job-2'].assert_not_called()
+    # job-1 is not polled after stopped
+    assert statuses == {'job-1': [], 'job-2': []}
+
+
+def test_status_poller_ignores_error_and_removed_job():
+    fetch = MagicMock(side_effect=[Exception('error'), 'Stopped'])
+    callback = MagicMock()
+    poller = StatusPoller(['Stopped'], interval=1)
+    poller.add('job-1', fetch, callback)
+
+    with patch.object(poller._stopped, 'wait', side_effect=[False, False, True]):
+        poller._run()
+    callback.assert_called_once_with('Stopped')
+
+    poller.add('job-2', MagicMock(return_value='Stopped'), callback)
+    poller.remove('job-2')
+    with patch.object(poller._stopped, 'wait', side_effect=[False, True]):
+        poller._run()
+    assert callback.call_count == 1
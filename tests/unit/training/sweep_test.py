@@ -0,0 +1,130 @@
+import pytest
+from mock import MagicMock, patch
+
+from abejacli.docker.container_run import PULL_POLICY_ALWAYS, PULL_POLICY_NEVER
+from abejacli.exceptions import InvalidSweepException
+from abejacli.training.sweep import (
+    TrainingJobSweep,
+    load_sweep,
+    sweep_parallelism
+)
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_load_sweep_grid(tmp_path):
+    path = _write(tmp_path, 'sweep.yaml', 'LEARNING_RATE: [0.1, 0.01]\nBATCH_SIZE: [32, 64]\nEPOCHS: 10\n')
+
+    assert load_sweep(path) == [
+        {'LEARNING_RATE': '0.1', 'BATCH_SIZE': '32', 'EPOCHS': '10'},
+        {'LEARNING_RATE': '0.1', 'BATCH_SIZE': '64', 'EPOCHS': '10'},
+        {'LEARNING_RATE': '0.01', 'BATCH_SIZE': '32', 'EPOCHS': '10'},
+        {'LEARNING_RATE': '0.01', 'BATCH_SIZE': '64', 'EPOCHS': '10'}
+    ]
+
+
+def test_load_sweep_list(tmp_path):
+    path = _write(tmp_path, 'sweep.json', '[{"LEARNING_RATE": 0.1}, {"LEARNING_RATE": 0.01, "BATCH_SIZE": 64}]')
+
+    assert load_sweep(path) == [
+        {'LEARNING_RATE': '0.1'},
+        {'LEARNING_RATE': '0.01', 'BATCH_SIZE': '64'}
+    ]
+
+
+@pytest.mark.parametrize('content', ['', '[]', '[1, 2]', 'value'])
+def test_load_invalid_sweep(tmp_path, content):
+    path = _write(tmp_path, 'sweep.yaml', content)
+
+    with pytest.raises(InvalidSweepException):
+        load_sweep(path)
+
+
+@pytest.mark.parametrize('kwargs,expected', [
+    ({}, 8),
+    ({'parallel': 3}, 3),
+    ({'parallel': 20}, 8),
+    ({'cpus': 1.5}, 2),
+    ({'memory': '3g'}, 2),
+    ({'cpus': 1, 'memory': '1g'}, 4),
+    ({'cpus': 8}, 1),
+    ({'runtime': 'nvidia'}, 1),
+    ({'runtime': 'nvidia', 'parallel': 2}, 2)
+])
+def test_sweep_parallelism(kwargs, expected):
+    host_info = {'NCPU': 4, 'MemTotal': 8 * 1024 ** 3}
+
+    assert sweep_parallelism(8, host_info=host_info, **kwargs) == expected
+
+
+class TestTrainingJobSweep:
+
+    @patch('abejacli.training.sweep.signal')
+    @patch('abejacli.training.sweep.TrainingJobLocalContainerRun')
+    @patch('abejacli.training.sweep.prepare_image')
+    @patch('abejacli.training.sweep.describe_training_version')
+    @patch('abejacli.training.sweep.docker')
+    def test_run(self, mock_docker, mock_describe_version, mock_prepare_image, mock_run_class, mock_signal):
+        mock_describe_version.return_value = {'image': 'abeja-inc/all-cpu:19.10'}
+        client = mock_docker.from_env.return_value
+        client.info.return_value = {'NCPU': 4, 'MemTotal': 8 * 1024 ** 3}
+
+        def _create_run(**kwargs):
+            run = MagicMock()
+            run.__enter__.return_value = run
+            run.training_job_id = 'job-{}'.format(kwargs['environment']['LEARNING_RATE'])
+            if kwargs['environment']['LEARNING_RATE'] == '0.1':
+                run.status = 'Complete'
+            else:
+                run.status = None
+                run.watch.side_effect = RuntimeError('error')
+            return run
+        mock_run_class.side_effect = _create_run
+
+        sweep = TrainingJobSweep(
+            [{'LEARNING_RATE': '0.1'}, {'LEARNING_RATE': '0.01'}],
+            job_definition_name='training-1', job_definition_version=1,
+            environment={'EPOCHS': '10', 'LEARNING_RATE': '1'}, parallel=2,
+            organization_id='1234567890123')
+        results = sweep.run()
+
+        assert results == [
+            {'environment': {'LEARNING_RATE': '0.1'}, 'training_job_id': 'job-0.1', 'status': 'Complete'},
+            {'environment': {'LEARNING_RATE': '0.01'}, 'training_job_id': 'job-0.01', 'status': 'Failed'}
+        ]
+        # the image is pulled once for all jobs
+        mock_prepare_image.assert_called_once_with(
+            client, client.api, 'abeja/all-cpu:19.10', PULL_POLICY_ALWAYS, sweep.logger)
+        assert mock_run_class.call_count == 2
+        kwargs = mock_run_class.call_args_list[0][1]
+        assert kwargs['environment'] == {'EPOCHS': '10', 'LEARNING_RATE': '0.1'}
+        assert kwargs['pull_policy'] == PULL_POLICY_NEVER
+        assert kwargs['organization_id'] == '1234567890123'
+        # the log shipper and the status poller are shared
+        assert kwargs['log_shipper'] is mock_run_class.call_args_list[1][1]['log_shipper']
+        assert kwargs['status_poller'] is mock_run_class.call_args_list[1][1]['status_poller']
+
+    def test_skip_queued_jobs_on_interruption(self):
+        sweep = TrainingJobSweep([{}, {}], job_definition_name='training-1', job_definition_version=1)
+        run = MagicMock(training_job_id='job-1')
+        sweep.runs = [run]
+
+        with pytest.raises(SystemExit):
+            sweep._signal_handler(None, None)
+
+        run._clean.assert_called_once_with()
+        assert sweep._run_job(run) == 'Stopped'
+        run.__enter__.assert_not_called()
+
+    def test_send_logs(self):
+        sweep = TrainingJobSweep([{}], job_definition_name='training-1', job_definition_version=1)
+        sweep.runs = [MagicMock(training_job_id='job-1'), MagicMock(training_job_id='job-2')]
+
+        sweep._send_logs([{'message': 'message'}], 'job-2')
+
+        sweep.runs[0]._send_logs.assert_not_called()
+        sweep.runs[1]._send_logs.assert_called_once_with([{'message': 'message'}])